@@ -0,0 +1,149 @@
+# admission.py
+import os
+import json
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from deadlines import remaining
+from metrics import Counter, Gauge, Histogram, LAG_BUCKETS
+
+# path prefix = concurrent/queued; routes not listed (health, coins, metrics, ...) are never queued
+ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "/optimize=4/16,/recommend/sweep=1/2,/recommend=4/16")
+ADMISSION_MAX_WAIT_S = float(os.getenv("ADMISSION_MAX_WAIT_S", "5"))   # longest queue wait (also capped by the deadline)
+
+ADMITTED = Counter("admission_admitted", "Requests admitted to a limited route pool", ("pool",))
+REJECTED = Counter("admission_rejected", "Requests shed by admission control, by pool and reason (queue_full|timeout)",
+                   ("pool", "reason"))
+INFLIGHT = Gauge("admission_inflight", "Requests running in a limited route pool", ("pool",))
+QUEUED = Gauge("admission_queued", "Requests waiting for a slot in a limited route pool", ("pool",))
+WAIT_SECONDS = Histogram("admission_wait_seconds", "Time admitted requests queued for a slot", ("pool",), buckets=LAG_BUCKETS)
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+# ============================================================
+# Route pool: `limit` requests run, up to `queue` wait in FIFO order,
+# anyone beyond that is turned away at once. Retry-After comes from a
+# moving average of how long admitted requests held their slot.
+# ============================================================
+class RoutePool:
+    def __init__(self, name: str, limit: int, queue: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue = max(0, queue)
+        self.active = 0
+        self.service_s = 0.5
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._inflight = INFLIGHT.labels(name)
+        self._queued = QUEUED.labels(name)
+        self._wait = WAIT_SECONDS.labels(name)
+        self._admitted = ADMITTED.labels(name)
+
+    def _waiting(self) -> int:
+        return sum(1 for f in self._waiters if not f.done())
+
+    def retry_after(self) -> float:
+        return (self._waiting() + 1) * self.service_s / self.limit
+
+    async def acquire(self, max_wait: float):
+        if self.active < self.limit and not self._waiting():
+            self.active += 1
+            self._inflight.set(self.active)
+            self._admitted.inc()
+            self._wait.observe(0.0)
+            return
+        if self._waiting() >= self.queue or max_wait <= 0:
+            REJECTED.labels(self.name, "queue_full").inc()
+            raise Rejected("queue_full", self.retry_after())
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self._queued.set(self._waiting())
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(fut, max_wait)
+        except asyncio.TimeoutError:
+            REJECTED.labels(self.name, "timeout").inc()
+            raise Rejected("timeout", self.retry_after()) from None
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release(None)     # handed a slot while being cancelled: pass it on
+            raise
+        finally:
+            self._queued.set(self._waiting())
+        self._wait.observe(time.monotonic() - t0)
+
+    def release(self, held_s: Optional[float]):
+        self.active -= 1
+        if held_s is not None:
+            self.service_s += 0.2 * (held_s - self.service_s)
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.active += 1
+                self._admitted.inc()
+                fut.set_result(None)
+                break
+        self._inflight.set(self.active)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "queue": self.queue, "active": self.active, "queued": self._waiting(),
+                "avgServiceMs": round(self.service_s * 1000.0, 1)}
+
+def _parse_pools(spec: str) -> Tuple[Tuple[str, RoutePool], ...]:
+    out = []
+    for part in spec.split(","):
+        prefix, _, value = part.strip().partition("=")
+        if not prefix or not value:
+            continue
+        limit, _, queue = value.partition("/")
+        out.append((prefix.strip(), RoutePool(prefix.strip(), int(limit), int(queue) if queue else 4 * int(limit))))
+    # longest prefix first: "/recommend/sweep" wins over "/recommend"
+    return tuple(sorted(out, key=lambda r: len(r[0]), reverse=True))
+
+_POOLS = _parse_pools(ADMISSION_LIMITS)
+
+def pool_for(path: str) -> Optional[RoutePool]:
+    for prefix, pool in _POOLS:
+        if path.startswith(prefix):
+            return pool
+    return None
+
+def pools() -> Dict[str, Dict[str, Any]]:
+    return {pool.name: pool.snapshot() for _, pool in _POOLS}
+
+# ============================================================
+# ASGI middleware
+#   Sits inside DeadlineMiddleware: a queued request never waits past
+#   its deadline, and one whose client disconnects leaves the queue.
+#   Rejections are plain 503s with Retry-After, sent before any work.
+# ============================================================
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        pool = pool_for(scope["path"]) if scope["type"] == "http" else None
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await pool.acquire(min(ADMISSION_MAX_WAIT_S, remaining()))
+        except Rejected as e:
+            body = json.dumps({"detail": f"Server busy ({pool.name}: {e.reason.replace('_', ' ')}); retry shortly"}).encode("utf-8")
+            await send({"type": "http.response.start", "status": 503,
+                        "headers": [(b"content-type", b"application/json"),
+                                    (b"content-length", str(len(body)).encode("latin-1")),
+                                    (b"retry-after", str(max(1, math.ceil(e.retry_after))).encode("latin-1"))]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        t0 = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release(time.monotonic() - t0)
@@ -0,0 +1,368 @@
+# benchmarks/loadtest.py
+"""
+HTTP load test of the API against the local upstream stand-in.
+
+    python -m benchmarks.loadtest --spawn                            # start stand-in + app, sweep 1/8/32
+    python -m benchmarks.loadtest --spawn --workers 4 --concurrency 64 --duration 60 --label 4w
+    python -m benchmarks.loadtest --target http://127.0.0.1:8000 --standin http://127.0.0.1:8099
+    python -m benchmarks.loadtest --mix "recommend=4,lp=2,health=1" --standin-config faults.json
+    python -m benchmarks.loadtest --compare results/a.json results/b.json
+
+Run from ai-agents/. Closed loop: `concurrency` clients each send the next
+request as soon as the previous one returns, route picked from --mix. Per
+concurrency level and route: RPS, p50/p95/p99, error rate and status codes;
+per level: upstream calls by stand-in route (prices/pools/chart/chat) and
+upstream calls per API request.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from benchmarks.common import RESULTS_DIR, git_rev
+from benchmarks.standin import app_env
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = "health=1,coin=2,history=2,optimize=1,recommend=3,lp=3"
+
+# ============================================================
+# Request mix
+#   Each route builds one request from a small fixed parameter set so
+#   that caches see a realistic mix of repeated and distinct keys.
+# ============================================================
+COINS = ["bitcoin", "ethereum", "avalanche-2", "usd-coin"]
+HISTORY_DAYS = [7, 30, 90, 120]
+RISKS = ["conservative", "moderate", "aggressive"]
+HORIZONS = [3, 6, 9, 12]
+AMOUNTS = [1, 10, 100, 1000]
+LP_QUERIES = ["USDC", "WAVAX", "WAVAX-USDC", "USDT", "BTC.B", "SAVAX", "JOE", "WETH"]
+
+def _req_health(rnd: random.Random) -> Tuple[str, str, Optional[Dict[str, Any]]]:
+    return "GET", "/health", None
+
+def _req_coin(rnd: random.Random):
+    return "GET", f"/coins/{rnd.choice(COINS)}", None
+
+def _req_history(rnd: random.Random):
+    return "GET", f"/coins/{rnd.choice(COINS)}/history?days={rnd.choice(HISTORY_DAYS)}", None
+
+def _req_optimize(rnd: random.Random):
+    return "POST", "/optimize", {
+        "coin_id": rnd.choice(COINS[:3]),
+        "risk_profile": rnd.choice(RISKS),
+        "maturity_months": rnd.choice(HORIZONS),
+    }
+
+def _req_recommend(rnd: random.Random):
+    return "GET", (f"/recommend?amountAvax={rnd.choice(AMOUNTS)}&horizonMonths={rnd.choice(HORIZONS)}"
+                   f"&riskTolerance={rnd.choice(RISKS)}&includeNarrative=false"), None
+
+def _req_recommend_narrative(rnd: random.Random):
+    method, path, body = _req_recommend(rnd)
+    return method, path.replace("includeNarrative=false", "includeNarrative=true"), body
+
+def _req_lp(rnd: random.Random):
+    return "GET", f"/llama/lp?query={rnd.choice(LP_QUERIES)}", None
+
+ROUTES = {
+    "health": _req_health,
+    "coin": _req_coin,
+    "history": _req_history,
+    "optimize": _req_optimize,
+    "recommend": _req_recommend,
+    "recommend_narrative": _req_recommend_narrative,
+    "lp": _req_lp,
+}
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix: Dict[str, float] = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, w = part.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"unknown route '{name}' (expected one of {', '.join(ROUTES)})")
+        mix[name] = float(w) if w.strip() else 1.0
+        if mix[name] < 0:
+            raise ValueError(f"negative weight for '{name}'")
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("empty request mix")
+    return mix
+
+# ============================================================
+# Closed-loop driver
+# ============================================================
+class Sample:
+    __slots__ = ("route", "status", "latency_s")
+
+    def __init__(self, route: str, status: int, latency_s: float):
+        self.route = route
+        self.status = status        # 0 = transport error / timeout
+        self.latency_s = latency_s
+
+async def _client_loop(client: httpx.AsyncClient, mix: Dict[str, float], rnd: random.Random,
+                       stop_at: float, out: List[Sample], budget: Optional[List[int]]):
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < stop_at:
+        if budget is not None:
+            if budget[0] <= 0:
+                return
+            budget[0] -= 1
+        route = rnd.choices(names, weights)[0]
+        method, path, body = ROUTES[route](rnd)
+        t0 = time.perf_counter()
+        try:
+            resp = await client.request(method, path, json=body)
+            await resp.aread()
+            status = resp.status_code
+        except httpx.HTTPError:
+            status = 0
+        out.append(Sample(route, status, time.perf_counter() - t0))
+
+async def drive(target: str, mix: Dict[str, float], concurrency: int, duration: float,
+                requests: Optional[int], timeout: float, seed: int) -> Tuple[List[Sample], float]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    samples: List[Sample] = []
+    budget = [requests] if requests else None
+    async with httpx.AsyncClient(base_url=target, timeout=timeout, limits=limits) as client:
+        t0 = time.perf_counter()
+        stop_at = t0 + (duration if not requests else 1e9)
+        await asyncio.gather(*(
+            _client_loop(client, mix, random.Random(seed * 1000 + i), stop_at, samples, budget)
+            for i in range(concurrency)
+        ))
+        return samples, time.perf_counter() - t0
+
+def _route_row(samples: List[Sample], wall_s: float) -> Dict[str, Any]:
+    ms = np.asarray([s.latency_s for s in samples], dtype=float) * 1000.0
+    statuses = Counter(s.status for s in samples)
+    errors = sum(n for st, n in statuses.items() if st == 0 or st >= 500)
+    return {
+        "requests": int(ms.size),
+        "rps": round(ms.size / wall_s, 2) if wall_s > 0 else None,
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "error_rate": round(errors / ms.size, 4),
+        "client_error_rate": round(sum(n for st, n in statuses.items() if 400 <= st < 500) / ms.size, 4),
+        "by_status": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+def summarize(samples: List[Sample], wall_s: float, concurrency: int) -> List[Dict[str, Any]]:
+    by_route: Dict[str, List[Sample]] = {}
+    for s in samples:
+        by_route.setdefault(s.route, []).append(s)
+    rows = [{"concurrency": concurrency, "route": r, **_route_row(v, wall_s)} for r, v in sorted(by_route.items())]
+    if samples:
+        rows.append({"concurrency": concurrency, "route": "ALL", **_route_row(samples, wall_s)})
+    return rows
+
+# ============================================================
+# Stand-in admin + spawned processes
+# ============================================================
+async def _standin(standin: Optional[str], method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Any:
+    if not standin:
+        return None
+    async with httpx.AsyncClient(base_url=standin, timeout=10.0) as client:
+        resp = await client.request(method, path, json=body)
+        resp.raise_for_status()
+        return resp.json()
+
+def _upstream_row(stats: Optional[Dict[str, Any]], api_requests: int, concurrency: int) -> Optional[Dict[str, Any]]:
+    if stats is None:
+        return None
+    routes = {r: {"calls": v["calls"], "by_status": v["byStatus"], "mean_ms": v["meanMs"]}
+              for r, v in sorted(stats["routes"].items())}
+    return {
+        "concurrency": concurrency,
+        "total": stats["total"],
+        "per_request": round(stats["total"] / api_requests, 4) if api_requests else None,
+        "routes": routes,
+    }
+
+def _wait_http(url: str, timeout_s: float, ok=lambda r: r.status_code == 200, proc: Optional[subprocess.Popen] = None):
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"process for {url} exited with code {proc.returncode}")
+        try:
+            r = httpx.get(url, timeout=2.0)
+            if ok(r):
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"timed out waiting for {url}")
+
+def spawn(args: argparse.Namespace) -> Tuple[List[subprocess.Popen], str, str]:
+    """Start the stand-in and the app (uvicorn main:app) on local ports; returns (procs, target, standin)."""
+    standin = f"http://127.0.0.1:{args.standin_port}"
+    target = f"http://127.0.0.1:{args.app_port}"
+    procs: List[subprocess.Popen] = []
+    try:
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.standin", "--port", str(args.standin_port),
+             "--pools", str(args.pools), "--seed", str(args.seed)],
+            cwd=APP_DIR,
+        ))
+        _wait_http(f"{standin}/__standin/config", 60, proc=procs[-1])
+        env = {**os.environ, **app_env(standin)}
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=APP_DIR, env=env,
+        ))
+        # /optimize needs the startup model; wait for it rather than measuring 503s
+        _wait_http(f"{target}/health", args.startup_timeout,
+                   ok=lambda r: r.status_code == 200 and r.json().get("model_ready"), proc=procs[-1])
+    except Exception:
+        _stop(procs)
+        raise
+    return procs, target, standin
+
+def _stop(procs: List[subprocess.Popen]):
+    for p in reversed(procs):
+        if p.poll() is None:
+            p.terminate()
+            try:
+                p.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+# ============================================================
+# Run + results files
+# ============================================================
+def _print_level(rows: List[Dict[str, Any]], upstream: Optional[Dict[str, Any]]):
+    for r in rows:
+        print(f"  {r['route']:<20} {r['requests']:>7} req {r['rps']:>9.1f} rps  p50 {r['p50_ms']:>8.1f}"
+              f"  p95 {r['p95_ms']:>8.1f}  p99 {r['p99_ms']:>8.1f} ms  err {r['error_rate'] * 100:>5.1f}%", flush=True)
+    if upstream is not None:
+        per = ", ".join(f"{k}={v['calls']}" for k, v in upstream["routes"].items()) or "none"
+        print(f"  upstream calls: {upstream['total']} ({per}); {upstream['per_request']} per request", flush=True)
+
+async def run(args: argparse.Namespace, target: str, standin: Optional[str]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    mix = parse_mix(args.mix)
+    if args.standin_config:
+        with open(args.standin_config) as fh:
+            await _standin(standin, "POST", "/__standin/config", json.load(fh))
+    results: List[Dict[str, Any]] = []
+    upstream: List[Dict[str, Any]] = []
+    for c in [int(s) for s in args.concurrency.split(",") if s.strip()]:
+        print(f"[load] concurrency {c}", flush=True)
+        if args.warmup > 0:
+            await drive(target, mix, c, args.warmup, None, args.timeout, args.seed + 1)
+        await _standin(standin, "POST", "/__standin/reset")
+        samples, wall = await drive(target, mix, c, args.duration, args.requests, args.timeout, args.seed)
+        rows = summarize(samples, wall, c)
+        up = _upstream_row(await _standin(standin, "GET", "/__standin/stats"), len(samples), c)
+        _print_level(rows, up)
+        results += rows
+        if up is not None:
+            upstream.append(up)
+    return results, upstream
+
+def _save(results: List[Dict[str, Any]], upstream: List[Dict[str, Any]], args: argparse.Namespace) -> str:
+    os.makedirs(args.out, exist_ok=True)
+    ts = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    name = f"loadtest-{ts}" + (f"-{args.label}" if args.label else "") + ".json"
+    path = os.path.join(args.out, name)
+    meta = {
+        "timestamp": ts, "label": args.label, "git": git_rev(), "python": platform.python_version(),
+        "platform": platform.platform(), "cpus": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+    }
+    with open(path, "w") as fh:
+        json.dump({"meta": meta, "results": results, "upstream": upstream}, fh, indent=2)
+    return path
+
+def compare(path_a: str, path_b: str):
+    """Per (concurrency, route): B vs A for RPS, p50/p95/p99 and error rate, then upstream calls per request."""
+    def load(p: str):
+        with open(p) as fh:
+            data = json.load(fh)
+        return (data["meta"], {(r["concurrency"], r["route"]): r for r in data["results"]},
+                {u["concurrency"]: u for u in data.get("upstream", [])})
+
+    meta_a, a, ua = load(path_a)
+    meta_b, b, ub = load(path_b)
+    print(f"A: {path_a} ({meta_a.get('label') or '-'} @ {meta_a.get('git') or '?'})")
+    print(f"B: {path_b} ({meta_b.get('label') or '-'} @ {meta_b.get('git') or '?'})")
+    print(f"{'conc':>5} {'route':<20} {'rps A':>9} {'rps B':>9} {'Δrps':>8} {'Δp50':>8} {'Δp95':>8} {'Δp99':>8} {'err A':>7} {'err B':>7}")
+
+    def pct(x, y):
+        return f"{(y - x) / x * 100.0:+7.1f}%" if x and y is not None else "       -"
+
+    for key in sorted(set(a) | set(b), key=lambda k: (k[0], k[1] == "ALL", k[1])):
+        ra, rb = a.get(key), b.get(key)
+        if ra is None or rb is None:
+            print(f"{key[0]:>5} {key[1]:<20} {'only in ' + ('B' if ra is None else 'A'):>19}")
+            continue
+        print(f"{key[0]:>5} {key[1]:<20} {ra['rps']:>9.1f} {rb['rps']:>9.1f} {pct(ra['rps'], rb['rps'])} "
+              f"{pct(ra['p50_ms'], rb['p50_ms'])} {pct(ra['p95_ms'], rb['p95_ms'])} {pct(ra['p99_ms'], rb['p99_ms'])} "
+              f"{ra['error_rate'] * 100:>6.1f}% {rb['error_rate'] * 100:>6.1f}%")
+    for c in sorted(set(ua) & set(ub)):
+        print(f"{c:>5} {'upstream/request':<20} {ua[c]['per_request'] or 0:>9.3f} {ub[c]['per_request'] or 0:>9.3f} "
+              f"{pct(ua[c]['per_request'], ub[c]['per_request'])}")
+
+# ============================================================
+# CLI
+# ============================================================
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--target", default="http://127.0.0.1:8000", help="API base URL (ignored with --spawn)")
+    ap.add_argument("--standin", default="", help="stand-in base URL for upstream call counts (optional)")
+    ap.add_argument("--spawn", action="store_true", help="start the stand-in and the app as subprocesses")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn workers (--spawn)")
+    ap.add_argument("--app-port", type=int, default=8765)
+    ap.add_argument("--standin-port", type=int, default=8099)
+    ap.add_argument("--pools", type=int, default=20000, help="stand-in /pools universe size (--spawn)")
+    ap.add_argument("--startup-timeout", type=float, default=180.0)
+    ap.add_argument("--standin-config", help="fault-injection JSON posted to /__standin/config before the run")
+    ap.add_argument("--concurrency", default="1,8,32", help="comma-separated levels, run in order")
+    ap.add_argument("--duration", type=float, default=20.0, help="measured seconds per level")
+    ap.add_argument("--requests", type=int, default=0, help="fixed request count per level (overrides --duration)")
+    ap.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before each level")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help=f"route=weight,... from {', '.join(ROUTES)}")
+    ap.add_argument("--timeout", type=float, default=30.0, help="per-request client timeout (s)")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--label", default="", help="suffix for the results file")
+    ap.add_argument("--out", default=RESULTS_DIR)
+    ap.add_argument("--compare", nargs=2, metavar=("A.json", "B.json"))
+    args = ap.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        ap.error(str(e))
+
+    procs: List[subprocess.Popen] = []
+    target, standin = args.target.rstrip("/"), (args.standin.rstrip("/") or None)
+    if args.spawn:
+        print("[load] starting stand-in and app", flush=True)
+        procs, target, standin = spawn(args)
+    try:
+        results, upstream = asyncio.run(run(args, target, standin))
+    finally:
+        _stop(procs)
+    print(f"[load] saved {_save(results, upstream, args)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
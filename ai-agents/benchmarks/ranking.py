@@ -0,0 +1,227 @@
+# benchmarks/ranking.py
+"""
+Offline benchmark of the /recommend ranking pipeline on synthetic universes.
+
+    python -m benchmarks.ranking                          # 1k/10k/100k, saves results/ranking-<ts>.json
+    python -m benchmarks.ranking --sizes 10000 --repeat 5 --label topsis-tweak
+    python -m benchmarks.ranking --compare results/a.json results/b.json
+
+Run from ai-agents/. No network access: pools come from benchmarks.synthetic
+and the ranking functions are called directly (no HTTP, prices or LLM).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import defillama as dl
+from benchmarks.common import RESULTS_DIR, git_rev
+from benchmarks.synthetic import make_universe
+from records import PoolRecord
+from universe import PoolSnapshot, diff_snapshots
+
+HORIZONS = [3, 6, 9, 12]    # the horizons /recommend documents
+RISKS = list(dl.RISK_PRESETS)
+
+# ============================================================
+# Measurement helpers
+# ============================================================
+def _summary(lat_s: List[float], items: int = 1) -> Dict[str, Any]:
+    ms = np.asarray(lat_s, dtype=float) * 1000.0
+    total = float(np.sum(lat_s))
+    return {
+        "runs": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "ops_per_s": round(ms.size / total, 2) if total > 0 else None,
+        "items_per_s": round(ms.size * items / total, 1) if total > 0 else None,
+    }
+
+def _peak_mb(fn: Callable[[], Any]) -> float:
+    """Peak traced allocation while running fn once (separate pass: tracing skews timings)."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    try:
+        fn()
+        return round((tracemalloc.get_traced_memory()[1] - base) / 2**20, 3)
+    finally:
+        tracemalloc.stop()
+
+def _timed(fn: Callable[[], Any], repeat: int) -> List[float]:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+def _run(coro_fn: Callable[[], Any]) -> Any:
+    return asyncio.get_event_loop().run_until_complete(coro_fn())
+
+# ============================================================
+# One universe size
+# ============================================================
+def bench_size(n: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    chains = [c.strip().lower() for c in args.chains.split(",") if c.strip()]
+    raw = make_universe(n, seed=args.seed)
+
+    def add(stage: str, lat: List[float], items: int = 1, peak: Optional[float] = None, **extra):
+        row = {"size": n, "stage": stage, **_summary(lat, items), "peak_mb": peak, **extra}
+        rows.append(row)
+        print(f"  {stage:<24} p50 {row['p50_ms']:>9.2f} ms  p95 {row['p95_ms']:>9.2f} ms"
+              f"  {row['ops_per_s'] or 0:>9.1f} ops/s  peak {peak if peak is not None else '-':>8} MB", flush=True)
+
+    # -------- snapshot build (records + columns + search index) --------
+    def build() -> PoolSnapshot:
+        return PoolSnapshot([PoolRecord.from_dict(p) for p in raw], 1)
+    lat = _timed(build, max(1, min(args.repeat, 3)))
+    tracemalloc.start()
+    snap = build()
+    retained = round(tracemalloc.get_traced_memory()[0] / 2**20, 3)
+    tracemalloc.stop()
+    add("snapshot_build", lat, n, _peak_mb(build), retained_mb=retained)
+
+    # -------- stage micro-benchmarks on the full (uncapped) primary-chain slice --------
+    chain = chains[0]
+    chain_rows = snap.select(chain)
+    chain_pools = snap.columns.take(snap.columns.by_tvl(chain_rows))
+    deduped = dl._dedupe_by_project_symbol(chain_pools)
+    add("dedupe_by_project_symbol", _timed(lambda: dl._dedupe_by_project_symbol(chain_pools), args.repeat),
+        len(chain_pools), _peak_mb(lambda: dl._dedupe_by_project_symbol(chain_pools)), rows_in=len(chain_pools))
+
+    def score_all(risk: str, h: int) -> List[Dict[str, Any]]:
+        return [s for s in (dl._score_pool(p, args.amount, h, risk, chain) for p in deduped) if s]
+
+    lat, peak = [], None
+    for risk in RISKS:
+        for h in HORIZONS:
+            lat += _timed(lambda: score_all(risk, h), args.repeat)
+    peak = _peak_mb(lambda: score_all(RISKS[0], HORIZONS[0]))
+    add("score_pool", lat, len(deduped), peak, rows_in=len(deduped))
+
+    scored = {risk: score_all(risk, 6) for risk in RISKS}
+    lat = []
+    for risk in RISKS:
+        lat += _timed(lambda: dl._topsis_rank(scored[risk], risk), args.repeat)
+    add("topsis_rank", lat, len(scored[RISKS[0]]), _peak_mb(lambda: dl._topsis_rank(scored[RISKS[0]], RISKS[0])),
+        rows_in=len(scored[RISKS[0]]))
+
+    lat = []
+    for risk in RISKS:
+        for h in HORIZONS:
+            lat += _timed(lambda: dl._rank_topN(deduped, args.amount, h, risk, args.top_n, chain), args.repeat)
+    add("rank_topN", lat, len(deduped),
+        _peak_mb(lambda: dl._rank_topN(deduped, args.amount, 6, RISKS[0], args.top_n, chain)), rows_in=len(deduped))
+
+    # -------- end-to-end /recommend ranking (every risk x horizon) --------
+    def recommend(risk: str, h: int):
+        return _run(lambda: dl._rank_universe(snap, chains, None, args.limit_fetch, args.amount, h, risk, args.top_n))
+
+    def e2e(stage: str):
+        lat, per = [], {}
+        for risk in RISKS:
+            for h in HORIZONS:
+                t = _timed(lambda: recommend(risk, h), args.repeat)
+                per[f"{risk}/{h}"] = round(float(np.median(t)) * 1000.0, 3)
+                lat += t
+        add(stage, lat, 1, _peak_mb(lambda: recommend(RISKS[0], HORIZONS[0])), per_case_p50_ms=per)
+
+    dl._ranker.version = None     # not ready for this snapshot -> full scoring path
+    e2e("recommend_full")
+
+    delta = diff_snapshots(None, snap, dl.SCORE_FIELDS)
+    lat = _timed(lambda: dl._ranker.apply(snap, delta), 1)
+    add("precompute_build", lat, n, None, last_update=dl._ranker.last_update)
+    e2e("recommend_precomputed")
+    dl._ranker.version = None
+    return rows
+
+# ============================================================
+# Results files
+# ============================================================
+def _save(results: List[Dict[str, Any]], args: argparse.Namespace) -> str:
+    os.makedirs(args.out, exist_ok=True)
+    ts = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    name = f"ranking-{ts}" + (f"-{args.label}" if args.label else "") + ".json"
+    path = os.path.join(args.out, name)
+    meta = {
+        "timestamp": ts, "label": args.label, "git": git_rev(), "python": platform.python_version(),
+        "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+    }
+    with open(path, "w") as fh:
+        json.dump({"meta": meta, "results": results}, fh, indent=2)
+    return path
+
+def compare(path_a: str, path_b: str):
+    """Per (size, stage): B vs A for p50/p95 latency and throughput (negative latency % = faster)."""
+    def load(p: str) -> Tuple[Dict[str, Any], Dict[Tuple[int, str], Dict[str, Any]]]:
+        with open(p) as fh:
+            data = json.load(fh)
+        return data["meta"], {(r["size"], r["stage"]): r for r in data["results"]}
+
+    meta_a, a = load(path_a)
+    meta_b, b = load(path_b)
+    print(f"A: {path_a} ({meta_a.get('label') or '-'} @ {meta_a.get('git') or '?'})")
+    print(f"B: {path_b} ({meta_b.get('label') or '-'} @ {meta_b.get('git') or '?'})")
+    print(f"{'size':>7} {'stage':<24} {'p50 A':>10} {'p50 B':>10} {'Δp50':>8} {'Δp95':>8} {'Δops/s':>8} {'Δpeak':>8}")
+
+    def pct(x, y):
+        return f"{(y - x) / x * 100.0:+7.1f}%" if x and y is not None else "       -"
+
+    for key in sorted(set(a) | set(b)):
+        ra, rb = a.get(key), b.get(key)
+        if ra is None or rb is None:
+            print(f"{key[0]:>7} {key[1]:<24} {'only in ' + ('B' if ra is None else 'A'):>21}")
+            continue
+        print(f"{key[0]:>7} {key[1]:<24} {ra['p50_ms']:>10.2f} {rb['p50_ms']:>10.2f} "
+              f"{pct(ra['p50_ms'], rb['p50_ms'])} {pct(ra['p95_ms'], rb['p95_ms'])} "
+              f"{pct(ra['ops_per_s'], rb['ops_per_s'])} {pct(ra.get('peak_mb'), rb.get('peak_mb'))}")
+
+# ============================================================
+# CLI
+# ============================================================
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="1000,10000,100000", help="comma-separated universe sizes")
+    ap.add_argument("--repeat", type=int, default=3, help="timed runs per case")
+    ap.add_argument("--chains", default="avalanche", help="chains ranked per /recommend call (first = micro-bench chain)")
+    ap.add_argument("--limit-fetch", type=int, default=600)
+    ap.add_argument("--top-n", type=int, default=2)
+    ap.add_argument("--amount", type=float, default=10.0, help="amountAvax")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--label", default="", help="suffix for the results file")
+    ap.add_argument("--out", default=RESULTS_DIR)
+    ap.add_argument("--compare", nargs=2, metavar=("A.json", "B.json"))
+    args = ap.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    results: List[Dict[str, Any]] = []
+    try:
+        for n in [int(s) for s in args.sizes.split(",") if s.strip()]:
+            print(f"[bench] universe size {n}", flush=True)
+            results += bench_size(n, args)
+    finally:
+        dl.close_rank_executor()
+    print(f"[bench] saved {_save(results, args)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
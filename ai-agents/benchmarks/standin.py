@@ -0,0 +1,418 @@
+# benchmarks/standin.py
+"""
+Local stand-in for coins.llama.fi, yields.llama.fi and the OpenAI chat API.
+
+    python -m benchmarks.standin --port 8099                      # replay fixtures, synthesize the rest
+    python -m benchmarks.standin --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+    python -m benchmarks.standin --rate-limit-rps 10                # answer 429 past 10 req/s per route
+    python -m benchmarks.standin --record                         # proxy to the real services, save fixtures
+    python -m benchmarks.standin --print-env                      # env vars that point the app here
+
+Routes: /prices/current/{coins}, /prices/historical/{ts}/{coins}, /pools, /chart/{pool},
+/v1/chat/completions (plain and stream=true). Admin: GET/POST /__standin/config,
+GET /__standin/stats, POST /__standin/reset.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from benchmarks.synthetic import make_universe
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+UPSTREAMS = {
+    "prices": "https://coins.llama.fi",
+    "pools": "https://yields.llama.fi",
+    "chart": "https://yields.llama.fi",
+    "chat": "https://api.openai.com",
+}
+ROUTES = list(UPSTREAMS)
+
+# ============================================================
+# Fault injection (default + per-route overrides)
+# ============================================================
+INJECTION_DEFAULTS: Dict[str, float] = {
+    "latency_ms": 0.0,      # added to every response
+    "jitter_ms": 0.0,       # + uniform(0, jitter_ms)
+    "error_rate": 0.0,      # fraction answered with error_status
+    "error_status": 503,
+    "hang_rate": 0.0,       # fraction held for hang_ms before answering (client timeouts)
+    "hang_ms": 30000.0,
+    "token_ms": 15.0,       # delay between streamed chat chunks
+    "rate_limit_rps": 0.0,  # > 0: per-route token bucket, 429 + Retry-After once it is empty
+    "rate_limit_burst": 10.0,
+}
+
+class StandinState:
+    def __init__(self, fixtures: str, record: bool, strict: bool, pools: int, seed: int):
+        self.fixtures = fixtures
+        self.record = record
+        self.strict = strict
+        self.pools_n = pools
+        self.seed = seed
+        self.default: Dict[str, float] = dict(INJECTION_DEFAULTS)
+        self.routes: Dict[str, Dict[str, float]] = {}
+        self.calls: Counter = Counter()            # (route, status) -> count
+        self.latency_s: Counter = Counter()        # route -> total seconds served
+        self.rnd = random.Random(seed)
+        self.buckets: Dict[str, List[float]] = {}  # route -> [tokens, last refill]
+        self._pools: Optional[List[Dict[str, Any]]] = None
+        self._pools_json: Optional[bytes] = None
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def injection(self, route: str) -> Dict[str, float]:
+        return {**self.default, **self.routes.get(route, {})}
+
+    def configure(self, cfg: Dict[str, Any]):
+        for k, v in (cfg.get("default") or {}).items():
+            if k not in INJECTION_DEFAULTS:
+                raise ValueError(f"unknown injection setting '{k}'")
+            self.default[k] = float(v)
+        for route, over in (cfg.get("routes") or {}).items():
+            if route not in ROUTES:
+                raise ValueError(f"unknown route '{route}' (expected one of {', '.join(ROUTES)})")
+            bad = set(over) - set(INJECTION_DEFAULTS)
+            if bad:
+                raise ValueError(f"unknown injection setting(s) {sorted(bad)}")
+            self.routes.setdefault(route, {}).update({k: float(v) for k, v in over.items()})
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"default": self.default, "routes": self.routes, "record": self.record, "strict": self.strict}
+
+    def stats(self) -> Dict[str, Any]:
+        per: Dict[str, Dict[str, Any]] = {}
+        for (route, status), n in self.calls.items():
+            row = per.setdefault(route, {"calls": 0, "byStatus": {}})
+            row["calls"] += n
+            row["byStatus"][str(status)] = n
+        for route, row in per.items():
+            row["meanMs"] = round(self.latency_s[route] / row["calls"] * 1000.0, 3) if row["calls"] else None
+        return {"routes": per, "total": sum(self.calls.values())}
+
+    def pools(self) -> List[Dict[str, Any]]:
+        if self._pools is None:
+            self._pools = make_universe(self.pools_n, seed=self.seed)
+        return self._pools
+
+    def pools_json(self) -> bytes:
+        # the full universe is served on every refresh: encode once
+        if self._pools_json is None:
+            self._pools_json = json.dumps({"status": "success", "data": self.pools()}).encode("utf-8")
+        return self._pools_json
+
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=60.0, follow_redirects=True)
+        return self._http
+
+state: StandinState = StandinState(FIXTURES_DIR, record=False, strict=False, pools=20000, seed=7)
+
+def _rate_limited(route: str, cfg: Dict[str, float]) -> Optional[Response]:
+    rps, burst = cfg["rate_limit_rps"], max(1.0, cfg["rate_limit_burst"])
+    if rps <= 0:
+        return None
+    now = time.monotonic()
+    bucket = state.buckets.setdefault(route, [burst, now])
+    bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rps)
+    bucket[1] = now
+    if bucket[0] >= 1.0:
+        bucket[0] -= 1.0
+        return None
+    retry_after = max(1, math.ceil((1.0 - bucket[0]) / rps))
+    return JSONResponse({"error": "rate limited by stand-in", "status": 429}, status_code=429,
+                        headers={"Retry-After": str(retry_after)})
+
+async def _inject(route: str) -> Optional[Response]:
+    cfg = state.injection(route)
+    limited = _rate_limited(route, cfg)
+    if limited is not None:
+        return limited
+    delay = cfg["latency_ms"] + state.rnd.uniform(0.0, cfg["jitter_ms"])
+    if cfg["hang_rate"] > 0 and state.rnd.random() < cfg["hang_rate"]:
+        delay += cfg["hang_ms"]
+    if delay > 0:
+        await asyncio.sleep(delay / 1000.0)
+    if cfg["error_rate"] > 0 and state.rnd.random() < cfg["error_rate"]:
+        status = int(cfg["error_status"])
+        return JSONResponse({"error": "injected by stand-in", "status": status}, status_code=status)
+    return None
+
+# ============================================================
+# Fixtures: one JSON file per (route, request) key
+# ============================================================
+def _fixture_key(route: str, path: str, query: str, body: Optional[Dict[str, Any]] = None) -> str:
+    raw = json.dumps([route, path, query, body], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def _fixture_path(route: str, key: str) -> str:
+    return os.path.join(state.fixtures, route, f"{key}.json")
+
+def _load_fixture(route: str, key: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_fixture_path(route, key)) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+def _save_fixture(route: str, key: str, fixture: Dict[str, Any]):
+    path = _fixture_path(route, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(fixture, fh)
+    os.replace(tmp, path)
+
+async def _record(route: str, key: str, request: Request, body: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    # body: the exact request payload to forward (chat only)
+    url = UPSTREAMS[route] + request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    headers = {"user-agent": request.headers.get("user-agent", "standin-recorder")}
+    if route == "chat" and request.headers.get("authorization"):
+        headers["authorization"] = request.headers["authorization"]
+    if body is None:
+        r = await state.http().get(url, headers=headers)
+    else:
+        r = await state.http().post(url, headers=headers, json=body)
+    fixture: Dict[str, Any] = {"request": {"route": route, "path": request.url.path, "query": request.url.query},
+                               "status": r.status_code, "recordedAt": time.time()}
+    if body is not None and body.get("stream"):
+        fixture["sse"] = r.text
+    else:
+        fixture["json"] = r.json() if r.headers.get("content-type", "").startswith("application/json") else None
+        fixture["text"] = None if fixture["json"] is not None else r.text
+    if r.status_code < 500:
+        _save_fixture(route, key, fixture)
+    return fixture
+
+async def _fixture_or_none(route: str, request: Request, key_body: Optional[Dict[str, Any]] = None,
+                           send_body: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    key = _fixture_key(route, request.url.path, request.url.query, key_body)
+    if state.record:
+        return await _record(route, key, request, send_body)
+    fixture = _load_fixture(route, key)
+    if fixture is None and state.strict:
+        raise HTTPException(status_code=404, detail=f"no fixture for {route} {request.url.path}?{request.url.query}")
+    return fixture
+
+def _replay(fixture: Dict[str, Any]) -> Response:
+    if fixture.get("json") is not None:
+        return JSONResponse(fixture["json"], status_code=fixture["status"])
+    return Response(fixture.get("text") or "", status_code=fixture["status"])
+
+# ============================================================
+# Synthetic responses (used when no fixture matches)
+# ============================================================
+def _unit(*parts: Any) -> float:
+    h = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).digest()
+    return int.from_bytes(h[:8], "big") / 2**64
+
+def _price(coin: str, ts: Optional[int] = None) -> float:
+    base = 0.5 + 3000.0 * _unit(coin) ** 3
+    if ts is None:
+        ts = int(time.time())
+    days = ts / 86400.0
+    phase = 2 * math.pi * _unit(coin, "phase")
+    return base * (1.0 + 0.12 * math.sin(days / 11.0 + phase) + 0.04 * math.sin(days / 1.7 + 2 * phase))
+
+def _coins_body(coins: str, ts: Optional[int]) -> Dict[str, Any]:
+    out = {}
+    for coin in coins.split(","):
+        coin = coin.strip()
+        if coin:
+            out[coin] = {"decimals": 18, "symbol": coin.split(":")[-1][:6].upper(), "price": _price(coin.lower(), ts),
+                         "timestamp": ts or int(time.time()), "confidence": 0.99}
+    return {"coins": out}
+
+def _chart_body(pool: str) -> Dict[str, Any]:
+    rnd = random.Random(pool)
+    now = int(time.time()) // 86400 * 86400
+    tvl, apy = 10 ** rnd.uniform(4, 8), rnd.uniform(1, 40)
+    data = []
+    for d in range(90, 0, -1):
+        tvl *= math.exp(rnd.gauss(0.0, 0.04))
+        apy = max(0.0, apy * math.exp(rnd.gauss(0.0, 0.08)))
+        ts = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(now - d * 86400))
+        data.append({"timestamp": ts, "tvlUsd": tvl, "apy": apy, "apyBase": apy, "apyReward": None})
+    return {"status": "success", "data": data}
+
+def _chat_text(body: Dict[str, Any]) -> str:
+    prompt = " ".join(str(m.get("content") or "") for m in body.get("messages") or [])
+    rnd = random.Random(hashlib.sha1(prompt.encode("utf-8")).hexdigest())
+    words = ["liquidity", "yield", "volatility", "fees", "rewards", "TVL", "exposure", "impermanent",
+             "loss", "stable", "horizon", "risk", "diversified", "returns", "depth", "emissions"]
+    n = rnd.randint(45, 80)
+    return "Stand-in narrative: " + " ".join(rnd.choice(words) for _ in range(n)) + "."
+
+def _chat_body(body: Dict[str, Any], text: str) -> Dict[str, Any]:
+    return {
+        "id": "chatcmpl-standin", "object": "chat.completion", "created": int(time.time()),
+        "model": body.get("model") or "standin",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(text.split()), "total_tokens": len(text.split())},
+    }
+
+async def _chat_chunks(body: Dict[str, Any], text: str, token_ms: float) -> AsyncIterator[str]:
+    def chunk(delta: Dict[str, Any], finish: Optional[str] = None) -> str:
+        return "data: " + json.dumps({
+            "id": "chatcmpl-standin", "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": body.get("model") or "standin",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+        }) + "\n\n"
+
+    yield chunk({"role": "assistant", "content": ""})
+    for word in text.split(" "):
+        await asyncio.sleep(token_ms / 1000.0)
+        yield chunk({"content": word + " "})
+    yield chunk({}, "stop")
+    yield "data: [DONE]\n\n"
+
+async def _sse_replay(raw: str, token_ms: float) -> AsyncIterator[str]:
+    for event in raw.split("\n\n"):
+        if event.strip():
+            await asyncio.sleep(token_ms / 1000.0)
+            yield event + "\n\n"
+
+# ============================================================
+# App
+# ============================================================
+app = FastAPI(title="tesserapt upstream stand-in")
+
+@app.middleware("http")
+async def _count(request: Request, call_next):
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("standin_route")
+    if route:
+        state.calls[(route, response.status_code)] += 1
+        state.latency_s[route] += time.perf_counter() - t0
+    return response
+
+async def _serve(route: str, request: Request, synth) -> Response:
+    request.scope["standin_route"] = route
+    injected = await _inject(route)
+    if injected is not None:
+        return injected
+    fixture = await _fixture_or_none(route, request)
+    if fixture is not None:
+        return _replay(fixture)
+    body = synth()
+    return body if isinstance(body, Response) else JSONResponse(body)
+
+@app.get("/prices/current/{coins:path}")
+async def prices_current(coins: str, request: Request):
+    return await _serve("prices", request, lambda: _coins_body(coins, None))
+
+@app.get("/prices/historical/{ts}/{coins:path}")
+async def prices_historical(ts: int, coins: str, request: Request):
+    return await _serve("prices", request, lambda: _coins_body(coins, ts))
+
+@app.get("/pools")
+async def pools(request: Request):
+    return await _serve("pools", request, lambda: Response(state.pools_json(), media_type="application/json"))
+
+@app.get("/chart/{pool}")
+async def chart(pool: str, request: Request):
+    return await _serve("chart", request, lambda: _chart_body(pool))
+
+@app.post("/v1/chat/completions")
+async def chat(request: Request):
+    request.scope["standin_route"] = "chat"
+    body = await request.json()
+    injected = await _inject("chat")
+    if injected is not None:
+        return injected
+    key_body = {"model": body.get("model"), "messages": body.get("messages"), "stream": bool(body.get("stream"))}
+    fixture = await _fixture_or_none("chat", request, key_body, send_body=body)
+    token_ms = state.injection("chat")["token_ms"]
+    if fixture is not None and fixture.get("sse"):
+        return StreamingResponse(_sse_replay(fixture["sse"], token_ms), media_type="text/event-stream")
+    if fixture is not None:
+        return _replay(fixture)
+    text = _chat_text(body)
+    if body.get("stream"):
+        return StreamingResponse(_chat_chunks(body, text, token_ms), media_type="text/event-stream")
+    return _chat_body(body, text)
+
+@app.get("/__standin/config")
+async def get_config():
+    return state.snapshot()
+
+@app.post("/__standin/config")
+async def set_config(request: Request):
+    try:
+        state.configure(await request.json())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return state.snapshot()
+
+@app.get("/__standin/stats")
+async def get_stats():
+    return state.stats()
+
+@app.post("/__standin/reset")
+async def reset_stats():
+    state.calls.clear()
+    state.latency_s.clear()
+    return {"ok": True}
+
+# ============================================================
+# CLI
+# ============================================================
+def app_env(base: str) -> Dict[str, str]:
+    """Environment that points main.py / defillama.py at a stand-in listening on `base`."""
+    base = base.rstrip("/")
+    return {
+        "LLAMA_PRICES_BASE": base,
+        "LLAMA_PRICES": f"{base}/prices/current",
+        "LLAMA_YIELDS": f"{base}/pools",
+        "LLAMA_YIELDS_CHART": f"{base}/chart",
+        "OPENAI_BASE_URL": f"{base}/v1",
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "standin",
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    global state
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--fixtures", default=FIXTURES_DIR)
+    ap.add_argument("--record", action="store_true", help="proxy to the real upstreams and save fixtures")
+    ap.add_argument("--strict", action="store_true", help="404 on requests without a fixture (no synthesis)")
+    ap.add_argument("--pools", type=int, default=20000, help="synthetic /pools universe size")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--config", help="JSON file: {\"default\": {...}, \"routes\": {\"pools\": {...}}}")
+    ap.add_argument("--print-env", action="store_true", help="print the app env for this stand-in and exit")
+    for k, v in INJECTION_DEFAULTS.items():
+        ap.add_argument(f"--{k.replace('_', '-')}", type=float, default=v)
+    args = ap.parse_args(argv)
+
+    base = f"http://{args.host}:{args.port}"
+    if args.print_env:
+        for k, v in app_env(base).items():
+            print(f"export {k}={v}")
+        return 0
+
+    state = StandinState(args.fixtures, record=args.record, strict=args.strict, pools=args.pools, seed=args.seed)
+    state.configure({"default": {k: getattr(args, k) for k in INJECTION_DEFAULTS}})
+    if args.config:
+        with open(args.config) as fh:
+            state.configure(json.load(fh))
+
+    import uvicorn
+    mode = "record" if args.record else ("replay (strict)" if args.strict else "replay + synthetic")
+    print(f"[standin] {mode} on {base}, fixtures in {args.fixtures}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# benchmarks/synthetic.py
+import random
+from typing import Any, Dict, List
+
+# ============================================================
+# Synthetic DeFiLlama /pools universe
+#   Same shape as yields.llama.fi/pools rows. Distributions are rough fits
+#   to the live feed: log-normal TVL (most pools tiny, a few huge), heavy-
+#   tailed APY, ~40% single-asset pools, partial reward/volume/prediction
+#   coverage, and repeated (project, symbol) pairs across pool versions.
+# ============================================================
+CHAIN_WEIGHTS = {
+    "Ethereum": 0.30, "Arbitrum": 0.14, "BSC": 0.12, "Polygon": 0.10, "Avalanche": 0.10,
+    "Optimism": 0.08, "Base": 0.08, "Solana": 0.05, "Fantom": 0.03,
+}
+PROJECTS = [
+    "uniswap-v3", "curve-dex", "aave-v3", "trader-joe", "pangolin", "benqi", "gmx", "yield-yak",
+    "balancer-v2", "sushiswap", "compound-v3", "beefy", "convex-finance", "stargate", "pancakeswap-amm-v3",
+    "velodrome-v2", "aerodrome-v1", "camelot-v3", "morpho-blue", "pendle",
+]
+STABLES = ["USDC", "USDT", "DAI", "FRAX", "USDC.E", "LUSD", "GHO"]
+VOLATILE = ["WETH", "WBTC", "WAVAX", "BTC.B", "SAVAX", "JOE", "QI", "GMX", "ARB", "OP", "MATIC", "BNB",
+            "CRV", "CVX", "LINK", "UNI", "AAVE", "PENDLE", "STETH", "WSTETH", "RETH", "CBETH"]
+POOL_META = [None] * 6 + ["v2.1", "Boosted", "0.05%", "0.3%", "1%", "Stable", "Volatile", "Lending"]
+
+def _token_address(rnd: random.Random, cache: Dict[str, str], sym: str) -> str:
+    addr = cache.get(sym)
+    if addr is None:
+        addr = cache[sym] = "0x" + "".join(rnd.choice("0123456789abcdef") for _ in range(40))
+    return addr
+
+def _pick_chain(rnd: random.Random) -> str:
+    x, acc = rnd.random(), 0.0
+    for chain, w in CHAIN_WEIGHTS.items():
+        acc += w
+        if x < acc:
+            return chain
+    return "Ethereum"
+
+def make_universe(n: int, seed: int = 7) -> List[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    addrs: Dict[str, str] = {}
+    out: List[Dict[str, Any]] = []
+    for i in range(n):
+        single = rnd.random() < 0.4
+        toks = [rnd.choice(STABLES + VOLATILE)] if single else rnd.sample(STABLES + VOLATILE, 2)
+        stable = all(t in STABLES for t in toks)
+        tvl = rnd.lognormvariate(11.5, 2.6)
+        apy_base = max(0.0, rnd.lognormvariate(1.2, 1.1) - 1.0) if rnd.random() < 0.9 else None
+        apy_reward = rnd.lognormvariate(1.0, 1.3) if rnd.random() < 0.35 else None
+        apy = (apy_base or 0.0) + (apy_reward or 0.0)
+        drift = rnd.gauss(0.0, 0.25)
+        has_pred = rnd.random() < 0.85
+        out.append({
+            "chain": _pick_chain(rnd),
+            "project": rnd.choice(PROJECTS),
+            "symbol": "-".join(toks),
+            "tvlUsd": tvl,
+            "apyBase": apy_base,
+            "apyReward": apy_reward,
+            "apy": apy,
+            "rewardTokens": [_token_address(rnd, addrs, rnd.choice(VOLATILE))] if apy_reward else None,
+            "pool": f"{i:08x}-{rnd.getrandbits(32):08x}-synthetic",
+            "apyPct1D": rnd.gauss(0.0, 1.5),
+            "apyPct7D": rnd.gauss(0.0, 4.0),
+            "apyPct30D": rnd.gauss(0.0, 8.0),
+            "stablecoin": stable,
+            "ilRisk": "no" if single or stable else "yes",
+            "exposure": "single" if single else "multi",
+            "predictions": {
+                "predictedClass": rnd.choice(["Stable/Up", "Down"]),
+                "predictedProbability": rnd.uniform(50, 99),
+                "binnedConfidence": rnd.choice([1, 2, 3]),
+            } if has_pred else {"predictedClass": None, "predictedProbability": None, "binnedConfidence": None},
+            "poolMeta": rnd.choice(POOL_META),
+            "mu": apy * (1.0 + drift),
+            "sigma": abs(rnd.gauss(0.0, 0.6)) if rnd.random() < 0.8 else None,
+            "count": rnd.randint(5, 900),
+            "outlier": rnd.random() < 0.02,
+            "underlyingTokens": [_token_address(rnd, addrs, t) for t in toks],
+            "il7d": None,
+            "apyBase7d": apy_base * (1.0 + drift) if apy_base is not None else None,
+            "apyMean30d": max(0.0, apy * (1.0 + drift)),
+            "volumeUsd1d": tvl * rnd.uniform(0.0, 0.3) if not single and rnd.random() < 0.7 else None,
+            "volumeUsd7d": tvl * rnd.uniform(0.0, 2.0) if not single and rnd.random() < 0.7 else None,
+            "apyBaseInception": None,
+        })
+    return out
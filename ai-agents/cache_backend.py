@@ -0,0 +1,345 @@
+# cache_backend.py
+import os
+import json
+import math
+import time
+import queue
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from metrics import CACHE_EVICTIONS, CACHE_REQUESTS
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()     # memory | sqlite
+CACHE_DB = os.getenv("CACHE_DB", "cache.sqlite3")
+CACHE_MAX_ITEMS = int(os.getenv("CACHE_MAX_ITEMS", "10000"))
+CACHE_BUSY_TIMEOUT_MS = int(os.getenv("CACHE_BUSY_TIMEOUT_MS", "2000"))  # writer thread only
+CACHE_READ_BUSY_MS = int(os.getenv("CACHE_READ_BUSY_MS", "20"))          # reads (on the event loop): then a miss
+CACHE_PRUNE_EVERY = 256     # sets between expiry/size sweeps (sqlite)
+
+_MISS: Tuple[bool, Any] = (False, None)
+_MISS_AGED: Tuple[bool, Any, float] = (False, None, 0.0)
+
+# ============================================================
+# Backend interface
+#   Entries carry the time they were stored and an optional expiry.
+#   get(key, max_age) is a hit only if the entry hasn't expired and,
+#   when max_age is given, is at most max_age seconds old, which is
+#   the read-side TTL main.cache_get always had. Values must be JSON.
+# ============================================================
+class CacheBackend(ABC):
+    namespace: str
+
+    def _bind_metrics(self):
+        self._hits = CACHE_REQUESTS.labels(self.namespace, "hit")
+        self._misses = CACHE_REQUESTS.labels(self.namespace, "miss")
+        self._evictions = CACHE_EVICTIONS.labels(self.namespace)
+
+    @abstractmethod
+    def get(self, key: str, max_age: Optional[float] = None) -> Tuple[bool, Any]:
+        ...
+
+    @abstractmethod
+    def get_aged(self, key: str) -> Tuple[bool, Any, float]:
+        """(hit, value, age in seconds) for an unexpired entry; the caller decides what age is fresh."""
+
+    def get_many(self, keys: Iterable[str], max_age: Optional[float] = None) -> Dict[str, Any]:
+        """Hits only: key -> value."""
+        out: Dict[str, Any] = {}
+        for k in keys:
+            hit, val = self.get(k, max_age)
+            if hit:
+                out[k] = val
+        return out
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    def close(self):
+        pass
+
+def _live(stored_at: float, expires_at: float, max_age: Optional[float], now: float) -> bool:
+    return now < expires_at and (max_age is None or now - stored_at <= max_age)
+
+# ---------------- in-process (per worker), LRU-bounded ----------------
+class MemoryCache(CacheBackend):
+    def __init__(self, namespace: str, max_items: int = CACHE_MAX_ITEMS):
+        self.namespace = namespace
+        self.max_items = max(1, max_items)
+        self._rows: "OrderedDict[str, Tuple[float, float, Any]]" = OrderedDict()
+        self._bind_metrics()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Tuple[bool, Any]:
+        row = self._rows.get(key)
+        if row is None:
+            self._misses.inc()
+            return _MISS
+        stored_at, expires_at, val = row
+        if not _live(stored_at, expires_at, max_age, time.time()):
+            if time.time() >= expires_at:
+                self._rows.pop(key, None)
+                self._evictions.inc()
+            self._misses.inc()
+            return _MISS
+        self._rows.move_to_end(key)
+        self._hits.inc()
+        return True, val
+
+    def get_aged(self, key: str) -> Tuple[bool, Any, float]:
+        row = self._rows.get(key)
+        now = time.time()
+        if row is None or now >= row[1]:
+            if row is not None:
+                self._rows.pop(key, None)
+                self._evictions.inc()
+            self._misses.inc()
+            return _MISS_AGED
+        self._rows.move_to_end(key)
+        self._hits.inc()
+        return True, row[2], now - row[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.time()
+        self._rows[key] = (now, now + ttl if ttl is not None else math.inf, value)
+        self._rows.move_to_end(key)
+        while len(self._rows) > self.max_items:
+            self._rows.popitem(last=False)
+            self._evictions.inc()
+
+    def delete(self, key: str):
+        self._rows.pop(key, None)
+
+# ---------------- host-shared (all workers), SQLite WAL ----------------
+#   Callers run on the event loop, so nothing there may wait on another
+#   worker's write lock. Writes (set, delete, pruning) are queued to one
+#   writer thread per file, which commits them in batches on its own
+#   connection; until then they sit in the cache's pending overlay, so a
+#   worker reads its own writes. Reads use a separate connection with a
+#   short busy timeout (WAL readers rarely wait at all) and count as a
+#   miss when the file stays locked.
+_Write = Callable[[sqlite3.Connection], Any]
+_Done = Optional[Callable[[], None]]     # runs once the write committed or was dropped
+
+class _SQLiteDB:
+    """Per process per file: a reader connection and a writer thread; both recreated after fork."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes: "queue.SimpleQueue[Optional[Tuple[_Write, _Done]]]" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+
+    def _connect(self, busy_ms: int) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute(f"PRAGMA busy_timeout={busy_ms}")
+        return db
+
+    def conn(self) -> sqlite3.Connection:
+        """The reader connection (schema is created by the writer)."""
+        if self._db is None or self._pid != os.getpid():
+            self._db, self._pid = self._connect(CACHE_READ_BUSY_MS), os.getpid()
+            self._start_writer()
+        return self._db
+
+    def _start_writer(self):
+        self._writes = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_loop, name=f"cache-writer:{self.path}", daemon=True)
+        self._writer.start()
+
+    def write(self, op: _Write, done: _Done = None):
+        self.conn()
+        self._writes.put((op, done))
+
+    def _write_loop(self):
+        db = self._connect(CACHE_BUSY_TIMEOUT_MS)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " ns TEXT NOT NULL, key TEXT NOT NULL, stored_at REAL NOT NULL, expires_at REAL, value TEXT,"
+            " PRIMARY KEY (ns, key)) WITHOUT ROWID"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS cache_ns_stored ON cache (ns, stored_at)")
+        writes = self._writes
+        while True:
+            batch: List[Optional[Tuple[_Write, _Done]]] = [writes.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(writes.get_nowait())
+                except queue.Empty:
+                    break
+            ops = [item for item in batch if item is not None]
+            if ops:
+                try:
+                    db.execute("BEGIN IMMEDIATE")
+                    for op, _ in ops:
+                        op(db)
+                    db.execute("COMMIT")
+                except sqlite3.Error as e:
+                    if db.in_transaction:
+                        db.execute("ROLLBACK")
+                    print(f"[cache] sqlite write failed ({len(ops)} ops dropped): {e}")
+                for _, done in ops:
+                    if done is not None:
+                        done()
+            if None in batch:
+                db.close()
+                return
+
+    def close(self):
+        with self.lock:
+            if self._pid == os.getpid():
+                if self._writer is not None:
+                    self._writes.put(None)          # flush what is queued, then stop
+                    self._writer.join(timeout=5)
+                if self._db is not None:
+                    self._db.close()
+            self._db, self._writer = None, None
+
+_dbs: Dict[str, _SQLiteDB] = {}
+
+class SQLiteCache(CacheBackend):
+    def __init__(self, namespace: str, path: str = CACHE_DB, max_items: int = CACHE_MAX_ITEMS):
+        self.namespace = namespace
+        self.max_items = max(1, max_items)
+        self._db = _dbs.setdefault(path, _SQLiteDB(path))
+        self._sets = 0
+        # key -> row (stored_at, expires_at, json value; None = deleted) queued but not yet committed
+        self._pending: Dict[str, Tuple[float, Optional[float], Optional[str]]] = {}
+        self._pending_lock = threading.Lock()
+        self._bind_metrics()
+
+    def _row(self, key: str) -> Optional[Tuple[float, Optional[float], str]]:
+        with self._pending_lock:
+            row = self._pending.get(key)
+        if row is not None:
+            return None if row[2] is None else row
+        try:
+            with self._db.lock:
+                return self._db.conn().execute(
+                    "SELECT stored_at, expires_at, value FROM cache WHERE ns = ? AND key = ?", (self.namespace, key)
+                ).fetchone()
+        except sqlite3.OperationalError:
+            return None             # locked past CACHE_READ_BUSY_MS (or no table yet): a miss
+
+    def _queue(self, key: str, row: Tuple[float, Optional[float], Optional[str]], op: _Write):
+        with self._pending_lock:
+            self._pending[key] = row
+
+        def done():
+            with self._pending_lock:
+                if self._pending.get(key) is row:
+                    del self._pending[key]
+        self._db.write(op, done)
+
+    def _row_value(self, stored_at: float, expires_at: Optional[float], value: str,
+                   max_age: Optional[float], now: float) -> Tuple[bool, Any]:
+        if not _live(stored_at, math.inf if expires_at is None else expires_at, max_age, now):
+            return _MISS
+        return True, json.loads(value)
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Tuple[bool, Any]:
+        row = self._row(key)
+        hit = _MISS if row is None else self._row_value(*row, max_age, time.time())
+        (self._hits if hit[0] else self._misses).inc()
+        return hit
+
+    def get_aged(self, key: str) -> Tuple[bool, Any, float]:
+        row = self._row(key)
+        now = time.time()
+        if row is None or (row[1] is not None and now >= row[1]):
+            self._misses.inc()
+            return _MISS_AGED
+        self._hits.inc()
+        return True, json.loads(row[2]), now - row[0]
+
+    def get_many(self, keys: Iterable[str], max_age: Optional[float] = None) -> Dict[str, Any]:
+        keys = list(dict.fromkeys(keys))
+        out: Dict[str, Any] = {}
+        now = time.time()
+        with self._pending_lock:
+            pending = {k: self._pending[k] for k in keys if k in self._pending}
+        for key, (stored_at, expires_at, value) in pending.items():
+            if value is not None:
+                hit, val = self._row_value(stored_at, expires_at, value, max_age, now)
+                if hit:
+                    out[key] = val
+        rest = [k for k in keys if k not in pending]
+        try:
+            with self._db.lock:
+                db = self._db.conn()
+                for i in range(0, len(rest), 500):
+                    chunk = rest[i:i + 500]
+                    q = ("SELECT key, stored_at, expires_at, value FROM cache"
+                         f" WHERE ns = ? AND key IN ({','.join('?' * len(chunk))})")
+                    for key, stored_at, expires_at, value in db.execute(q, [self.namespace, *chunk]):
+                        hit, val = self._row_value(stored_at, expires_at, value, max_age, now)
+                        if hit:
+                            out[key] = val
+        except sqlite3.OperationalError:
+            pass                    # locked: whatever was not read yet counts as missed
+        self._hits.inc(len(out))
+        self._misses.inc(len(keys) - len(out))
+        return out
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.time()
+        row = (now, now + ttl if ttl is not None else None, json.dumps(value))
+        self._queue(key, row, lambda db: db.execute(
+            "INSERT OR REPLACE INTO cache (ns, key, stored_at, expires_at, value) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, *row),
+        ))
+        self._sets += 1
+        if self._sets % CACHE_PRUNE_EVERY == 0:
+            self._db.write(lambda db: self._prune(db, now))
+
+    def _prune(self, db: sqlite3.Connection, now: float):
+        # expired rows, then oldest-stored beyond max_items (reads don't write, so this is FIFO, not LRU)
+        expired = db.execute("DELETE FROM cache WHERE ns = ? AND expires_at < ?", (self.namespace, now))
+        self._evictions.inc(max(0, expired.rowcount))
+        over = db.execute(
+            "DELETE FROM cache WHERE ns = ? AND key IN ("
+            " SELECT key FROM cache WHERE ns = ? ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_items),
+        )
+        self._evictions.inc(max(0, over.rowcount))
+
+    def delete(self, key: str):
+        self._queue(key, (time.time(), None, None),
+                    lambda db: db.execute("DELETE FROM cache WHERE ns = ? AND key = ?", (self.namespace, key)))
+
+    def close(self):
+        self._db.close()
+
+# ============================================================
+# Registry: one backend per namespace, kind chosen by CACHE_BACKEND
+# ============================================================
+_caches: Dict[str, CacheBackend] = {}
+
+def open_cache(namespace: str, max_items: int = CACHE_MAX_ITEMS) -> CacheBackend:
+    cache = _caches.get(namespace)
+    if cache is None:
+        if CACHE_BACKEND == "sqlite":
+            cache = SQLiteCache(namespace, max_items=max_items)
+        elif CACHE_BACKEND == "memory":
+            cache = MemoryCache(namespace, max_items=max_items)
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND '{CACHE_BACKEND}' (expected 'memory' or 'sqlite')")
+        _caches[namespace] = cache
+    return cache
+
+def close_caches():
+    for cache in _caches.values():
+        cache.close()
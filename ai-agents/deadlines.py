@@ -0,0 +1,213 @@
+# deadlines.py
+import os
+import re
+import json
+import time
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from metrics import Counter
+
+REQUEST_DEADLINE_S = float(os.getenv("REQUEST_DEADLINE_S", "30"))    # until the response starts; 0 = none
+# path prefix overrides ("*" = one path segment). History is one coins.llama.fi call per day, so a
+# cold /coins/{id}/history?days=365 needs ~35 s at the default 10 req/s allowance (RATE_LIMITS).
+ROUTE_DEADLINES = os.getenv("ROUTE_DEADLINES", "/coins/*/history=120,/optimize=90")
+DEADLINE_RESERVE_MS = float(os.getenv("DEADLINE_RESERVE_MS", "100"))  # kept back from upstream waits to answer from fallbacks
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "true").lower() in {"1", "true", "yes", "on"}
+
+CANCELLED = Counter("request_cancellations", "Requests whose handler was cancelled, by route and reason (disconnect|deadline)",
+                    ("route", "reason"))
+ABANDONED = Counter("abandoned_loads", "Shared loads cancelled because every caller waiting on them went away", ("kind",))
+
+def _parse_routes(spec: str) -> Tuple[Tuple["re.Pattern[str]", float], ...]:
+    out = []
+    for part in spec.split(","):
+        prefix, _, secs = part.strip().partition("=")
+        prefix = prefix.strip()
+        if prefix and secs:
+            pattern = re.compile("[^/]+".join(re.escape(p) for p in prefix.split("*")))
+            out.append((prefix, pattern, float(secs)))
+    # longest prefix first: "/recommend/stream" wins over "/recommend"
+    return tuple((pattern, secs) for _, pattern, secs in sorted(out, key=lambda r: len(r[0]), reverse=True))
+
+_ROUTE_DEADLINES = _parse_routes(ROUTE_DEADLINES)
+
+def deadline_for(path: str) -> float:
+    for pattern, secs in _ROUTE_DEADLINES:
+        if pattern.match(path):
+            return secs
+    return REQUEST_DEADLINE_S
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """The request's deadline leaves no time for this step."""
+
+# ============================================================
+# Current deadline
+#   A monotonic timestamp on the request context. Shared loads (single-
+#   flight cache fills, universe refreshes, price batches) run detached()
+#   so one caller's deadline never cuts them short for the others.
+# ============================================================
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+def remaining() -> float:
+    deadline = _deadline.get()
+    return float("inf") if deadline is None else deadline - time.monotonic()
+
+def budget() -> Optional[float]:
+    """Seconds an upstream wait may take (remaining minus the reserve), None without a deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic() - DEADLINE_RESERVE_MS / 1000.0
+
+def check(stage: str):
+    """Raise DeadlineExceeded instead of starting `stage` past the deadline."""
+    if remaining() <= 0:
+        raise DeadlineExceeded(f"request deadline exceeded before {stage}")
+
+@contextmanager
+def detached():
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def clamp_timeouts(timeouts: Optional[Dict[str, Optional[float]]], limit: Optional[float]) -> Tuple[Optional[Dict[str, Optional[float]]], bool]:
+    """httpx timeout extension with every phase capped at `limit`; also says whether the cap bit."""
+    if limit is None or timeouts is None:
+        return timeouts, False
+    limit = max(0.001, limit)
+    clamped = {k: (limit if v is None or v > limit else v) for k, v in timeouts.items()}
+    return clamped, clamped != timeouts
+
+# ============================================================
+# Single-flight with waiter counting
+#   Callers join() a shared task through a shield, so one caller going
+#   away never cancels it for the rest; when the last waiter leaves
+#   (cancelled, or out of deadline budget) the task is cancelled unless it
+#   was started in the background (`keep`). A cancelled load writes
+#   nothing, so no cache entry is poisoned; the next caller starts over.
+# ============================================================
+class Flight:
+    __slots__ = ("task", "kind", "keep", "waiters", "abandoned")
+
+    def __init__(self, task: asyncio.Future, kind: str, keep: bool = False):
+        self.task = task
+        self.kind = kind
+        self.keep = keep
+        self.waiters = 0
+        self.abandoned = False
+
+    def joinable(self) -> bool:
+        return not (self.task.done() or self.abandoned)
+
+    async def join(self, timeout: Optional[float] = None) -> Any:
+        self.waiters += 1
+        try:
+            if timeout is None:
+                return await asyncio.shield(self.task)
+            try:
+                return await asyncio.wait_for(asyncio.shield(self.task), max(0.0, timeout))
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"request deadline exceeded waiting for {self.kind}") from None
+        finally:
+            self.waiters -= 1
+            if self.waiters == 0 and not self.keep and not self.task.done():
+                self.abandoned = True
+                self.task.cancel()
+                ABANDONED.labels(self.kind).inc()
+
+# ============================================================
+# ASGI middleware
+#   Runs the app in its own task under the route's deadline and relays
+#   the request messages, so it notices a client disconnect while the
+#   handler is still working. Before the response starts, a disconnect
+#   cancels the handler (recorded as 499) and a passed deadline cancels
+#   it with a 504. Once the response has started (streams) only a
+#   disconnect stops it; after it completed nothing is cancelled.
+# ============================================================
+class DeadlineMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limit = deadline_for(scope["path"])
+        if limit <= 0 and not CANCEL_ON_DISCONNECT:
+            await self.app(scope, receive, send)
+            return
+
+        inbox: asyncio.Queue = asyncio.Queue()
+        progress = {"started": False, "complete": False, "disconnected": False}
+
+        async def _receive():
+            if progress["disconnected"] and inbox.empty():
+                return {"type": "http.disconnect"}
+            return await inbox.get()
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                progress["started"] = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                progress["complete"] = True
+            await send(message)
+
+        async def _listen():
+            while True:
+                message = await receive()
+                inbox.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    progress["disconnected"] = True
+                    return
+
+        token = _deadline.set(time.monotonic() + limit if limit > 0 else None)
+        try:
+            app_task = asyncio.ensure_future(self.app(scope, _receive, _send))
+        finally:
+            _deadline.reset(token)
+        listener = asyncio.ensure_future(_listen())
+        t0 = time.monotonic()
+        reason = None
+        try:
+            while not app_task.done():
+                timeout = None
+                if limit > 0 and not progress["started"]:
+                    timeout = max(0.0, limit - (time.monotonic() - t0))
+                watch = {app_task, listener} if CANCEL_ON_DISCONNECT and not listener.done() else {app_task}
+                done, _ = await asyncio.wait(watch, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if app_task in done or progress["complete"]:
+                    break
+                if listener in done:
+                    reason = "disconnect"
+                    break
+                if not done and not progress["started"]:
+                    reason = "deadline"
+                    break
+            if reason is None:
+                await app_task
+                return
+            app_task.cancel()
+            await asyncio.gather(app_task, return_exceptions=True)
+            CANCELLED.labels(getattr(scope.get("route"), "path", "<unmatched>"), reason).inc()
+            if progress["started"]:
+                return
+            if reason == "deadline":
+                body = json.dumps({"detail": f"Request deadline of {limit:g}s exceeded"}).encode("utf-8")
+                await send({"type": "http.response.start", "status": 504,
+                            "headers": [(b"content-type", b"application/json"),
+                                        (b"content-length", str(len(body)).encode("latin-1"))]})
+                await send({"type": "http.response.body", "body": body})
+            else:
+                # nobody is listening any more; this only tells the outer middlewares
+                # (metrics, tracing) how the request ended: 499 = client closed request
+                await send({"type": "http.response.start", "status": 499, "headers": []})
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            listener.cancel()
+            if not app_task.done():
+                app_task.cancel()
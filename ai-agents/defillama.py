@@ -1,11 +1,33 @@
 # defillama.py
 import os
+import asyncio
+import base64
+import hashlib
+import json
+import time
 from typing import List, Optional, Dict, Any, Set, Tuple
 import math
-import httpx
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+from cache_backend import open_cache
+from deadlines import check as check_deadline
+from history import PoolHistoryIngester, PoolHistoryStore, SigmaIndex
+from http_clients import get_client
+from incremental import IncrementalRanker
+from metrics import RANK_SECONDS
+from ratelimit import background
+from resilience import flag_stale
+from prices import PriceLoader
+from records import PREDICTION_FIELDS, PoolRecord
+from shared_snapshot import FileLock, open_shared_store
+from swr import PREWARM_AHEAD
+from tracing import record, span
+from universe import SORT_COLUMNS, PoolColumns, PoolSnapshot, PoolUniverse
 
 
 load_dotenv()  
@@ -13,11 +35,41 @@ load_dotenv()
 CHAIN_DEFAULT = os.getenv("CHAIN", "avalanche").strip().lower()
 LLAMA_YIELDS = os.getenv("LLAMA_YIELDS", "https://yields.llama.fi/pools")
 LLAMA_PRICES = os.getenv("LLAMA_PRICES", "https://coins.llama.fi/prices/current")
+LLAMA_YIELDS_CHART = os.getenv("LLAMA_YIELDS_CHART", "https://yields.llama.fi/chart")
 WAVAX_ADDR = os.getenv("WAVAX_ADDR", "0xB31f66AA3C1e785363F0875A1B74E27b85FD66c7")
 
+# chain -> (native symbol, wrapped native token address) for per-chain profit conversion
+NATIVE_TOKENS: Dict[str, Tuple[str, str]] = {
+    "avalanche": ("AVAX", WAVAX_ADDR),
+    "ethereum": ("ETH", "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"),
+    "polygon": ("POL", "0x0d500B1d8E8eF31E21C99d1Db9A6444d3ADf1270"),
+    "bsc": ("BNB", "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"),
+    "arbitrum": ("ETH", "0x82aF49447D8a07e3bd95BD0d56f35241523fBab1"),
+    "optimism": ("ETH", "0x4200000000000000000000000000000000000006"),
+}
+MAX_CHAINS = 6
+HORIZON_MONTHS_MAX = 60    # /recommend, /recommend/sweep and recommend jobs
+# chain slices at least this large are ranked in a worker process instead of inline
+RANK_PROCESS_MIN_ROWS = int(os.getenv("RANK_PROCESS_MIN_ROWS", "5000"))
+RANK_PROCESS_WORKERS = int(os.getenv("RANK_PROCESS_WORKERS", "2"))
+
+# pool history ingestion (APY sigma from our own history where DeFiLlama has no sigma; see history.py)
+HISTORY_INGEST_ENABLED = os.getenv("HISTORY_INGEST_ENABLED", "true").lower() in {"1","true","yes","on"}
+HISTORY_MAX_POOLS = int(os.getenv("HISTORY_MAX_POOLS", "400"))
+HISTORY_MIN_TVL = float(os.getenv("HISTORY_MIN_TVL", "100000"))
+
+# (chain, risk, horizon) rankings kept up to date incrementally on every universe refresh
+RANK_PRECOMPUTE_CHAINS = [c.strip().lower() for c in os.getenv("RANK_PRECOMPUTE_CHAINS", CHAIN_DEFAULT).split(",") if c.strip()]
+RANK_PRECOMPUTE_HORIZONS = [3, 6, 9, 12]
+
 # OpenAI
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini").strip()
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "").strip() or None  # e.g. a local stand-in server
+NARRATIVE_CONCURRENCY = int(os.getenv("NARRATIVE_CONCURRENCY", "4"))
+NARRATIVE_TIMEOUT = float(os.getenv("NARRATIVE_TIMEOUT", "20"))
+NARRATIVE_CACHE_TTL = int(os.getenv("NARRATIVE_CACHE_TTL", "3600"))
+NARRATIVE_CACHE_MAX = int(os.getenv("NARRATIVE_CACHE_MAX", "512"))
 INCLUDE_NARRATIVE_DEFAULT = os.getenv("INCLUDE_NARRATIVE_DEFAULT", "false").lower() in {"1","true","yes","on"}
 
 router = APIRouter(prefix="", tags=["defillama"])
@@ -26,18 +78,33 @@ router = APIRouter(prefix="", tags=["defillama"])
 # OpenAI LLM integration
 # =========================
 _client = None
-def _get_openai_client() -> Optional[OpenAI]:
+def _get_openai_client() -> Optional[AsyncOpenAI]:
     global _client
     if _client is not None:
         return _client
     if not OPENAI_API_KEY:
         return None
     try:
-        _client = OpenAI(api_key=OPENAI_API_KEY)
+        _client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL,
+                              timeout=NARRATIVE_TIMEOUT, max_retries=1,
+                              http_client=get_client("openai", timeout=NARRATIVE_TIMEOUT, headers={}))
         return _client
     except Exception:
         return None
 
+# content-addressed narrative cache: sha256(model | prompt) -> text (shared across workers with CACHE_BACKEND=sqlite)
+_narrative_cache = open_cache("narrative", max_items=NARRATIVE_CACHE_MAX)
+
+def _narrative_key(prompt: str) -> str:
+    return hashlib.sha256(f"{OPENAI_MODEL}\n{prompt}".encode("utf-8")).hexdigest()
+
+def _narrative_cache_get(key: str) -> Optional[str]:
+    hit, text = _narrative_cache.get(key, max_age=NARRATIVE_CACHE_TTL)
+    return text if hit else None
+
+def _narrative_cache_set(key: str, text: str):
+    _narrative_cache.set(key, text)
+
 def _risk_label(period_return_pct: float, downside_period: float) -> str:
     pr = period_return_pct or 0.0
     ds = downside_period or 0.0
@@ -62,10 +129,16 @@ def _build_narrative_prompt(row: Dict[str, Any], inputs: Dict[str, Any]) -> str:
     profit_usd = row.get("profitUsd")
     url = row.get("url") or ""
 
+    chain_name = row.get("chain") or "Avalanche"
+    native_sym = row.get("nativeSymbol")
+    profit_native = row.get("profitNative")
+
     usd_tail = f" (~${profit_usd:,.2f})" if isinstance(profit_usd, (int, float)) else ""
+    if native_sym and native_sym != "AVAX" and isinstance(profit_native, (int, float)):
+        usd_tail += f" ≈ {profit_native} {native_sym}"
     return f"""
 You are a helpful, concise investment explainer for DeFi pools. Write 1 short paragraph (120–160 words).
-Audience: a crypto user deciding where to deploy LP capital on Avalanche.
+Audience: a crypto user deciding where to deploy LP capital on {chain_name}.
 
 INPUTS
 - User amount: {inputs.get('amountAvax')} AVAX
@@ -94,40 +167,106 @@ TASK
 - End with a one-sentence disclaimer: “Not financial advice.”
 """
 
+def _narrative_messages(prompt: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": "You are a concise DeFi investment explainer."},
+        {"role": "user", "content": prompt}
+    ]
+
+async def _narrative_text(client: AsyncOpenAI, prompt: str, sem: asyncio.Semaphore) -> str:
+    key = _narrative_key(prompt)
+    cached = _narrative_cache_get(key)
+    if cached is not None:
+        return cached
+    try:
+        async with sem:
+            resp = await asyncio.wait_for(
+                client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    temperature=0.4,
+                    messages=_narrative_messages(prompt),
+                ),
+                timeout=NARRATIVE_TIMEOUT,
+            )
+        text = (resp.choices[0].message.content or "").strip()
+    except asyncio.TimeoutError:
+        return f"(Narrative unavailable: timed out after {NARRATIVE_TIMEOUT:g}s)"
+    except Exception as e:
+        return f"(Narrative unavailable: {e})"
+    if text:
+        _narrative_cache_set(key, text)
+    return text
+
+async def _stream_narrative(client: AsyncOpenAI, prompt: str, sem: asyncio.Semaphore):
+    """Yield narrative text chunks as the model produces them (whole text at once on cache hit)."""
+    key = _narrative_key(prompt)
+    cached = _narrative_cache_get(key)
+    if cached is not None:
+        yield cached
+        return
+    parts: List[str] = []
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + NARRATIVE_TIMEOUT      # whole call: connect + every chunk
+    try:
+        async with sem:
+            stream = await asyncio.wait_for(
+                client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    temperature=0.4,
+                    messages=_narrative_messages(prompt),
+                    stream=True,
+                ),
+                timeout=NARRATIVE_TIMEOUT,
+            )
+            # each read gets what is left of the deadline; a timeout scope around the whole
+            # loop would also span our yields and could cancel the consumer instead
+            chunks = stream.__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, deadline - loop.time()))
+                    except StopAsyncIteration:
+                        break
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            finally:
+                await stream.close()
+    except asyncio.TimeoutError:
+        yield f"(Narrative unavailable: timed out after {NARRATIVE_TIMEOUT:g}s)"
+        return
+    except Exception as e:
+        yield f"(Narrative unavailable: {e})"
+        return
+    text = "".join(parts).strip()
+    if text:
+        _narrative_cache_set(key, text)
+
 async def _generate_narrative_for_rows(rows: List[Dict[str, Any]], inputs: Dict[str, Any]) -> List[Dict[str, Any]]:
     client = _get_openai_client()
     if client is None:
         return []
-    out = []
-    for row in rows:
-        prompt = _build_narrative_prompt(row, inputs)
-        try:
-            resp = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                temperature=0.4,
-                messages=[
-                    {"role": "system", "content": "You are a concise DeFi investment explainer."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            text = (resp.choices[0].message.content or "").strip()
-        except Exception as e:
-            text = f"(Narrative unavailable: {e})"
-        out.append({
+    sem = asyncio.Semaphore(max(1, NARRATIVE_CONCURRENCY))
+    texts = await asyncio.gather(*[
+        _narrative_text(client, _build_narrative_prompt(row, inputs), sem) for row in rows
+    ])
+    return [
+        {
             "pool": row.get("pool"),
             "project": row.get("project"),
             "symbol": row.get("symbol"),
             "text": text
-        })
-    return out
+        }
+        for row, text in zip(rows, texts)
+    ]
 
 # =========================
 # Existing helpers & logic
 # =========================
-def _best_match(pools: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
-    if not pools:
-        return None
-    return sorted(pools, key=lambda p: float(p.get("tvlUsd") or 0.0), reverse=True)[0]
+def _best_match(cols: PoolColumns, rows) -> Optional[Dict[str, Any]]:
+    i = cols.argmax_tvl(rows)
+    return cols.pools[i] if i is not None else None
 
 def _coins_key(chain: str, token_addr: str) -> Optional[str]:
     if not token_addr:
@@ -143,54 +282,136 @@ def _coins_key(chain: str, token_addr: str) -> Optional[str]:
     }.get(chain.lower(), chain.lower())
     return f"{chain_key}:{token_addr.lower()}"
 
-async def _fetch_llama_pools(chain: str, project: Optional[str], search: Optional[str]) -> List[Dict[str, Any]]:
-    params = {}
-    if chain: params["chain"] = chain
-    if project: params["project"] = project
-    if search: params["search"] = search
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(LLAMA_YIELDS, params=params)
-        if r.status_code >= 400:
-            raise HTTPException(status_code=r.status_code, detail=r.text)
-        data = r.json()
+async def _fetch_llama_pools() -> List[Dict[str, Any]]:
+    # full universe; chain/project/search are resolved locally against the cached snapshot
+    r = await get_client().get(LLAMA_YIELDS, timeout=30)
+    if r.status_code >= 400:
+        raise HTTPException(status_code=r.status_code, detail=r.text)
+    data = r.json()
     pools = data.get("data", data)
     return pools if isinstance(pools, list) else []
 
+# ---------------- pool history -> sigma index ----------------
+_sigma_index = SigmaIndex()
+_history_ingester: Optional[PoolHistoryIngester] = None
+
+def _apply_sigma(pools: List[PoolRecord]) -> List[str]:
+    changed: List[str] = []
+    for p in pools:
+        sigma = _sigma_index.get(p.pool)
+        if sigma != p.sigmaApy and p.pool:
+            changed.append(p.pool)
+        p.sigmaApy = sigma
+    return changed
+
+async def _fetch_universe_pools() -> List[PoolRecord]:
+    # compact records instead of the raw ~35-key dicts (see records.py)
+    if _universe.shared is not None and _history_ingester is not None and not _history_lock_held():
+        await _history_ingester.load_index()    # another worker ingests; read its sigmas from the store
+    pools = [PoolRecord.from_dict(p) for p in await _fetch_llama_pools() if isinstance(p, dict)]
+    _apply_sigma(pools)
+    return pools
+
+# fields read by _score_pool / _pool_style / dedupe: a refresh only rescores pools where one of these moved
+SCORE_FIELDS = [
+    "chain", "project", "symbol", "category", "tvlUsd", "apy", "apyMean30d", "apyPct7D", "apyReward",
+    "volumeUsd7d", "predictedProbability", "sigma", "sigmaApy", "exposure", "ilRisk", "stablecoin",
+]
+
+# SHARED_SNAPSHOT_DIR set: workers share one mmapped universe file and one upstream fetch per refresh
+_universe = PoolUniverse(_fetch_universe_pools, diff_fields=SCORE_FIELDS, shared=open_shared_store())
+_history_lock: Optional[FileLock] = None
+
+async def prewarm_universe():
+    """Pre-warmer job: refresh the pool snapshot shortly before its TTL so /recommend never waits on /pools."""
+    if _universe.due(PREWARM_AHEAD):
+        await _universe.refresh()
+
+def _history_lock_held() -> bool:
+    return _history_lock is not None and _history_lock.held
+
+def _may_ingest() -> bool:
+    return _history_lock is None or _history_lock.try_acquire()
+
+async def _fetch_pool_chart(pool_id: str) -> List[Dict[str, Any]]:
+    r = await get_client().get(f"{LLAMA_YIELDS_CHART}/{pool_id}", timeout=30)
+    r.raise_for_status()
+    data = (r.json() or {}).get("data")
+    return data if isinstance(data, list) else []
+
+async def _history_candidates() -> List[str]:
+    snap = await _universe.get()
+    rows = snap.select_chains(list(NATIVE_TOKENS))
+    rows = np.concatenate(list(rows.values())) if rows else np.empty(0, dtype=np.int64)
+    rows = rows[snap.columns.tvl[rows] >= HISTORY_MIN_TVL]
+    rows = snap.columns.by_tvl(rows)[:HISTORY_MAX_POOLS]
+    return [snap.columns.ids[int(i)] for i in rows if snap.columns.ids[int(i)]]
+
+async def _on_sigma_update(index: SigmaIndex):
+    if _universe.shared is not None:
+        # shared records are read-only: republish the current file with the sigmas applied (no /pools fetch)
+        await _universe.republish(_apply_sigma)
+        return
+    snap = _universe.snapshot
+    if snap is not None:
+        changed = _apply_sigma(snap.columns.pools)
+        if changed and _ranker.ready(snap.version):
+            _ranker.rescore(changed)
+
+def start_history_ingest():
+    global _history_ingester, _history_lock
+    if not HISTORY_INGEST_ENABLED or _history_ingester is not None:
+        return
+    if _universe.shared is not None:
+        _history_lock = FileLock(os.path.join(_universe.shared.dir, "history.lock"))
+    _history_ingester = PoolHistoryIngester(
+        PoolHistoryStore(), _sigma_index, _fetch_pool_chart, _history_candidates,
+        on_update=_on_sigma_update, should_run=_may_ingest,
+    )
+    with background("history"):
+        _history_ingester.start()
+
+async def stop_history_ingest():
+    global _history_ingester, _history_lock
+    if _history_ingester is not None:
+        await _history_ingester.stop()
+        _history_ingester.store.close()
+        _history_ingester = None
+    if _history_lock is not None:
+        _history_lock.release()
+        _history_lock = None
+
+async def _fetch_coin_prices(coin_keys: List[str]) -> Dict[str, float]:
+    # one coins.llama.fi request for a whole PriceLoader batch; raises so failures aren't cached
+    url = f"{LLAMA_PRICES}/" + ",".join(coin_keys)
+    r = await get_client().get(url, timeout=15)
+    r.raise_for_status()
+    coins_map = (r.json() or {}).get("coins", {})
+    out: Dict[str, float] = {}
+    for coin_key, info in coins_map.items():
+        price = (info or {}).get("price")
+        if isinstance(price, (int, float)):
+            out[coin_key.lower()] = float(price)
+    return out
+
+_price_loader = PriceLoader(_fetch_coin_prices, cache=open_cache("prices"), last_good=open_cache("prices.lastgood"))
+
 async def _fetch_prices_usd(chain: str, token_addresses: List[str]) -> Dict[str, float]:
     coins = []
     for addr in token_addresses:
         key = _coins_key(chain, addr)
         if key: coins.append(key)
     if not coins: return {}
-    url = f"{LLAMA_PRICES}/" + ",".join(coins)
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(url)
-        if r.status_code >= 400:
-            return {}
-        payload = r.json() or {}
-    coins_map = payload.get("coins", {})
+    with span("token_prices"):
+        prices = await _price_loader.load_many(coins)
     out: Dict[str, float] = {}
-    for coin_key, info in coins_map.items():
-        addr = coin_key.split(":", 1)[-1].lower()
-        price = info.get("price")
-        if isinstance(price, (int, float)):
-            out[addr] = float(price)
+    for coin_key, price in prices.items():
+        if price is not None:
+            out[coin_key.split(":", 1)[-1]] = price
     return out
 
 async def _fetch_avax_usd_price() -> Optional[float]:
-    key = f"avax:{WAVAX_ADDR.lower()}"
-    url = f"{LLAMA_PRICES}/{key}"
-    try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            r = await client.get(url)
-            if r.status_code >= 400:
-                return None
-            coins = (r.json() or {}).get("coins", {})
-            info = coins.get(key)
-            price = (info or {}).get("price")
-            return float(price) if isinstance(price, (int, float)) else None
-    except Exception:
-        return None
+    return await _price_loader.load(f"avax:{WAVAX_ADDR.lower()}")
 
 def _profitability_view(pool: Dict[str, Any]) -> Dict[str, Any]:
     apy = pool.get("apy")
@@ -217,7 +438,8 @@ def _clamp(x: float, lo: float = 0.0, hi: float = 1.0) -> float:
     return max(lo, min(hi, x))
 
 def _sigmoid(x: float) -> float:
-    return 1.0 / (1.0 + math.exp(-x))
+    # clamp: math.exp overflows past ~709 (extreme negative period returns on outlier pools)
+    return 1.0 / (1.0 + math.exp(min(-x, 700.0)))
 
 RISK_PRESETS = {
     "conservative": {
@@ -277,16 +499,22 @@ def _pool_style(pool: Dict[str, Any]) -> str:
     return "volatile"
 
 def _monthly_vol_guess(pool: Dict[str, Any]) -> float:
-    if pool.get("sigma") is not None:
-        try:
-            return max(0.02, float(pool["sigma"]))
-        except Exception:
-            pass
+    # DeFiLlama's sigma, else the same APY sigma from our own history, else the per-asset guesses
+    for key in ("sigma", "sigmaApy"):
+        if _is_number(pool.get(key)):
+            return max(0.02, float(pool[key]))
     if pool.get("stablecoin"): return 0.03
     sym = (pool.get("symbol") or "").upper()
     if any(x in sym for x in ["BTC","WBTC","ETH","WETH"]): return 0.40
     return 0.80
 
+def _annual_vol(pool: Dict[str, Any]) -> Optional[float]:
+    # downside term: APY sigma from our pool history when we have it, else DeFiLlama's (same quantity)
+    raw = pool.get("sigmaApy")
+    if not _is_number(raw):
+        raw = pool.get("sigma")
+    return float(raw) if _is_number(raw) else None
+
 def _apy_forward(pool: Dict[str, Any]) -> float:
     apy = float(pool.get("apy") or 0.0)
     apy30 = float(pool.get("apyMean30d") or apy)
@@ -317,18 +545,25 @@ def _is_number(x) -> bool:
     except (TypeError, ValueError):
         return False
 
-def _score_pool(pool: Dict[str, Any], amount_avax: float, horizon_months: int, risk: str) -> Optional[Dict[str, Any]]:
+def _predicted_probability(pool) -> Any:
+    # PoolRecord keeps it flat; raw DeFiLlama dicts nest it under 'predictions'
+    if isinstance(pool, PoolRecord):
+        return pool.predictedProbability
+    return (pool.get("predictions") or {}).get("predictedProbability")
+
+def _score_pool(pool: Dict[str, Any], amount_avax: float, horizon_months: int, risk: str,
+                chain: str = "avalanche") -> Optional[Dict[str, Any]]:
     rp = RISK_PRESETS[risk]
     tvl = float(pool.get("tvlUsd") or 0.0)
 
-    if (pool.get("chain") or "").lower() != "avalanche":
+    if (pool.get("chain") or "").lower() != chain:
         return None
 
     vol7d_raw = pool.get("volumeUsd7d")
     vol7d = float(vol7d_raw) if _is_number(vol7d_raw) else 0.0
     throughput = _clamp((vol7d / (tvl*7.0)) if tvl > 0 and vol7d > 0 else 0.0, 0, 1)
 
-    pred_prob = (pool.get("predictions") or {}).get("predictedProbability")
+    pred_prob = _predicted_probability(pool)
     conf = _clamp((float(pred_prob)/80.0) if _is_number(pred_prob) else 0.5, 0.0, 1.0)
 
     apy_fwd = _apy_forward(pool)
@@ -342,8 +577,8 @@ def _score_pool(pool: Dict[str, Any], amount_avax: float, horizon_months: int, r
     r_annual = apy_net / 100.0
     period_return = (1.0 + r_annual/12.0) ** max(1, horizon_months) - 1.0
 
-    downside_raw = pool.get("sigma")
-    downside_annual = float(downside_raw) if _is_number(downside_raw) else rp["vol_floor"]
+    downside_raw = _annual_vol(pool)
+    downside_annual = downside_raw if downside_raw is not None else rp["vol_floor"]
     downside_annual = max(rp["vol_floor"], downside_annual)
     downside_period = downside_annual * (max(1, horizon_months) / 12.0) ** 0.5
 
@@ -479,15 +714,7 @@ def _relax_tvl_floor(base_floor: float, relax_level: int) -> float:
     f = factors[relax_level] if relax_level < len(factors) else 0.0
     return base_floor * f
 
-def _rank_topN(pools: List[Dict[str, Any]], amount_avax: float, horizon_months: int, risk: str, topN: int) -> List[Dict[str, Any]]:
-    if topN <= 0: return []
-    scored: List[Dict[str, Any]] = []
-    for p in pools:
-        s = _score_pool(p, amount_avax, horizon_months, risk)
-        if s: scored.append(s)
-
-    ranked = _topsis_rank(scored, risk)
-
+def _diversify(ranked: List[Dict[str, Any]], topN: int) -> List[Dict[str, Any]]:
     diversified: List[Dict[str, Any]] = []
     seen_proj: Set[str] = set()
     for row in ranked:
@@ -507,16 +734,262 @@ def _rank_topN(pools: List[Dict[str, Any]], amount_avax: float, horizon_months:
                     break
     return diversified[:topN]
 
-@router.get("/llama/pools", summary="List pools from DeFiLlama (filterable)")
+def _rank_topN(pools: List[Dict[str, Any]], amount_avax: float, horizon_months: int, risk: str, topN: int,
+               chain: str = "avalanche") -> List[Dict[str, Any]]:
+    if topN <= 0: return []
+    scored: List[Dict[str, Any]] = []
+    with span("score"):
+        for p in pools:
+            s = _score_pool(p, amount_avax, horizon_months, risk, chain)
+            if s: scored.append(s)
+
+    with span("topsis"):
+        ranked = _topsis_rank(scored, risk)
+    return _diversify(ranked, topN)
+
+async def _gather_or_cancel(*aws):
+    """
+    Run independent stages concurrently. The first failure cancels the siblings
+    and is re-raised unwrapped (so HTTPException still maps to its status code).
+    """
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(a) for a in aws]
+    except BaseExceptionGroup as eg:
+        raise eg.exceptions[0]
+    return [t.result() for t in tasks]
+
+def _rank_chain_slice(pools_all: List[Dict[str, Any]], chain: str, amount_avax: float, horizon_months: int,
+                      risk: str, topN: int) -> Tuple[List[Dict[str, Any]], float]:
+    # module-level so large slices can be shipped to the process pool
+    base_floor = float(RISK_PRESETS[risk]["min_tvl_usd"])
+    results: List[Dict[str, Any]] = []
+    tvl_floor_used = base_floor
+    for relax in range(0, 5):
+        tvl_floor = _relax_tvl_floor(base_floor, relax)
+        tvl_floor_used = tvl_floor
+        candidates = [
+            p for p in pools_all
+            if (p.get("chain") or "").lower() == chain
+            and float(p.get("tvlUsd") or 0.0) >= tvl_floor
+        ]
+        results = _rank_topN(candidates, amount_avax, horizon_months, risk, topN=topN, chain=chain)
+        if len(results) >= topN:
+            break
+    for row in results:
+        row["tvlFloorApplied"] = tvl_floor_used
+    return results, tvl_floor_used
+
+_rank_executor: Optional[ProcessPoolExecutor] = None
+
+def _get_rank_executor() -> ProcessPoolExecutor:
+    global _rank_executor
+    if _rank_executor is None:
+        _rank_executor = ProcessPoolExecutor(max_workers=max(1, RANK_PROCESS_WORKERS))
+    return _rank_executor
+
+def close_rank_executor():
+    global _rank_executor
+    if _rank_executor is not None:
+        _rank_executor.shutdown(wait=False, cancel_futures=True)
+        _rank_executor = None
+
+def _slice_pools(snap: PoolSnapshot, rows: np.ndarray, limit_fetch: int) -> List[Dict[str, Any]]:
+    rows = snap.columns.by_tvl(rows)
+    return _dedupe_by_project_symbol(snap.columns.take(rows))[:limit_fetch]
+
+# ---------------- precomputed rankings, updated from snapshot deltas ----------------
+def _rank_vector(pool: Dict[str, Any], horizon_months: int, risk: str, chain: str) -> Optional[List[float]]:
+    # TOPSIS criteria in _topsis_rank order, then [Score, RAR]; amount doesn't affect any of them
+    s = _score_pool(pool, 1.0, horizon_months, risk, chain)
+    if not s:
+        return None
+    return [s["periodReturnPct"], s["tvlUsd"], s["throughput"], s["conf"], s["downsidePeriod"],
+            s["why"]["ilPenaltyPctPts"], s["Score"], s["RAR"]]
+
+def _mcda_weights(risk: str) -> List[float]:
+    w = MCDA_WEIGHTS[risk]
+    total = sum(w.values())
+    keys = ["periodReturnPct", "tvlUsd", "throughput", "conf", "downsidePeriod", "ilPenaltyPctPts"]
+    return [w[k] / total if total > 0 else 0.0 for k in keys]
+
+_ranker = IncrementalRanker(
+    chains=RANK_PRECOMPUTE_CHAINS,
+    risks=list(RISK_PRESETS),
+    horizons=RANK_PRECOMPUTE_HORIZONS,
+    score_fn=_rank_vector,
+    floor_fn=lambda r: RISK_PRESETS[r]["min_tvl_usd"],
+    weights_fn=_mcda_weights,
+    benefit=[True, True, True, True, False, False],
+)
+_universe.subscribe(_ranker.apply)
+
+def _rank_precomputed(snap: PoolSnapshot, chain: str, project: Optional[str], limit_fetch: int,
+                      amount_avax: float, horizon_months: int, risk: str, topN: int) -> Optional[Tuple[int, List[Dict[str, Any]], float]]:
+    """
+    Serve a chain slice from _ranker when it provably equals _rank_chain_slice: no project filter,
+    at least topN pools over the base TVL floor (no relaxation) and all of them inside limit_fetch.
+    """
+    if project or not _ranker.ready(snap.version):
+        return None
+    k = _ranker.members(chain, risk, horizon_months)
+    if k < topN or k > limit_fetch:
+        return None
+    ranked = _ranker.ranked(chain, risk, horizon_months)
+    if ranked is None:
+        return None
+    pids, cc = ranked
+    rows = [{"pid": pid, "cc": float(c), "project": (_ranker.pool(pid).get("project") or "").lower()}
+            for pid, c in zip(pids, cc)]
+    floor = float(RISK_PRESETS[risk]["min_tvl_usd"])
+    results: List[Dict[str, Any]] = []
+    for pick in _diversify(rows, topN):
+        row = _score_pool(_ranker.pool(pick["pid"]), amount_avax, horizon_months, risk, chain)
+        row["topsisScore"] = round(pick["cc"], 6)
+        row["tvlFloorApplied"] = floor
+        results.append(row)
+    return min(_ranker.bucket_count(chain), limit_fetch), results, floor
+
+async def _rank_universe(snap: PoolSnapshot, chains: List[str], project: Optional[str], limit_fetch: int,
+                         amount_avax: float, horizon_months: int, risk: str, topN: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    # search hits always fall inside the broad chain/project slice, so the merged
+    # universe is that slice (already de-duplicated by pool id in the snapshot)
+    check_deadline("ranking")     # CPU work nobody will wait for is not started
+    t0 = time.perf_counter()
+    slices = snap.select_chains(chains, project)
+    loop = asyncio.get_running_loop()
+
+    per_chain: Dict[str, Any] = {}
+    args_by_chain: Dict[str, tuple] = {}
+    local: Dict[str, Tuple[List[Dict[str, Any]], float]] = {}
+    for chain in chains:
+        fast = _rank_precomputed(snap, chain, project, limit_fetch, amount_avax, horizon_months, risk, topN)
+        if fast is not None:
+            per_chain[chain] = {"universeCount": fast[0]}
+            local[chain] = (fast[1], fast[2])
+            continue
+        pools_all = _slice_pools(snap, slices.get(chain, np.empty(0, dtype=np.int64)), limit_fetch)
+        per_chain[chain] = {"universeCount": len(pools_all)}
+        args_by_chain[chain] = (pools_all, chain, amount_avax, horizon_months, risk, topN)
+
+    # large slices go to worker processes first, small ones are ranked inline meanwhile
+    remote = {
+        c: loop.run_in_executor(_get_rank_executor(), _rank_chain_slice, *args)
+        for c, args in args_by_chain.items() if len(args[0]) >= RANK_PROCESS_MIN_ROWS
+    }
+    local.update({c: _rank_chain_slice(*args) for c, args in args_by_chain.items() if c not in remote})
+    if remote:
+        local.update(zip(remote.keys(), await asyncio.gather(*remote.values())))
+    ranked = [local[c] for c in chains]
+
+    merged: List[Dict[str, Any]] = []
+    for chain, (rows, tvl_floor_used) in zip(chains, ranked):
+        per_chain[chain]["tvlFloorUsed"] = tvl_floor_used
+        merged.extend(rows)
+    if len(chains) > 1:
+        # per-chain TOPSIS scores are relative to their own slice; re-rank the finalists together
+        merged = _diversify(_topsis_rank(merged, risk), topN)
+    elapsed = time.perf_counter() - t0
+    RANK_SECONDS.labels("full" if args_by_chain else "precomputed").observe(elapsed)
+    record("rank", elapsed)
+    return per_chain, merged
+
+def _parse_chains(chain: str, chains: Optional[str]) -> List[str]:
+    out: List[str] = []
+    for c in (chains.split(",") if chains else [chain]):
+        c = c.strip().lower()
+        if c and c not in out:
+            out.append(c)
+    if not out:
+        raise HTTPException(status_code=400, detail="at least one chain is required")
+    if len(out) > MAX_CHAINS:
+        raise HTTPException(status_code=400, detail=f"at most {MAX_CHAINS} chains per request")
+    return out
+
+async def _fetch_native_usd_prices(chains: List[str]) -> Dict[str, Optional[float]]:
+    # AVAX is always needed (amounts are AVAX-denominated); all natives go out in one batch
+    keys = {"avalanche": _coins_key("avalanche", WAVAX_ADDR)}
+    for c in chains:
+        if c in NATIVE_TOKENS:
+            keys[c] = _coins_key(c, NATIVE_TOKENS[c][1])
+    with span("native_price"):
+        prices = await _price_loader.load_many(keys.values())
+    return {c: prices.get(k) for c, k in keys.items()}
+
+# ---------------- /llama/pools cursors ----------------
+# opaque base64(JSON): snapshot version, a hash of the query, and the (sort value, pool id) key of the
+# last row served. Keyset, so a cursor keeps working after a refresh (rows that moved may shift pages).
+POOL_FIELDS = (set(PoolRecord.__slots__) - set(PREDICTION_FIELDS)) | {"predictions"}
+
+def _pools_query_hash(chain: str, project: Optional[str], search: Optional[str], sort: str, order: str) -> str:
+    raw = json.dumps([chain.lower(), (project or "").lower(), (search or "").lower(), sort, order])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+def _encode_cursor(version: int, qhash: str, key: Tuple[float, str]) -> str:
+    raw = json.dumps({"v": version, "q": qhash, "k": [key[0], key[1]]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str, qhash: str) -> Tuple[float, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        val, pid = data["k"]
+        key = (float(val), str(pid))
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    if data.get("q") != qhash:
+        raise HTTPException(status_code=400, detail="cursor belongs to a different query (filters/sort changed)")
+    return key
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    out = ["pool"]
+    for f in fields.split(","):
+        f = f.strip()
+        if not f or f in out:
+            continue
+        if f not in POOL_FIELDS:
+            raise HTTPException(status_code=400, detail=f"unknown field '{f}'")
+        out.append(f)
+    return out
+
+@router.get("/llama/pools", summary="List pools from DeFiLlama (filterable, sortable, cursor-paginated)")
 async def list_pools(
     chain: str = Query(CHAIN_DEFAULT, description="E.g., avalanche"),
     project: Optional[str] = Query(None, description="E.g., trader-joe, pangolin"),
     search: Optional[str] = Query(None, description="Search text, e.g., WAVAX or WAVAX/USDC"),
     limit: int = Query(10, ge=1, le=100),
+    sort: str = Query("tvlUsd", description="'tvlUsd' | 'apy' | 'apyMean30d'"),
+    order: str = Query("desc", description="'desc' | 'asc'"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. 'symbol,tvlUsd,apy' (pool id always included)"),
+    cursor: Optional[str] = Query(None, description="nextCursor from the previous page"),
 ):
-    pools = await _fetch_llama_pools(chain=chain, project=project, search=search)
-    pools = pools[:limit]
-    return {"count": len(pools), "results": pools}
+    if sort not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_COLUMNS)}")
+    order = order.lower()
+    if order not in ("desc", "asc"):
+        raise HTTPException(status_code=400, detail="order must be 'desc' or 'asc'")
+    keep = _parse_fields(fields)
+    qhash = _pools_query_hash(chain, project, search, sort, order)
+    after = _decode_cursor(cursor, qhash) if cursor else None
+
+    with span("pools"):
+        snap = await _universe.get()
+    cols = snap.columns
+    rows, more = cols.page(snap.select(chain, project, search), sort, order == "desc", after, limit)
+    pools = [p.to_dict() for p in cols.take(rows)]
+    if keep is not None:
+        pools = [{k: p.get(k) for k in keep} for p in pools]
+    next_cursor = _encode_cursor(snap.version, qhash, cols.sort_key(sort, int(rows[-1]))) if more else None
+    return {
+        "count": len(pools),
+        "results": pools,
+        "sort": sort,
+        "order": order,
+        "version": snap.version,
+        "nextCursor": next_cursor,
+    }
 
 @router.get("/llama/lp", summary="Get a single best-match LP with APY/TVL/Prices")
 async def get_lp(
@@ -524,10 +997,12 @@ async def get_lp(
     chain: str = Query(CHAIN_DEFAULT),
     project: Optional[str] = Query(None, description="Optionally restrict to a protocol (e.g., trader-joe, pangolin)"),
 ):
-    pools = await _fetch_llama_pools(chain=chain, project=project, search=query)
-    if not pools:
+    with span("pools"):
+        snap = await _universe.get()
+    rows = snap.select(chain, project, query)
+    if rows.size == 0:
         raise HTTPException(status_code=404, detail=f"No pools found on {chain} for '{query}'")
-    pool = _best_match(pools)
+    pool = _best_match(snap.columns, rows)
     if not pool:
         raise HTTPException(status_code=404, detail="No suitable pool returned by DeFiLlama")
     underlying = pool.get("underlyingTokens") or []
@@ -565,91 +1040,232 @@ async def get_lp(
         },
         "source": "DeFiLlama Yields + Coin Prices",
     }
-    return result
+    return flag_stale(result)
 
-@router.get("/recommend", summary="Top N Avalanche pools for your amount/horizon/risk (MCDA/TOPSIS)")
-async def recommend(
-    amountAvax: float = Query(..., gt=0, description="Amount you plan to invest, in AVAX units"),
-    horizonMonths: int = Query(..., description="3, 6, 9, or 12"),
-    riskTolerance: str = Query(..., description="'conservative' | 'moderate' | 'aggressive'"),
-    project: Optional[str] = Query(None, description="Optionally restrict to protocol (e.g., trader-joe, pangolin, aave-v3, benqi)"),
-    search: Optional[str] = Query(None, description="Optional DeFiLlama search text"),
-    chain: str = Query(CHAIN_DEFAULT, description="Defaults to 'avalanche'"),
-    limitFetch: int = Query(600, ge=50, le=2000, description="How many pools to fetch before ranking"),
-    topN: int = Query(2, ge=1, le=5, description="How many results to return (default 2)"),
-    includeNarrative: bool = Query(None, description="If true, uses OpenAI to add a paragraph per result"),
-):
-    # allow .env default when includeNarrative is omitted
-    if includeNarrative is None:
-        includeNarrative = INCLUDE_NARRATIVE_DEFAULT
-
-    risk = (riskTolerance or "moderate").lower()
-    if risk not in RISK_PRESETS:
-        raise HTTPException(status_code=400, detail="riskTolerance must be conservative|moderate|aggressive")
+def sse_event(event: str, data: Any) -> str:
+    """One Server-Sent Events frame (also used by the job event stream)."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
-    pools_main = await _fetch_llama_pools(chain=chain, project=project, search=search)
-    pools_broad = await _fetch_llama_pools(chain=chain, project=project, search=None) if search else []
-
-    by_id: Dict[str, Dict[str, Any]] = {}
-    for p in (pools_main + pools_broad):
-        pid = p.get("pool")
-        if not pid: continue
-        cur = by_id.get(pid)
-        if cur is None or float(p.get("tvlUsd") or 0.0) > float(cur.get("tvlUsd") or 0.0):
-            by_id[pid] = p
+async def _recommend_events(payload: Dict[str, Any]):
+    yield sse_event("recommendations", payload)
+    rows = payload["topN"]
+    client = _get_openai_client()
+    if client is None or not rows:
+        yield sse_event("done", {})
+        return
 
-    pools_all = list(by_id.values())
-    pools_all.sort(key=lambda x: float(x.get("tvlUsd") or 0.0), reverse=True)
-    pools_all = _dedupe_by_project_symbol(pools_all)[:limitFetch]
+    inputs = _narrative_inputs(payload)
+    sem = asyncio.Semaphore(max(1, NARRATIVE_CONCURRENCY))
+    queue: asyncio.Queue = asyncio.Queue()
 
-    base_floor = float(RISK_PRESETS[risk]["min_tvl_usd"])
-    results: List[Dict[str, Any]] = []
-    tvl_floor_used = base_floor
-    for relax in range(0, 5):
-        tvl_floor = _relax_tvl_floor(base_floor, relax)
-        tvl_floor_used = tvl_floor
-        candidates = [
-            p for p in pools_all
-            if (p.get("chain") or "").lower() == "avalanche"
-            and float(p.get("tvlUsd") or 0.0) >= tvl_floor
-        ]
-        results = _rank_topN(candidates, amountAvax, horizonMonths, risk, topN=topN)
-        if len(results) >= topN:
-            break
-
-    avax_price = await _fetch_avax_usd_price()
+    async def _pump(i: int, row: Dict[str, Any]):
+        parts: List[str] = []
+        try:
+            async for delta in _stream_narrative(client, _build_narrative_prompt(row, inputs), sem):
+                parts.append(delta)
+                await queue.put(("narrative", {"index": i, "pool": row.get("pool"), "delta": delta}))
+        finally:
+            await queue.put(("narrative_end", {
+                "index": i, "pool": row.get("pool"), "project": row.get("project"),
+                "symbol": row.get("symbol"), "text": "".join(parts).strip(),
+            }))
+
+    tasks = [asyncio.create_task(_pump(i, row)) for i, row in enumerate(rows)]
+    try:
+        pending = len(tasks)
+        while pending:
+            event, data = await queue.get()
+            if event == "narrative_end":
+                pending -= 1
+            yield sse_event(event, data)
+        yield sse_event("done", {})
+    finally:
+        # client went away (or we finished): stop any completions still streaming
+        for t in tasks:
+            t.cancel()
+
+def _annotate_profit(results: List[Dict[str, Any]], native_prices: Dict[str, Optional[float]]):
+    avax_price = native_prices.get("avalanche")
     for row in results:
         profit_avax = float(row["amountEndAVAX"]) - float(row["amountStartAVAX"])
         row["profitAvax"] = round(profit_avax, 6)
         row["avaxPriceUsd"] = float(avax_price) if isinstance(avax_price, (int, float)) else None
         row["profitUsd"] = round(profit_avax * float(avax_price), 2) if isinstance(avax_price, (int, float)) else None
-        row["tvlFloorApplied"] = tvl_floor_used
 
-    # Build inputs for the narrative
-    inputs_dict = {
-        "amountAvax": amountAvax,
-        "horizonMonths": horizonMonths,
-        "riskTolerance": risk,
+        row_chain = (row.get("chain") or "").lower()
+        native_sym = NATIVE_TOKENS.get(row_chain, (None, None))[0]
+        native_price = native_prices.get(row_chain)
+        row["nativeSymbol"] = native_sym
+        row["nativePriceUsd"] = float(native_price) if isinstance(native_price, (int, float)) else None
+        row["profitNative"] = (
+            round(row["profitUsd"] / float(native_price), 6)
+            if row["profitUsd"] is not None and isinstance(native_price, (int, float)) and native_price > 0 else None
+        )
+
+# ============================================================
+# Scoring API for other ranking front-ends (sweep.py)
+#   The per-pool inputs _score_pool reads, the scoring itself and the
+#   selection steps of _rank_chain_slice, so a vectorised ranker stays
+#   in step with /recommend without reaching into private helpers.
+# ============================================================
+POOL_STYLES = ("lending", "stable", "derivatives", "farm", "bluechip", "volatile")
+TVL_RELAX_LEVELS = 5
+
+def pool_inputs(pool: Dict[str, Any]) -> Dict[str, Any]:
+    """Horizon/risk-independent inputs of _score_pool for one pool (numbers already defaulted)."""
+    vol7d = pool.get("volumeUsd7d")
+    pred = _predicted_probability(pool)
+    apy = float(pool.get("apy") or 0.0)
+    return {
+        "tvl": float(pool.get("tvlUsd") or 0.0),
+        "volume7d": float(vol7d) if _is_number(vol7d) else 0.0,
+        "conf": _clamp((float(pred) / 80.0) if _is_number(pred) else 0.5, 0.0, 1.0),
+        "apy": apy,
+        "apyMean30d": float(pool.get("apyMean30d") or apy),
+        "apyPct7D": float(pool.get("apyPct7D") or 0.0),
+        "apyReward": float(pool.get("apyReward") or 0.0),
+        "exposure": (pool.get("exposure") or "").lower(),
+        "ilRisk": (pool.get("ilRisk") or "").lower(),
+        "annualVol": _annual_vol(pool),          # None: the risk preset's vol_floor applies
+        "monthlyVol": _monthly_vol_guess(pool),
+        "style": _pool_style(pool),
+        "project": (pool.get("project") or "").lower(),
     }
 
-    explanations: List[Dict[str, Any]] = []
-    if includeNarrative and results:
-        explanations = await _generate_narrative_for_rows(results, inputs_dict)
+def score_pool(pool: Dict[str, Any], amount_avax: float, horizon_months: int, risk: str,
+               chain: str) -> Optional[Dict[str, Any]]:
+    """One /recommend result row (None if the pool is not on `chain`)."""
+    return _score_pool(pool, amount_avax, horizon_months, risk, chain)
+
+def tvl_floor(risk: str, relax_level: int) -> float:
+    """The risk preset's TVL floor after `relax_level` relaxations (0 .. TVL_RELAX_LEVELS-1)."""
+    return _relax_tvl_floor(float(RISK_PRESETS[risk]["min_tvl_usd"]), relax_level)
+
+def diversify(ranked: List[Dict[str, Any]], topN: int) -> List[Dict[str, Any]]:
+    """Top N of a ranked list, one pool per project first."""
+    return _diversify(ranked, topN)
+
+def annotate_profit(rows: List[Dict[str, Any]], native_prices: Dict[str, Optional[float]]):
+    _annotate_profit(rows, native_prices)
+
+async def load_candidates(chain: str, project: Optional[str],
+                          limit_fetch: int) -> Tuple[List[Dict[str, Any]], Dict[str, Optional[float]]]:
+    """(the /recommend candidate slice for one chain, native token prices), loaded concurrently."""
+    async def _pools():
+        with span("pools"):
+            snap = await _universe.get()
+        pools = _slice_pools(snap, snap.select(chain, project), limit_fetch)
+        return [p for p in pools if (p.get("chain") or "").lower() == chain]
+
+    pools, native_prices = await _gather_or_cancel(_pools(), _fetch_native_usd_prices([chain]))
+    return pools, native_prices
+
+async def _recommend_core(amountAvax: float, horizonMonths: int, riskTolerance: str, project: Optional[str],
+                          search: Optional[str], chain: str, limitFetch: int, topN: int,
+                          chains: Optional[str] = None) -> Dict[str, Any]:
+    risk = (riskTolerance or "moderate").lower()
+    if risk not in RISK_PRESETS:
+        raise HTTPException(status_code=400, detail="riskTolerance must be conservative|moderate|aggressive")
+    chain_list = _parse_chains(chain, chains)
+
+    async def _ranking_stage():
+        with span("pools"):
+            snap = await _universe.get()
+        return await _rank_universe(snap, chain_list, project, limitFetch, amountAvax, horizonMonths, risk, topN)
+
+    # universe -> ranking and the native token prices are independent branches; run them together
+    (per_chain, results), native_prices = await _gather_or_cancel(
+        _ranking_stage(),
+        _fetch_native_usd_prices(chain_list),
+    )
+
+    _annotate_profit(results, native_prices)
 
     return {
         "inputs": {
             "amountAvax": amountAvax,
             "horizonMonths": horizonMonths,
             "riskTolerance": risk,
-            "chain": chain,
+            "chain": chain_list[0],
+            "chains": chain_list,
             "project": project,
             "search": search,
             "limitFetch": limitFetch,
             "topN": topN,
-            "includeNarrative": includeNarrative,
         },
-        "universeCount": len(pools_all),
-        "tvlFloorUsed": tvl_floor_used,
+        "universeCount": sum(v["universeCount"] for v in per_chain.values()),
+        "tvlFloorUsed": min(v["tvlFloorUsed"] for v in per_chain.values()),
+        "perChain": per_chain,
         "topN": results,
-        "explanations": explanations,
     }
+
+def _narrative_inputs(payload: Dict[str, Any]) -> Dict[str, Any]:
+    inputs = payload["inputs"]
+    return {
+        "amountAvax": inputs["amountAvax"],
+        "horizonMonths": inputs["horizonMonths"],
+        "riskTolerance": inputs["riskTolerance"],
+    }
+
+@router.get("/recommend", summary="Top N Avalanche pools for your amount/horizon/risk (MCDA/TOPSIS)")
+async def recommend(
+    amountAvax: float = Query(..., gt=0, description="Amount you plan to invest, in AVAX units"),
+    horizonMonths: int = Query(..., ge=1, le=HORIZON_MONTHS_MAX, description="3, 6, 9, or 12"),
+    riskTolerance: str = Query(..., description="'conservative' | 'moderate' | 'aggressive'"),
+    project: Optional[str] = Query(None, description="Optionally restrict to protocol (e.g., trader-joe, pangolin, aave-v3, benqi)"),
+    search: Optional[str] = Query(None, description="Optional DeFiLlama search text"),
+    chain: str = Query(CHAIN_DEFAULT, description="Defaults to 'avalanche'"),
+    chains: Optional[str] = Query(None, description="Comma-separated chains ranked together, e.g. 'avalanche,ethereum,arbitrum' (overrides chain)"),
+    limitFetch: int = Query(600, ge=50, le=2000, description="How many pools to fetch before ranking"),
+    topN: int = Query(2, ge=1, le=5, description="How many results to return (default 2)"),
+    includeNarrative: bool = Query(None, description="If true, uses OpenAI to add a paragraph per result"),
+):
+    # allow .env default when includeNarrative is omitted
+    if includeNarrative is None:
+        includeNarrative = INCLUDE_NARRATIVE_DEFAULT
+    return await build_recommendation(amountAvax, horizonMonths, riskTolerance, project, search, chain, limitFetch,
+                                      topN, chains, includeNarrative)
+
+async def build_recommendation(amountAvax: float, horizonMonths: int, riskTolerance: str, project: Optional[str],
+                               search: Optional[str], chain: str, limitFetch: int, topN: int,
+                               chains: Optional[str], includeNarrative: bool) -> Dict[str, Any]:
+    """The /recommend payload (ranking + optional narrative); shared with the async job API."""
+    payload = await _recommend_core(amountAvax, horizonMonths, riskTolerance, project, search, chain, limitFetch, topN, chains)
+    payload["inputs"]["includeNarrative"] = includeNarrative
+
+    explanations: List[Dict[str, Any]] = []
+    if includeNarrative and payload["topN"]:
+        check_deadline("narrative")
+        with span("narrative"):
+            explanations = await _generate_narrative_for_rows(payload["topN"], _narrative_inputs(payload))
+
+    payload["explanations"] = explanations
+    return flag_stale(payload)
+
+@router.get("/recommend/stream", summary="Same as /recommend, streamed as SSE: ranked rows first, then narrative tokens")
+async def recommend_stream(
+    amountAvax: float = Query(..., gt=0, description="Amount you plan to invest, in AVAX units"),
+    horizonMonths: int = Query(..., ge=1, le=HORIZON_MONTHS_MAX, description="3, 6, 9, or 12"),
+    riskTolerance: str = Query(..., description="'conservative' | 'moderate' | 'aggressive'"),
+    project: Optional[str] = Query(None, description="Optionally restrict to protocol (e.g., trader-joe, pangolin, aave-v3, benqi)"),
+    search: Optional[str] = Query(None, description="Optional DeFiLlama search text"),
+    chain: str = Query(CHAIN_DEFAULT, description="Defaults to 'avalanche'"),
+    chains: Optional[str] = Query(None, description="Comma-separated chains ranked together, e.g. 'avalanche,ethereum,arbitrum' (overrides chain)"),
+    limitFetch: int = Query(600, ge=50, le=2000, description="How many pools to fetch before ranking"),
+    topN: int = Query(2, ge=1, le=5, description="How many results to return (default 2)"),
+):
+    """
+    Events:
+      recommendations  -> the /recommend payload without explanations (sent as soon as ranking is done)
+      narrative        -> {"index", "pool", "delta"} token chunks, rows interleaved as they arrive
+      narrative_end    -> {"index", "pool", "project", "symbol", "text"} full text per row
+      done             -> {}
+    """
+    # rank before opening the stream so validation/upstream errors keep their HTTP status
+    payload = await _recommend_core(amountAvax, horizonMonths, riskTolerance, project, search, chain, limitFetch, topN, chains)
+    payload["inputs"]["includeNarrative"] = True
+    return StreamingResponse(
+        _recommend_events(flag_stale(payload)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
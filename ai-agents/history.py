@@ -0,0 +1,236 @@
+# history.py
+import os
+import time
+import sqlite3
+import asyncio
+import inspect
+import threading
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+POOL_HISTORY_DB = os.getenv("POOL_HISTORY_DB", "pool_history.sqlite3")
+HISTORY_REFRESH_SECS = int(os.getenv("HISTORY_REFRESH_SECS", "21600"))
+HISTORY_MIN_AGE_SECS = int(os.getenv("HISTORY_MIN_AGE_SECS", "43200"))
+HISTORY_CONCURRENCY = int(os.getenv("HISTORY_CONCURRENCY", "4"))
+HISTORY_VOL_WINDOW = int(os.getenv("HISTORY_VOL_WINDOW", "30"))
+HISTORY_MIN_POINTS = int(os.getenv("HISTORY_MIN_POINTS", "8"))
+
+def _parse_ts(x: Any) -> Optional[int]:
+    if isinstance(x, (int, float)):
+        return int(x)
+    if isinstance(x, str) and x:
+        try:
+            return int(datetime.fromisoformat(x.replace("Z", "+00:00")).timestamp())
+        except ValueError:
+            return None
+    return None
+
+# ============================================================
+# Local store (SQLite, append-only per pool)
+# ============================================================
+class PoolHistoryStore:
+    def __init__(self, path: str = POOL_HISTORY_DB):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pool_history ("
+                " pool TEXT NOT NULL, ts INTEGER NOT NULL, apy REAL, tvl REAL,"
+                " PRIMARY KEY (pool, ts)) WITHOUT ROWID"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pool_history_meta ("
+                " pool TEXT PRIMARY KEY, last_ts INTEGER, fetched_at REAL)"
+            )
+            self._db.commit()
+
+    def last_seen(self, pools: List[str]) -> Dict[str, Tuple[int, float]]:
+        """pool -> (last stored ts, last fetch time) for pools we already hold."""
+        out: Dict[str, Tuple[int, float]] = {}
+        with self._lock:
+            for i in range(0, len(pools), 500):
+                chunk = pools[i:i + 500]
+                q = f"SELECT pool, last_ts, fetched_at FROM pool_history_meta WHERE pool IN ({','.join('?' * len(chunk))})"
+                for pool, last_ts, fetched_at in self._db.execute(q, chunk):
+                    out[pool] = (int(last_ts or 0), float(fetched_at or 0.0))
+        return out
+
+    def append(self, pool: str, points: List[Tuple[int, Optional[float], Optional[float]]], last_ts: int):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO pool_history (pool, ts, apy, tvl) VALUES (?, ?, ?, ?)",
+                [(pool, ts, apy, tvl) for ts, apy, tvl in points],
+            )
+            self._db.execute(
+                "INSERT INTO pool_history_meta (pool, last_ts, fetched_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(pool) DO UPDATE SET last_ts = excluded.last_ts, fetched_at = excluded.fetched_at",
+                (pool, last_ts, time.time()),
+            )
+            self._db.commit()
+
+    def tail(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Last `n` APY points of every pool, ordered by (pool, ts)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT pool, apy FROM ("
+                "  SELECT pool, ts, apy, ROW_NUMBER() OVER (PARTITION BY pool ORDER BY ts DESC) AS rn"
+                "  FROM pool_history WHERE apy IS NOT NULL"
+                ") WHERE rn <= ? ORDER BY pool, ts",
+                (n,),
+            ).fetchall()
+        if not rows:
+            return np.empty(0, dtype=object), np.empty(0, dtype=float)
+        pools, apy = zip(*rows)
+        return np.asarray(pools, dtype=object), np.asarray(apy, dtype=float)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+# ============================================================
+# Rolling APY sigma (vectorized over all pools)
+#   The standard deviation of the daily APY (percentage points) over
+#   the last `window` days: the quantity DeFiLlama publishes as `sigma`,
+#   recomputed from our own history so it follows the current regime.
+#   Scoring uses it wherever the upstream sigma is missing, in the IL
+#   penalty as well as the downside term. TVL moves (deposits and
+#   withdrawals) do not enter it.
+# ============================================================
+def rolling_sigma(pools: np.ndarray, apy: np.ndarray, window: int = HISTORY_VOL_WINDOW,
+                  min_points: int = HISTORY_MIN_POINTS) -> Dict[str, float]:
+    """
+    pool -> std of the last `window` daily APY values. `pools`/`apy` must be grouped
+    by pool and time-ordered (see PoolHistoryStore.tail).
+    """
+    if pools.size == 0:
+        return {}
+    ids, starts, counts = np.unique(pools, return_index=True, return_counts=True)
+    width = int(counts.max())
+    # right-align every pool's series into a (P, width) matrix padded with NaN
+    mat = np.full((ids.size, width), np.nan)
+    offs = np.arange(pools.size) - np.repeat(starts, counts) + np.repeat(width - counts, counts)
+    mat[np.repeat(np.arange(ids.size), counts), offs] = apy
+
+    vals = mat[:, -window:]
+    n = np.sum(~np.isnan(vals), axis=1)
+    ok = n >= max(2, min_points)
+    with np.errstate(invalid="ignore"):
+        sigma = np.nanstd(np.where(ok[:, None], vals, 0.0), axis=1, ddof=1)
+    return {str(pid): float(s) for pid, s, good in zip(ids, sigma, ok) if good and np.isfinite(s)}
+
+# ============================================================
+# Background ingester
+#   The yields chart endpoint has no 'since' parameter, so incremental
+#   refresh means: skip pools fetched within HISTORY_MIN_AGE_SECS and
+#   only store points newer than the last one we hold.
+# ============================================================
+class SigmaIndex:
+    def __init__(self):
+        self._by_pool: Dict[str, float] = {}
+        self.updated_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._by_pool)
+
+    def get(self, pool_id: Optional[str]) -> Optional[float]:
+        return self._by_pool.get(pool_id) if pool_id else None
+
+    def replace(self, values: Dict[str, float]):
+        self._by_pool = values
+        self.updated_at = time.time()
+
+class PoolHistoryIngester:
+    def __init__(
+        self,
+        store: PoolHistoryStore,
+        index: SigmaIndex,
+        fetch_chart: Callable[[str], Awaitable[List[Dict[str, Any]]]],
+        candidates: Callable[[], Awaitable[List[str]]],
+        on_update: Optional[Callable[[SigmaIndex], Any]] = None,
+        should_run: Optional[Callable[[], bool]] = None,
+    ):
+        self.store = store
+        self.index = index
+        self._fetch_chart = fetch_chart
+        self._candidates = candidates
+        self._on_update = on_update
+        self._should_run = should_run
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Dict[str, Any] = {}
+
+    async def _ingest_pool(self, pool: str, last_ts: int, sem: asyncio.Semaphore) -> int:
+        async with sem:
+            data = await self._fetch_chart(pool)
+        points = []
+        for d in data:
+            ts = _parse_ts(d.get("timestamp"))
+            if ts is None or ts <= last_ts:
+                continue
+            apy, tvl = d.get("apy"), d.get("tvlUsd")
+            points.append((ts, float(apy) if isinstance(apy, (int, float)) else None,
+                           float(tvl) if isinstance(tvl, (int, float)) else None))
+        new_last = max([last_ts] + [p[0] for p in points])
+        await asyncio.to_thread(self.store.append, pool, points, new_last)
+        return len(points)
+
+    async def load_index(self):
+        """Rebuild the sigma index from the store alone (no upstream calls)."""
+        pool_ids, apy = await asyncio.to_thread(self.store.tail, HISTORY_VOL_WINDOW)
+        self.index.replace(rolling_sigma(pool_ids, apy))
+
+    async def run_once(self) -> Dict[str, Any]:
+        t0 = time.time()
+        pools = await self._candidates()
+        seen = await asyncio.to_thread(self.store.last_seen, pools)
+        due = [p for p in pools if t0 - seen.get(p, (0, 0.0))[1] >= HISTORY_MIN_AGE_SECS]
+
+        sem = asyncio.Semaphore(max(1, HISTORY_CONCURRENCY))
+        results = await asyncio.gather(
+            *[self._ingest_pool(p, seen.get(p, (0, 0.0))[0], sem) for p in due],
+            return_exceptions=True,
+        )
+        errors = sum(1 for r in results if isinstance(r, Exception))
+        new_points = sum(r for r in results if isinstance(r, int))
+
+        await self.load_index()
+        if self._on_update is not None:
+            res = self._on_update(self.index)
+            if inspect.isawaitable(res):
+                await res
+
+        self.last_run = {
+            "candidates": len(pools), "fetched": len(due) - errors, "errors": errors,
+            "newPoints": new_points, "indexed": len(self.index), "seconds": round(time.time() - t0, 3),
+        }
+        return self.last_run
+
+    async def _loop(self, interval: int):
+        while True:
+            try:
+                # with several workers only the one holding the ingest lock fetches charts
+                if self._should_run is not None and not self._should_run():
+                    await asyncio.sleep(interval)
+                    continue
+                stats = await self.run_once()
+                print(f"[history] ingest done: {stats}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[history] ingest failed: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self, interval: int = HISTORY_REFRESH_SECS):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
@@ -0,0 +1,128 @@
+# http_clients.py
+import os
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from metrics import METRICS_ENABLED, UPSTREAM_SECONDS
+from ratelimit import RateLimitedTransport
+from resilience import ResilientTransport
+
+# ============================================================
+# Env / Config
+# ============================================================
+USER_AGENT = os.getenv("USER_AGENT", "BitmaxAI/1.0 (+https://fastapi-on-render)")
+PUBLIC_ORIGIN = os.getenv("PUBLIC_ORIGIN", "").strip()
+
+HTTP_TIMEOUT = float(os.getenv("LLAMA_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# HTTP/2 needs `h2` (the httpx[http2] extra in requirements.txt); without it the clients stay on HTTP/1.1
+try:
+    import h2  # noqa: F401
+    _H2_AVAILABLE = True
+except ImportError:
+    _H2_AVAILABLE = False
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() in {"1", "true", "yes", "on"} and _H2_AVAILABLE
+
+# ============================================================
+# Application-scoped client registry
+#   One pooled AsyncClient per name, shared by main.py and defillama.py.
+#   Opened lazily (or in the startup hook), closed in the shutdown hook.
+# ============================================================
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def default_headers() -> dict:
+    headers = {
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+    }
+    if USER_AGENT:
+        headers["User-Agent"] = USER_AGENT
+    if PUBLIC_ORIGIN:
+        headers["Referer"] = PUBLIC_ORIGIN
+    return headers
+
+# ============================================================
+# Upstream latency: the transport times each request from send until the
+# response body is closed (fully read, or abandoned), so both buffered
+# calls and streams are covered; transport failures count as status=error.
+# ============================================================
+class _TimedStream(httpx.AsyncByteStream):
+    def __init__(self, inner: httpx.AsyncByteStream, host: str, status: int, t0: float):
+        self._inner = inner
+        self._labels = (host, status)
+        self._t0 = t0
+
+    async def __aiter__(self):
+        async for chunk in self._inner:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._inner.aclose()
+        finally:
+            if self._t0 is not None:
+                UPSTREAM_SECONDS.labels(*self._labels).observe(time.perf_counter() - self._t0)
+                self._t0 = None
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncBaseTransport):
+        self._inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        t0 = time.perf_counter()
+        host = request.url.host
+        try:
+            resp = await self._inner.handle_async_request(request)
+        except Exception:
+            UPSTREAM_SECONDS.labels(host, "error").observe(time.perf_counter() - t0)
+            raise
+        return httpx.Response(resp.status_code, headers=resp.headers, extensions=resp.extensions,
+                              stream=_TimedStream(resp.stream, host, resp.status_code, t0))
+
+    async def aclose(self):
+        await self._inner.aclose()
+
+def make_transport() -> httpx.AsyncBaseTransport:
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=HTTP2_ENABLED,
+    )
+    # retries/breaker outermost, so every attempt takes a rate-limit token and is timed separately
+    return ResilientTransport(RateLimitedTransport(InstrumentedTransport(transport) if METRICS_ENABLED else transport))
+
+def _make_client(timeout: float, headers: Optional[dict]) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(timeout, connect=min(timeout, HTTP_CONNECT_TIMEOUT)),
+        headers=headers if headers is not None else default_headers(),
+        transport=make_transport(),
+    )
+
+def get_client(name: str = "llama", timeout: float = HTTP_TIMEOUT, headers: Optional[dict] = None) -> httpx.AsyncClient:
+    """
+    Shared client for `name`. `timeout`/`headers` only apply when the client is first created;
+    pass a per-request `timeout=` to override it for a single call.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _make_client(timeout, headers)
+        _clients[name] = client
+    return client
+
+async def aclose_all():
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception:
+            pass
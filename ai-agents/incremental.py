@@ -0,0 +1,241 @@
+# incremental.py
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from universe import PoolSnapshot, SnapshotDelta
+
+# ============================================================
+# TOPSIS state for one (chain, risk, horizon) candidate set
+#   Dense value matrix indexed by slot + membership mask. Column sums of
+#   squares (the TOPSIS vector normalizers) are kept as running totals,
+#   so a pool entering/leaving/changing costs O(criteria), not O(pools).
+# ============================================================
+class TopsisState:
+    def __init__(self, weights: Sequence[float], benefit: Sequence[bool], n_extra: int, cap: int = 256):
+        self.weights = np.asarray(weights, dtype=float)
+        self.benefit = np.asarray(benefit, dtype=bool)
+        self.n_crit = self.weights.size
+        self.vals = np.zeros((cap, self.n_crit + n_extra))
+        self.member = np.zeros(cap, dtype=bool)
+        self.sumsq = np.zeros(self.n_crit)
+        self.slot_of: Dict[str, int] = {}
+        self.pid_of: List[Optional[str]] = [None] * cap
+        self._free: List[int] = []
+        self._size = 0
+
+    def __len__(self) -> int:
+        return int(self.member[:self._size].sum())
+
+    def _grow(self):
+        cap = self.vals.shape[0] * 2
+        self.vals = np.resize(self.vals, (cap, self.vals.shape[1]))
+        self.member = np.concatenate([self.member, np.zeros(cap - self.member.size, dtype=bool)])
+        self.pid_of.extend([None] * (cap - len(self.pid_of)))
+
+    def _slot(self, pid: str) -> int:
+        slot = self.slot_of.get(pid)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                if self._size == self.vals.shape[0]:
+                    self._grow()
+                slot = self._size
+                self._size += 1
+            self.slot_of[pid] = slot
+            self.pid_of[slot] = pid
+            self.member[slot] = False
+        return slot
+
+    def set_values(self, pid: str, values: Sequence[float]):
+        slot = self._slot(pid)
+        if self.member[slot]:
+            self.sumsq -= self.vals[slot, :self.n_crit] ** 2
+        self.vals[slot] = values
+        if self.member[slot]:
+            self.sumsq += self.vals[slot, :self.n_crit] ** 2
+
+    def set_member(self, pid: str, flag: bool):
+        slot = self.slot_of.get(pid)
+        if slot is None or bool(self.member[slot]) == flag:
+            return
+        if flag:
+            self.sumsq += self.vals[slot, :self.n_crit] ** 2
+        else:
+            self.sumsq -= self.vals[slot, :self.n_crit] ** 2
+        self.member[slot] = flag
+
+    def remove(self, pid: str):
+        self.set_member(pid, False)
+        slot = self.slot_of.pop(pid, None)
+        if slot is not None:
+            self.pid_of[slot] = None
+            self._free.append(slot)
+
+    def resum(self):
+        """Recompute the running sums exactly (drops accumulated float drift)."""
+        m = self.member[:self._size]
+        self.sumsq = (self.vals[:self._size][m, :self.n_crit] ** 2).sum(axis=0)
+
+    def ranked(self) -> Tuple[List[str], np.ndarray]:
+        """
+        Members ordered like _topsis_rank (closeness, then Score, RAR, period return;
+        ties by TVL), with their rounded closeness scores. Extra columns are [Score, RAR].
+        Criteria column 0 is the period return, column 1 the TVL.
+        """
+        slots = np.flatnonzero(self.member[:self._size])
+        if slots.size == 0:
+            return [], np.empty(0)
+        v = self.vals[slots]
+        crit = v[:, :self.n_crit]
+        norm = np.sqrt(np.maximum(self.sumsq, 0.0))
+        wn = crit / np.where(norm > 0, norm, 1.0) * self.weights
+        hi, lo = wn.max(axis=0), wn.min(axis=0)
+        best = np.where(self.benefit, hi, lo)
+        worst = np.where(self.benefit, lo, hi)
+        d_plus = np.sqrt(((wn - best) ** 2).sum(axis=1))
+        d_minus = np.sqrt(((wn - worst) ** 2).sum(axis=1))
+        denom = d_plus + d_minus
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cc = np.round(np.where(denom > 0, d_minus / denom, 0.5), 6)
+        score, rar = v[:, self.n_crit], v[:, self.n_crit + 1]
+        order = np.lexsort((-crit[:, 1], -crit[:, 0], -rar, -score, -cc))
+        return [self.pid_of[int(s)] for s in slots[order]], cc[order]
+
+# ============================================================
+# Delta-driven ranker over the cached universe
+#   Candidate set per (chain, risk): best-TVL pool of each (project, symbol)
+#   bucket with TVL >= the risk's base floor, i.e. the /recommend candidates
+#   when no filter/relaxation/limit applies. Only pools in a snapshot delta
+#   are rescored; only their buckets have membership recomputed.
+# ============================================================
+ScoreFn = Callable[[Dict[str, Any], int, str, str], Optional[Sequence[float]]]
+
+class IncrementalRanker:
+    def __init__(self, chains: Iterable[str], risks: Iterable[str], horizons: Iterable[int],
+                 score_fn: ScoreFn, floor_fn: Callable[[str], float],
+                 weights_fn: Callable[[str], Sequence[float]], benefit: Sequence[bool], n_extra: int = 2):
+        self.chains = [c.lower() for c in chains]
+        self.risks = list(risks)
+        self.horizons = list(horizons)
+        self._score_fn = score_fn
+        self._floor = {r: float(floor_fn(r)) for r in self.risks}
+        self._weights_fn = weights_fn
+        self._benefit = benefit
+        self._n_extra = n_extra
+        self.version: Optional[int] = None
+        self.last_update: Dict[str, Any] = {}
+        self._reset()
+
+    def _reset(self):
+        self._pools: Dict[str, Dict[str, Any]] = {}
+        self._where: Dict[str, Tuple[str, Tuple[str, str]]] = {}    # pid -> (chain, bucket)
+        self._buckets: Dict[Tuple[str, Tuple[str, str]], Dict[str, float]] = {}
+        self.states: Dict[Tuple[str, str, int], TopsisState] = {
+            (c, r, h): TopsisState(self._weights_fn(r), self._benefit, self._n_extra)
+            for c in self.chains for r in self.risks for h in self.horizons
+        }
+
+    @staticmethod
+    def _bucket(pool: Dict[str, Any]) -> Tuple[str, str]:
+        return ((pool.get("project") or "").lower(), (pool.get("symbol") or "").upper())
+
+    def bucket_count(self, chain: str) -> int:
+        return sum(1 for (c, _), members in self._buckets.items() if c == chain and members)
+
+    def ready(self, version: int) -> bool:
+        return self.version == version
+
+    def _drop(self, pid: str, touched: Set[Tuple[str, Tuple[str, str]]]):
+        where = self._where.pop(pid, None)
+        self._pools.pop(pid, None)
+        if where is None:
+            return
+        chain = where[0]
+        self._buckets.get(where, {}).pop(pid, None)
+        touched.add(where)
+        for r in self.risks:
+            for h in self.horizons:
+                self.states[(chain, r, h)].remove(pid)
+
+    def _upsert(self, pid: str, pool: Dict[str, Any], touched: Set[Tuple[str, Tuple[str, str]]]) -> bool:
+        chain = (pool.get("chain") or "").lower()
+        where = (chain, self._bucket(pool))
+        if self._where.get(pid) not in (None, where):
+            self._drop(pid, touched)
+        if chain not in self.chains:
+            return False
+        self._pools[pid] = pool
+        self._where[pid] = where
+        self._buckets.setdefault(where, {})[pid] = float(pool.get("tvlUsd") or 0.0)
+        touched.add(where)
+        for r in self.risks:
+            for h in self.horizons:
+                vals = self._score_fn(pool, h, r, chain)
+                st = self.states[(chain, r, h)]
+                if vals is None:
+                    st.remove(pid)
+                else:
+                    st.set_values(pid, vals)
+        return True
+
+    def _refresh_membership(self, touched: Set[Tuple[str, Tuple[str, str]]]):
+        for where in touched:
+            members = self._buckets.get(where) or {}
+            if not members:
+                self._buckets.pop(where, None)
+                continue
+            winner = max(members, key=members.get)
+            chain = where[0]
+            for pid, tvl in members.items():
+                for r in self.risks:
+                    flag = pid == winner and tvl >= self._floor[r]
+                    for h in self.horizons:
+                        self.states[(chain, r, h)].set_member(pid, flag)
+
+    def apply(self, snap: PoolSnapshot, delta: SnapshotDelta):
+        """Universe listener: rescore only what the delta touched."""
+        cols = snap.columns
+        touched: Set[Tuple[str, Tuple[str, str]]] = set()
+        if delta.full or self.version is None:
+            self._reset()
+            dirty: Iterable[str] = cols.row_of.keys()
+        else:
+            for pid in delta.removed:
+                self._drop(pid, touched)
+            dirty = list(delta.added) + list(delta.changed)
+        n = 0
+        for pid in dirty:
+            n += self._upsert(pid, cols.pools[cols.row_of[pid]], touched)
+        # unchanged pools keep their scores but must point at the new snapshot's dicts
+        for pid in list(self._pools):
+            i = cols.row_of.get(pid)
+            if i is not None:
+                self._pools[pid] = cols.pools[i]
+        self._refresh_membership(touched)
+        if delta.full:
+            for st in self.states.values():
+                st.resum()
+        self.version = snap.version
+        self.last_update = {"version": snap.version, "rescored": n, "buckets": len(touched), **delta.summary()}
+
+    def rescore(self, pids: Iterable[str]):
+        """Pools whose dicts were updated in place (e.g. sigma overlay) in the current snapshot."""
+        touched: Set[Tuple[str, Tuple[str, str]]] = set()
+        for pid in pids:
+            pool = self._pools.get(pid)
+            if pool is not None:
+                self._upsert(pid, pool, touched)
+        self._refresh_membership(touched)
+
+    def members(self, chain: str, risk: str, horizon: int) -> int:
+        st = self.states.get((chain, risk, horizon))
+        return len(st) if st is not None else 0
+
+    def ranked(self, chain: str, risk: str, horizon: int) -> Optional[Tuple[List[str], np.ndarray]]:
+        st = self.states.get((chain, risk, horizon))
+        return st.ranked() if st is not None else None
+
+    def pool(self, pid: str) -> Optional[Dict[str, Any]]:
+        return self._pools.get(pid)
@@ -0,0 +1,335 @@
+# jobs.py
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Body, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
+
+from deadlines import detached
+from defillama import CHAIN_DEFAULT, HORIZON_MONTHS_MAX, INCLUDE_NARRATIVE_DEFAULT, RISK_PRESETS, build_recommendation, sse_event
+from metrics import Counter, Gauge, Histogram
+from ratelimit import background
+from resilience import collect_stale
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))                  # jobs run at once (per process)
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "64"))             # queued jobs before submissions get 503
+JOB_TIMEOUT_S = float(os.getenv("JOB_TIMEOUT_S", "300"))
+JOB_RETENTION_S = float(os.getenv("JOB_RETENTION_S", "900"))      # finished jobs (and results) kept this long
+JOB_MAX_RETAINED = int(os.getenv("JOB_MAX_RETAINED", "1000"))
+JOB_DEDUP_S = float(os.getenv("JOB_DEDUP_S", "60"))               # a succeeded job answers identical submissions this long
+JOB_EVENTS_KEEPALIVE_S = float(os.getenv("JOB_EVENTS_KEEPALIVE_S", "15"))
+
+Runner = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+SUBMITTED = Counter("jobs_submitted", "Job submissions by kind and outcome (queued|deduplicated|rejected)", ("kind", "outcome"))
+FINISHED = Counter("jobs_finished", "Finished jobs by kind and status", ("kind", "status"))
+QUEUED = Gauge("jobs_queued", "Jobs waiting for a worker")
+RUNNING = Gauge("jobs_running", "Jobs being run by a worker")
+DURATION = Histogram("job_duration_seconds", "Job run time by kind (queue wait excluded)", ("kind",))
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+# ============================================================
+# Jobs
+#   queued -> running -> succeeded | failed, or cancelled from either
+#   of the first two. Subscribers wait on `changed`, which is swapped
+#   for a fresh event on every transition.
+# ============================================================
+FINAL = {"succeeded", "failed", "cancelled"}
+
+class Job:
+    def __init__(self, kind: str, params: Dict[str, Any], key: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.key = key
+        self.status = "queued"
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _set(self, status: str):
+        self.status = status
+        if status == "running":
+            self.started = time.time()
+        elif status in FINAL:
+            self.finished = time.time()
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def public(self, include_result: bool = True) -> Dict[str, Any]:
+        out = {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "createdAt": self.created,
+            "startedAt": self.started,
+            "finishedAt": self.finished,
+            "links": {"self": f"/jobs/{self.id}", "events": f"/jobs/{self.id}/events"},
+        }
+        if include_result and self.status == "succeeded":
+            out["result"] = self.result
+        if self.error is not None:
+            out["error"] = self.error
+        return out
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("job queue full")
+        self.retry_after = retry_after
+
+def _job_key(kind: str, params: Dict[str, Any]) -> str:
+    raw = json.dumps([kind, params], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def _error_of(exc: BaseException) -> Dict[str, Any]:
+    if isinstance(exc, HTTPException):
+        return {"status": exc.status_code, "detail": exc.detail}
+    if isinstance(exc, asyncio.TimeoutError):
+        return {"status": 504, "detail": f"job exceeded {JOB_TIMEOUT_S:g}s"}
+    return {"status": 502 if type(exc).__module__.startswith("httpx") else 500, "detail": f"{type(exc).__name__}: {exc}"}
+
+# ============================================================
+# Queue + bounded worker pool
+#   Identical submissions (same kind and normalised params) share one
+#   job while it is queued or running, and for JOB_DEDUP_S after it
+#   succeeded. Jobs run in the background rate-limit lane with no
+#   request deadline; finished ones are kept JOB_RETENTION_S (at most
+#   JOB_MAX_RETAINED). Per process: with several uvicorn workers a job
+#   is only visible on the worker that accepted it.
+# ============================================================
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_MAX):
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self._runners: Dict[str, Runner] = {}
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._by_key: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+        self._avg_run_s = 5.0
+
+    def register(self, kind: str, runner: Runner):
+        self._runners[kind] = runner
+
+    def _queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, kind: str, params: Dict[str, Any]) -> Tuple[Job, bool]:
+        """(job, created); an identical live job is returned instead of queueing a new one."""
+        if kind not in self._runners or self._queue is None:
+            raise HTTPException(503, f"'{kind}' jobs are not available")
+        self._prune()
+        key = _job_key(kind, params)
+        job = self._by_key.get(key)
+        if job is not None and (job.status in ("queued", "running") or
+                                (job.status == "succeeded" and time.time() - job.finished < JOB_DEDUP_S)):
+            SUBMITTED.labels(kind, "deduplicated").inc()
+            return job, False
+        if self._queued() >= self.max_queued:
+            SUBMITTED.labels(kind, "rejected").inc()
+            raise QueueFull((self._queued() + 1) * self._avg_run_s / self.workers)
+        job = Job(kind, params, key)
+        self._jobs[job.id] = job
+        self._by_key[key] = job
+        self._queue.put_nowait(job)
+        QUEUED.set(self._queued())
+        SUBMITTED.labels(kind, "queued").inc()
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job: Job) -> Job:
+        if job.status == "queued":
+            job._set("cancelled")       # the worker skips it when it comes up
+            FINISHED.labels(job.kind, "cancelled").inc()
+        elif job.status == "running" and job._task is not None:
+            job._task.cancel()
+        return job
+
+    async def _run(self, job: Job):
+        job._set("running")
+        self._running += 1
+        RUNNING.set(self._running)
+        t0 = time.perf_counter()
+        try:
+            with background(f"job:{job.kind}"), collect_stale():
+                job.result = await asyncio.wait_for(self._runners[job.kind](job.params), JOB_TIMEOUT_S)
+            job._set("succeeded")
+        except asyncio.CancelledError:
+            job._set("cancelled")       # DELETE or shutdown; the job's own task, so nothing to propagate
+        except Exception as e:
+            job.error = _error_of(e)
+            job._set("failed")
+        finally:
+            elapsed = time.perf_counter() - t0
+            self._avg_run_s += 0.2 * (elapsed - self._avg_run_s)
+            self._running -= 1
+            RUNNING.set(self._running)
+            DURATION.labels(job.kind).observe(elapsed)
+            FINISHED.labels(job.kind, job.status).inc()
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            QUEUED.set(self._queued())
+            if job.status != "queued":
+                continue
+            job._task = asyncio.ensure_future(self._run(job))
+            try:
+                await asyncio.shield(job._task)
+            finally:
+                job._task = None
+
+    def _prune(self):
+        now = time.time()
+        finished = [j for j in self._jobs.values() if j.status in FINAL]
+        drop = {j.id for j in finished if now - j.finished > JOB_RETENTION_S}
+        excess = len(self._jobs) - len(drop) - JOB_MAX_RETAINED
+        if excess > 0:
+            drop.update(j.id for j in sorted(finished, key=lambda j: j.finished)[:excess] if j.id not in drop)
+        for job_id in drop:
+            job = self._jobs.pop(job_id)
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        with detached():
+            self._tasks = [asyncio.get_running_loop().create_task(self._worker()) for _ in range(self.workers)]
+        print(f"[startup] job queue: {self.workers} workers, up to {self.max_queued} queued")
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for t in tasks:
+            t.cancel()
+        for job in self._jobs.values():
+            if job._task is not None:
+                job._task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "queued": self._queued(), "running": self._running,
+                "retained": len(self._jobs)}
+
+queue = JobQueue()
+
+def register(kind: str, runner: Runner):
+    queue.register(kind, runner)
+
+def start():
+    queue.start()
+
+async def stop():
+    await queue.stop()
+
+def stats() -> Dict[str, Any]:
+    return queue.stats()
+
+# ============================================================
+# Runners defined here (train is registered by main.py, which owns the model)
+# ============================================================
+async def _recommend_job(params: Dict[str, Any]) -> Dict[str, Any]:
+    return await build_recommendation(
+        params["amountAvax"], params["horizonMonths"], params["riskTolerance"], params["project"], params["search"],
+        params["chain"], params["limitFetch"], params["topN"], params["chains"], params["includeNarrative"],
+    )
+
+register("recommend", _recommend_job)
+
+# ============================================================
+# Routes
+# ============================================================
+class RecommendJobRequest(BaseModel):
+    amountAvax: float = Field(..., gt=0)
+    horizonMonths: int = Field(6, ge=1, le=HORIZON_MONTHS_MAX)
+    riskTolerance: str = "moderate"
+    project: Optional[str] = None
+    search: Optional[str] = None
+    chain: str = CHAIN_DEFAULT
+    chains: Optional[str] = None
+    limitFetch: int = Field(600, ge=50, le=2000)
+    topN: int = Field(2, ge=1, le=5)
+    includeNarrative: bool = INCLUDE_NARRATIVE_DEFAULT
+
+class TrainJobRequest(BaseModel):
+    # always MODEL_COIN: /optimize serves every coin from this one model, so no coin_id (rejected, not ignored)
+    model_config = ConfigDict(extra="forbid")
+    days: Optional[int] = Field(None, ge=30, le=365, description="History length (default: MODEL_DEFAULT_DAYS)")
+
+def _accepted(job: Job, created: bool) -> JSONResponse:
+    body = {**job.public(), "deduplicated": not created}
+    return JSONResponse(body, status_code=202, headers={"Location": f"/jobs/{job.id}"})
+
+def _submit(kind: str, params: Dict[str, Any]) -> JSONResponse:
+    try:
+        job, created = queue.submit(kind, params)
+    except QueueFull as e:
+        raise HTTPException(503, "Job queue full; retry shortly", headers={"Retry-After": str(max(1, int(e.retry_after + 0.999)))})
+    return _accepted(job, created)
+
+@router.post("/recommend", summary="Queue a /recommend computation (narratives, large limitFetch); poll or subscribe for the result")
+async def submit_recommend(req: RecommendJobRequest = Body(...)):
+    params = req.model_dump()
+    params["riskTolerance"] = params["riskTolerance"].lower()
+    if params["riskTolerance"] not in RISK_PRESETS:
+        raise HTTPException(status_code=400, detail="riskTolerance must be conservative|moderate|aggressive")
+    params["chain"] = params["chain"].strip().lower()
+    return _submit("recommend", params)
+
+@router.post("/train", summary="Queue a retrain of the price model (on MODEL_COIN)")
+async def submit_train(req: TrainJobRequest = Body(...)):
+    return _submit("train", {"days": req.days})
+
+def _job_or_404(job_id: str) -> Job:
+    job = queue.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Unknown or expired job")
+    return job
+
+@router.get("/{job_id}", summary="Job status, and its result once it succeeded")
+async def get_job(job_id: str):
+    return _job_or_404(job_id).public()
+
+@router.delete("/{job_id}", summary="Cancel a queued or running job")
+async def cancel_job(job_id: str):
+    return queue.cancel(_job_or_404(job_id)).public(include_result=False)
+
+@router.get("/{job_id}/events", summary="SSE: a 'status' event per transition, then 'result' (or 'error') and 'done'")
+async def job_events(job_id: str, request: Request):
+    job = _job_or_404(job_id)
+
+    async def events():
+        while True:
+            changed = job.changed
+            yield sse_event("status", job.public(include_result=False))
+            if job.status in FINAL:
+                if job.status == "succeeded":
+                    yield sse_event("result", job.result)
+                elif job.error is not None:
+                    yield sse_event("error", job.error)
+                yield sse_event("done", {})
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), JOB_EVENTS_KEEPALIVE_S)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
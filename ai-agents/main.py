@@ -9,6 +9,7 @@ import numpy as np
 import httpx
 from fastapi import FastAPI, HTTPException, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
@@ -16,7 +17,25 @@ from lstm import (
     train_from_prices,
     predict_next_price,
 )
-from defillama import router as llama_router
+from defillama import (
+    router as llama_router,
+    close_rank_executor,
+    prewarm_universe,
+    start_history_ingest,
+    stop_history_ingest,
+)
+from sweep import router as sweep_router
+import http_clients
+from cache_backend import close_caches, open_cache
+from swr import PREWARM_AHEAD, Prewarmer, SWRCache
+import admission
+import deadlines
+import jobs
+import metrics
+import ratelimit
+import resilience
+import tracing
+from tracing import span
 
 # ============================================================
 # Env / Config  (loads .env locally; on Render use env vars)
@@ -26,14 +45,23 @@ load_dotenv()  # <-- loads .env for local dev
 # Model / endpoints config
 WINDOW = int(os.getenv("MODEL_WINDOW", "30"))
 DEFAULT_DAYS = int(os.getenv("MODEL_DEFAULT_DAYS", "120"))
-
-USER_AGENT = os.getenv("USER_AGENT", "BitmaxAI/1.0 (+https://fastapi-on-render)")
-PUBLIC_ORIGIN = os.getenv("PUBLIC_ORIGIN", "").strip()
+MODEL_COIN = os.getenv("MODEL_COIN", "bitcoin")     # the one model /optimize uses for every coin is fitted on this
 
 # ---------------- DeFiLlama (no API key required) ----------------
-LLAMA_PRICES_BASE = "https://coins.llama.fi"
+LLAMA_PRICES_BASE = os.getenv("LLAMA_PRICES_BASE", "https://coins.llama.fi").rstrip("/")
 LLAMA_TIMEOUT = float(os.getenv("LLAMA_TIMEOUT", "30"))
 
+# price cache: fresh until the soft TTL, then served stale (and refreshed in the background) until the hard TTL
+PRICE_SOFT_TTL = float(os.getenv("PRICE_SOFT_TTL", "15"))
+PRICE_HARD_TTL = float(os.getenv("PRICE_HARD_TTL", "300"))
+HIST_SOFT_TTL = float(os.getenv("HIST_SOFT_TTL", "600"))
+HIST_HARD_TTL = float(os.getenv("HIST_HARD_TTL", "86400"))
+# /coins/{id} change anchors ("price 1h ago") are keyed by offset, so the same entry slides forward
+ANCHOR_SOFT_TTL = float(os.getenv("ANCHOR_SOFT_TTL", "60"))
+ANCHOR_HARD_TTL = float(os.getenv("ANCHOR_HARD_TTL", "900"))
+# daily history is one call per day: this many in flight (the coins.llama.fi rate limit still applies)
+HISTORY_FETCH_CONCURRENCY = int(os.getenv("HISTORY_FETCH_CONCURRENCY", "8"))
+
 #
 COIN_MAP: Dict[str, Dict[str, str]] = {
     "bitcoin": {"llama_key": "coingecko:bitcoin"},
@@ -46,13 +74,23 @@ COIN_MAP: Dict[str, Dict[str, str]] = {
 # FastAPI App
 # ============================================================
 app = FastAPI(title="AvaHacks AI API (DeFiLlama-backed)", version="0.3.0")
+# innermost: admission queues under the request deadline; 503s/504s still get CORS
+# headers and show up in metrics/Server-Timing
+app.add_middleware(admission.AdmissionMiddleware)
+app.add_middleware(deadlines.DeadlineMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(resilience.StaleDataMiddleware)
+app.add_middleware(ratelimit.UpstreamBudgetMiddleware)
+app.add_middleware(tracing.ServerTimingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 app.include_router(llama_router)
+app.include_router(sweep_router)
+app.include_router(jobs.router)
 
 class AppState:
     model = None
@@ -61,42 +99,16 @@ class AppState:
 state = AppState()
 
 # ============================================================
-# HTTP client + tiny cache
+# HTTP client (shared registry) + tiny cache
 # ============================================================
-_llama_client: Optional[httpx.AsyncClient] = None
-
-def _llama_headers() -> dict:
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    if USER_AGENT:
-        headers["User-Agent"] = USER_AGENT
-    if PUBLIC_ORIGIN:
-        headers["Referer"] = PUBLIC_ORIGIN
-    return headers
-
 def _get_llama_client() -> httpx.AsyncClient:
-    global _llama_client
-    if _llama_client is None:
-        _llama_client = httpx.AsyncClient(timeout=LLAMA_TIMEOUT, headers=_llama_headers())
-    return _llama_client
-
-# small in-memory cache
-_cache: Dict[str, Tuple[float, Any]] = {}
+    return http_clients.get_client("llama", timeout=LLAMA_TIMEOUT)
 
-def cache_get(key: str, ttl: int) -> Optional[Any]:
-    row = _cache.get(key)
-    if not row:
-        return None
-    ts, val = row
-    if time.time() - ts > ttl:
-        _cache.pop(key, None)
-        return None
-    return val
-
-def cache_set(key: str, val: Any):
-    _cache[key] = (time.time(), val)
+# price cache: per worker, or shared by all workers on the host (CACHE_BACKEND=sqlite);
+# stale-while-revalidate so TTL boundaries don't put an upstream fetch on the request path
+_cache = SWRCache(open_cache("main"), last_good=open_cache("main.lastgood"))
+_prewarmer = Prewarmer()
+_prices_warmed_at = 0.0
 
 # ============================================================
 # Helpers
@@ -123,42 +135,54 @@ async def llama_current_prices(coin_keys: List[str]) -> Dict[str, Any]:
     """
     Returns { 'coins': { '<key>': {'price': float, 'symbol': str, ... }, ... } }
     """
-    key = f"llama:current:{','.join(coin_keys)}"
-    cached = cache_get(key, ttl=15)
-    if cached is not None:
-        return cached
+    async def load() -> Dict[str, Any]:
+        client = _get_llama_client()
+        r = await client.get(f"{LLAMA_PRICES_BASE}/prices/current/{','.join(coin_keys)}")
+        r.raise_for_status()
+        return r.json()
 
-    client = _get_llama_client()
-    url = f"{LLAMA_PRICES_BASE}/prices/current/{','.join(coin_keys)}"
-    r = await client.get(url)
-    r.raise_for_status()
-    js = r.json()
-    cache_set(key, js)
-    return js
+    return await _cache.get(f"llama:current:{','.join(coin_keys)}", load, PRICE_SOFT_TTL, PRICE_HARD_TTL,
+                            source="prices")
 
 async def llama_price_at(ts_sec: int, coin_key: str) -> Optional[float]:
     """
     Price at a given unix seconds timestamp.
     Returns float or None if not available.
     """
-    key = f"llama:historical:{coin_key}:{ts_sec}"
-    cached = cache_get(key, ttl=600)
-    if cached is not None:
-        return cached
+    return await _cache.get(f"llama:historical:{coin_key}:{ts_sec}", lambda: _fetch_price_at(ts_sec, coin_key),
+                            HIST_SOFT_TTL, HIST_HARD_TTL, source="price_history")
 
+async def llama_price_ago(seconds_ago: int, coin_key: str) -> Optional[float]:
+    """Price `seconds_ago` before now; within ANCHOR_SOFT_TTL the previous sample is reused."""
+    return await _cache.get(f"llama:ago:{coin_key}:{seconds_ago}",
+                            lambda: _fetch_price_at(int(time.time()) - seconds_ago, coin_key),
+                            ANCHOR_SOFT_TTL, ANCHOR_HARD_TTL, source="price_history")
+
+async def _fetch_price_at(ts_sec: int, coin_key: str) -> Optional[float]:
     client = _get_llama_client()
-    url = f"{LLAMA_PRICES_BASE}/prices/historical/{ts_sec}/{coin_key}"
-    r = await client.get(url)
+    r = await client.get(f"{LLAMA_PRICES_BASE}/prices/historical/{ts_sec}/{coin_key}")
     if r.status_code == 404:
-        cache_set(key, None)
         return None
     r.raise_for_status()
     js = r.json()
     price_obj = (js.get("coins") or {}).get(coin_key) or {}
     price = price_obj.get("price")
-    price_f = float(price) if price is not None else None
-    cache_set(key, price_f)
-    return price_f
+    return float(price) if price is not None else None
+
+async def prewarm_current_prices():
+    """One batched fetch for every COIN_MAP coin, stored under each coin's /coins/{id} key."""
+    global _prices_warmed_at
+    if time.time() - _prices_warmed_at < PRICE_SOFT_TTL * PREWARM_AHEAD:
+        return
+    keys = [c["llama_key"] for c in COIN_MAP.values()]
+    client = _get_llama_client()
+    r = await client.get(f"{LLAMA_PRICES_BASE}/prices/current/{','.join(keys)}")
+    r.raise_for_status()
+    coins = r.json().get("coins") or {}
+    for k in keys:
+        if k in coins:
+            _cache.set(f"llama:current:{k}", {"coins": {k: coins[k]}}, PRICE_HARD_TTL)
+    _prices_warmed_at = time.time()
 
 async def llama_daily_history(coin_id: str, days: int) -> List[Tuple[int, float]]:
     """
@@ -176,10 +200,15 @@ async def llama_daily_history(coin_id: str, days: int) -> List[Tuple[int, float]
     # today UTC midnight (exclusive end)
     today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
 
-    # fetch each day price at midnight (unix seconds)
-    for i in range(days, 0, -1):
-        ts = int((today - timedelta(days=i)).timestamp())
-        price = await llama_price_at(ts, coin_key)
+    # fetch each day price at midnight (unix seconds), a few days at a time
+    sem = asyncio.Semaphore(max(1, HISTORY_FETCH_CONCURRENCY))
+
+    async def day(ts: int) -> Optional[float]:
+        async with sem:
+            return await llama_price_at(ts, coin_key)
+
+    stamps = [int((today - timedelta(days=i)).timestamp()) for i in range(days, 0, -1)]
+    for ts, price in zip(stamps, await asyncio.gather(*(day(ts) for ts in stamps))):
         if price is not None:
             pairs.append((ts * 1000, float(price)))
 
@@ -195,7 +224,8 @@ async def get_coin_history(coin_id: str, days: int):
     """
     Return {"prices": [[ts_ms, price], ...]} built from DeFiLlama daily samples.
     """
-    pairs = await llama_daily_history(coin_id, days=days)
+    with span("history"):
+        pairs = await llama_daily_history(coin_id, days=days)
     pairs = sorted(set(pairs), key=lambda x: x[0])
     return {"prices": [[t, p] for t, p in pairs]}
 
@@ -205,25 +235,19 @@ async def get_coin_data(coin_id: str):
     - current price from /prices/current
     - 1h/24h/7d computed via /prices/historical at corresponding timestamps
     """
-    from datetime import datetime, timedelta, timezone
-
     coin_key = _coin_to_llama_key(coin_id)
 
-    # current
-    js_now = await llama_current_prices([coin_key])
+    # current price and the three historical anchors are independent: fetch together
+    with span("prices"):
+        js_now, p_1h, p_24h, p_7d = await asyncio.gather(
+            llama_current_prices([coin_key]),
+            llama_price_ago(3600, coin_key),
+            llama_price_ago(86400, coin_key),
+            llama_price_ago(7 * 86400, coin_key),
+        )
     now_price = ((js_now.get("coins") or {}).get(coin_key) or {}).get("price")
     current = float(now_price) if now_price is not None else None
 
-    # historical anchors
-    now = datetime.now(timezone.utc)
-    ts_1h = int((now - timedelta(hours=1)).timestamp())
-    ts_24h = int((now - timedelta(days=1)).timestamp())
-    ts_7d = int((now - timedelta(days=7)).timestamp())
-
-    p_1h = await llama_price_at(ts_1h, coin_key)
-    p_24h = await llama_price_at(ts_24h, coin_key)
-    p_7d = await llama_price_at(ts_7d, coin_key)
-
     return {
         "id": coin_id,
         "current_price": current,
@@ -289,30 +313,72 @@ class OptimizeRequest(BaseModel):
     risk_profile: Optional[RiskProfile] = None
     maturity_months: Literal[3, 6, 9, 12] = 6
 
+# ============================================================
+# Model fit (startup, and POST /jobs/train)
+# ============================================================
+async def fit_model(days: Optional[int] = None) -> Dict[str, Any]:
+    """Fit on `days` of MODEL_COIN daily prices (off the event loop) and swap it in once done."""
+    days = max(days or DEFAULT_DAYS, WINDOW + 25)
+    hist = await get_coin_history(MODEL_COIN, days)
+    prices = [p[1] for p in hist["prices"]]
+    if len(prices) < WINDOW + 6:
+        raise RuntimeError("Insufficient history to train model")
+    t0 = time.perf_counter()
+    with metrics.MODEL_FIT_SECONDS.time():
+        state.model = await asyncio.to_thread(train_from_prices, np.asarray(prices, dtype=float), window=WINDOW)
+    return {"coin_id": MODEL_COIN, "days": days, "points": len(prices), "window": WINDOW,
+            "fitSeconds": round(time.perf_counter() - t0, 3)}
+
+async def _train_job(params: Dict[str, Any]) -> Dict[str, Any]:
+    return await fit_model(params["days"])
+
+jobs.register("train", _train_job)
+
 # ============================================================
 # Lifecycle
 # ============================================================
 @app.on_event("startup")
 async def startup():
+    _get_llama_client()  # open the pooled client before the first request
+    metrics.start_loop_lag_probe()
+    tracing.start_profiler()
+    _prewarmer.add("current prices", prewarm_current_prices)
+    _prewarmer.add("pool universe", prewarm_universe)
+    _prewarmer.add("hot price keys", _cache.prewarm)
+    _prewarmer.start()
+    start_history_ingest()
+    jobs.start()
     try:
-        hist = await get_coin_history("bitcoin", max(DEFAULT_DAYS, WINDOW + 25))
-        prices = [p[1] for p in hist["prices"]]
-        if len(prices) < WINDOW + 6:
-            raise RuntimeError("Insufficient history to train model")
-        state.model = train_from_prices(np.asarray(prices, dtype=float), window=WINDOW)
+        with ratelimit.background("model fit"):
+            await fit_model()
         print("[startup] sklearn (returns) model trained and ready")
     except Exception as e:
         print(f"[startup] Model init failed: {e}")
 
 @app.on_event("shutdown")
 async def shutdown():
-    global _llama_client
-    try:
-        if _llama_client is not None:
-            await _llama_client.aclose()
-            _llama_client = None
-    except Exception:
-        pass
+    await jobs.stop()
+    await _prewarmer.stop()
+    await stop_history_ingest()
+    await metrics.stop_loop_lag_probe()
+    tracing.stop_profiler()
+    close_rank_executor()
+    await http_clients.aclose_all()
+    close_caches()
+
+# ============================================================
+# Upstream failures -> 502/503 (an open breaker or a full rate-limit
+# queue says when to retry)
+# ============================================================
+@app.exception_handler(httpx.HTTPError)
+async def upstream_error(request, exc: httpx.HTTPError):
+    if isinstance(exc, (resilience.CircuitOpenError, ratelimit.UpstreamBusyError)):
+        return JSONResponse({"detail": f"Upstream unavailable: {exc}"}, status_code=503,
+                            headers={"Retry-After": str(max(1, int(exc.retry_after + 0.999)))})
+    if isinstance(exc, deadlines.DeadlineExceeded):
+        return JSONResponse({"detail": str(exc)}, status_code=504)
+    status = 504 if isinstance(exc, httpx.TimeoutException) else 502
+    return JSONResponse({"detail": f"Upstream error: {exc}"}, status_code=status)
 
 # ============================================================
 # Routes
@@ -325,17 +391,27 @@ async def health():
         "window": state.window,
         "price_source": "defillama",
         "uses_api_key": False,
+        "upstreams": resilience.breakers(),
+        "rateLimits": ratelimit.limits(),
+        "admission": admission.pools(),
+        "jobs": jobs.stats(),
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(404, "Metrics are disabled (METRICS_ENABLED=false)")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/coins/{coin_id}")
 async def coin_data(coin_id: str):
-    return await get_coin_data(coin_id)
+    return resilience.flag_stale(await get_coin_data(coin_id))
 
 @app.get("/coins/{coin_id}/history")
 async def coin_history(coin_id: str, days: int = DEFAULT_DAYS):
     if days < 1:
         raise HTTPException(400, "days must be >= 1")
-    return await get_coin_history(coin_id, days)
+    return resilience.flag_stale(await get_coin_history(coin_id, days))
 
 @app.post("/optimize")
 async def optimize(req: OptimizeRequest = Body(...)):
@@ -348,8 +424,10 @@ async def optimize(req: OptimizeRequest = Body(...)):
         raise HTTPException(422, "Insufficient history for prediction")
 
     last_prices = np.asarray(prices[-(state.window + 1):], dtype=float)
+    deadlines.check("prediction")
     try:
-        pred_next = predict_next_price(state.model, last_prices, window=state.window)
+        with metrics.MODEL_PREDICT_SECONDS.time(), span("predict"):
+            pred_next = predict_next_price(state.model, last_prices, window=state.window)
     except Exception as e:
         raise HTTPException(500, f"Prediction failed: {e}")
 
@@ -360,7 +438,7 @@ async def optimize(req: OptimizeRequest = Body(...)):
 
     pt, yt = adjust_for_maturity(pt, yt, req.maturity_months, req.risk_profile, trend=trend)
 
-    return {
+    payload = {
         "coin_id": req.coin_id,
         "risk_profile": (req.risk_profile.value if req.risk_profile else "unspecified"),
         "maturity_months": req.maturity_months,
@@ -378,3 +456,4 @@ async def optimize(req: OptimizeRequest = Body(...)):
             "data_source": "DeFiLlama (coins.llama.fi)",
         },
     }
+    return resilience.flag_stale(payload)
@@ -0,0 +1,244 @@
+# metrics.py
+import os
+import time
+import asyncio
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))    # seconds between event-loop lag probes
+
+# seconds; request/upstream latencies span ~1 ms (cache hits) to the 30 s client timeout
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ============================================================
+# Metric types (Prometheus text exposition)
+#   Per process: with several uvicorn workers each one keeps its own
+#   series and a scrape sees whichever worker answered. Updates are plain
+#   attribute/list increments on the event-loop thread, no locks; hot
+#   paths bind their label set once with .labels() and keep the child.
+# ============================================================
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if v != int(v) or abs(v) >= 1e15 else str(int(v))
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[key] = self._child()
+        return child
+
+    @abstractmethod
+    def _child(self):
+        ...
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += self._samples()
+        return "\n".join(lines)
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}_total{_label_str(self.labelnames, k)} {_fmt(c.value)}" for k, c in self._children.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_label_str(self.labelnames, k)} {_fmt(c.value)}" for k, c in self._children.items()]
+
+class _Timer:
+    __slots__ = ("_hist", "_t0")
+
+    def __init__(self, hist: "_HistogramChild"):
+        self._hist = hist
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.observe(time.perf_counter() - self._t0)
+        return False
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # per bucket, last = +Inf; cumulated at render time
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def _samples(self) -> List[str]:
+        out: List[str] = []
+        for key, child in self._children.items():
+            acc = 0
+            for le, n in zip(self.buckets + (float("inf"),), child.counts):
+                acc += n
+                le_label = 'le="' + _fmt(le) + '"'
+                out.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le_label)} {acc}")
+            out.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {_fmt(child.sum)}")
+            out.append(f"{self.name}_count{_label_str(self.labelnames, key)} {acc}")
+        return out
+
+_registry: List[_Metric] = []
+
+def render() -> str:
+    return "\n".join(m.render() for m in _registry) + "\n"
+
+# ============================================================
+# Application metrics
+# ============================================================
+REQUEST_SECONDS = Histogram("api_request_duration_seconds",
+                            "API request latency by route template, method and status (streams: until the last byte)",
+                            ("route", "method", "status"))
+UPSTREAM_SECONDS = Histogram("upstream_request_duration_seconds",
+                             "Outbound HTTP latency by host and status, response body included (status=error: no response)",
+                             ("host", "status"))
+CACHE_REQUESTS = Counter("cache_requests", "Cache lookups by namespace and result (hit|miss)", ("namespace", "result"))
+CACHE_EVICTIONS = Counter("cache_evictions", "Cache entries dropped for size or expiry", ("namespace",))
+CACHE_SWR = Counter("cache_swr_reads", "Stale-while-revalidate reads by result (fresh|stale|miss)", ("namespace", "result"))
+CACHE_REVALIDATIONS = Counter("cache_revalidations", "Background cache refreshes by trigger (stale|prewarm) and outcome",
+                              ("namespace", "trigger", "outcome"))
+MODEL_FIT_SECONDS = Histogram("model_fit_seconds", "Price model training time")
+MODEL_PREDICT_SECONDS = Histogram("model_predict_seconds", "Price model single prediction time")
+RANK_SECONDS = Histogram("rank_duration_seconds", "Universe ranking time per /recommend call by path (precomputed|full)",
+                         ("path",))
+LOOP_LAG_SECONDS = Histogram("event_loop_lag_seconds", "Scheduling delay of a periodic event-loop probe", buckets=LAG_BUCKETS)
+LOOP_LAG_LAST = Gauge("event_loop_lag_last_seconds", "Most recent event-loop lag probe")
+
+# ============================================================
+# ASGI middleware: one histogram observation per request
+#   Labelled with the matched route template (/coins/{coin_id}), not the
+#   raw path, so series stay bounded; unmatched paths share one label.
+# ============================================================
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        status = [500]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(getattr(route, "path", "<unmatched>"), scope["method"], status[0]).observe(
+                time.perf_counter() - t0)
+
+# ============================================================
+# Event-loop lag probe (started/stopped from the app lifecycle)
+# ============================================================
+_lag_task: Optional[asyncio.Task] = None
+
+async def _probe_loop_lag(interval: float):
+    loop = asyncio.get_running_loop()
+    hist = LOOP_LAG_SECONDS.labels()
+    last = LOOP_LAG_LAST.labels()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - t0 - interval)
+        hist.observe(lag)
+        last.set(lag)
+
+def start_loop_lag_probe():
+    global _lag_task
+    if METRICS_ENABLED and LOOP_LAG_INTERVAL > 0 and _lag_task is None:
+        _lag_task = asyncio.get_running_loop().create_task(_probe_loop_lag(LOOP_LAG_INTERVAL))
+
+async def stop_loop_lag_probe():
+    global _lag_task
+    task, _lag_task = _lag_task, None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,111 @@
+# prices.py
+import os
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from cache_backend import CacheBackend, MemoryCache
+from deadlines import detached
+from resilience import mark_stale
+
+PRICE_BATCH_WINDOW_MS = float(os.getenv("PRICE_BATCH_WINDOW_MS", "10"))
+PRICE_BATCH_MAX = int(os.getenv("PRICE_BATCH_MAX", "80"))
+PRICE_TTL = int(os.getenv("PRICE_TTL", "30"))
+PRICE_MISS_TTL = int(os.getenv("PRICE_MISS_TTL", "10"))
+
+FetchMany = Callable[[List[str]], Awaitable[Dict[str, float]]]
+
+# ============================================================
+# Dataloader-style price service
+#   load()/load_many() callers that arrive within one batch window share a
+#   single coins.llama.fi request; each 'chain:address' key is cached with
+#   its own expiry (in the given cache backend, so workers can share it)
+#   and in-flight keys are never requested twice. If a batch fails, keys
+#   with a `last_good` price get that instead of None (marked stale).
+# ============================================================
+class PriceLoader:
+    def __init__(self, fetch_many: FetchMany, window_ms: float = PRICE_BATCH_WINDOW_MS,
+                 max_batch: int = PRICE_BATCH_MAX, ttl: int = PRICE_TTL, miss_ttl: int = PRICE_MISS_TTL,
+                 cache: Optional[CacheBackend] = None, last_good: Optional[CacheBackend] = None):
+        self._fetch_many = fetch_many
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._cache = cache if cache is not None else MemoryCache("prices")   # key -> price (None = known miss)
+        self._last_good = last_good                                   # key -> last fetched price, no expiry
+        self._pending: Dict[str, asyncio.Future] = {}                 # queued for the next batch
+        self._inflight: Dict[str, asyncio.Future] = {}                # part of a running batch
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    @staticmethod
+    def _norm(key: str) -> str:
+        return key.strip().lower()
+
+    def peek(self, key: str) -> Tuple[bool, Optional[float]]:
+        return self._cache.get(self._norm(key))
+
+    def prime(self, key: str, price: Optional[float]):
+        self._cache.set(self._norm(key), price, ttl=self.ttl if price is not None else self.miss_ttl)
+
+    def _future_for(self, key: str) -> asyncio.Future:
+        fut = self._inflight.get(key) or self._pending.get(key)
+        if fut is not None:
+            return fut
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending[key] = fut
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush_now)
+        return fut
+
+    def _flush_now(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._inflight.update(batch)
+        with detached():
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch: Dict[str, asyncio.Future]):
+        keys = list(batch)
+        try:
+            prices = await self._fetch_many(keys)
+            prices = {self._norm(k): v for k, v in (prices or {}).items()}
+            failed = False
+        except Exception:
+            prices, failed = {}, True
+        for key, fut in batch.items():
+            self._inflight.pop(key, None)
+            price, stale_age = prices.get(key), None
+            if not failed:
+                self.prime(key, price)   # misses are cached too, but only briefly
+                if price is not None and self._last_good is not None:
+                    self._last_good.set(key, price)
+            elif self._last_good is not None:
+                hit, last, age = self._last_good.get_aged(key)
+                if hit:
+                    price, stale_age = last, age
+            if not fut.done():
+                # the stale age travels with the result: each caller marks its own request
+                fut.set_result((price, stale_age))
+
+    async def load(self, key: str) -> Optional[float]:
+        return (await self.load_many([key])).get(self._norm(key))
+
+    async def load_many(self, keys: Iterable[str]) -> Dict[str, Optional[float]]:
+        keys = list(dict.fromkeys(self._norm(k) for k in keys))
+        out: Dict[str, Optional[float]] = self._cache.get_many(keys)
+        waits: Dict[str, asyncio.Future] = {k: self._future_for(k) for k in keys if k not in out}
+        if waits:
+            # shield: a cancelled caller must not cancel a batch other callers share
+            results = await asyncio.gather(*[asyncio.shield(f) for f in waits.values()])
+            for key, (price, stale_age) in zip(waits.keys(), results):
+                out[key] = price
+                if stale_age is not None:
+                    mark_stale("token_prices", stale_age)
+        return out
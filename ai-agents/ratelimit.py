@@ -0,0 +1,245 @@
+# ratelimit.py
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import httpx
+
+from deadlines import DeadlineExceeded, budget
+from metrics import Counter, Histogram, LAG_BUCKETS
+from tracing import record
+
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "10"))                 # per upstream host; 0 = no limiter
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "50"))
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")                                 # per-host overrides: "yields.llama.fi=2/10,..."
+RATE_LIMIT_MAX_WAIT_S = float(os.getenv("RATE_LIMIT_MAX_WAIT_S", "2"))    # longest queue an interactive call joins
+RATE_LIMIT_BG_MAX_WAIT_S = float(os.getenv("RATE_LIMIT_BG_MAX_WAIT_S", "60"))
+RATE_LIMIT_429_PAUSE_S = float(os.getenv("RATE_LIMIT_429_PAUSE_S", "1"))  # pause after a 429 without Retry-After
+
+LANES = ("interactive", "background")    # grant order
+
+BUDGET_TOKENS = Counter("upstream_budget_tokens", "Outbound rate-limit tokens spent, by host, lane and route (or job)",
+                        ("host", "lane", "route"))
+QUEUE_WAIT = Histogram("upstream_ratelimit_wait_seconds", "Time outbound calls queued for a rate-limit token",
+                       ("host", "lane"), buckets=LAG_BUCKETS)
+REJECTED = Counter("upstream_ratelimited", "Outbound calls refused because the token queue was too long",
+                   ("host", "lane"))
+
+def _parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    out: Dict[str, Tuple[float, float]] = {}
+    for part in spec.split(","):
+        host, _, value = part.strip().partition("=")
+        if not host or not value:
+            continue
+        rps, _, burst = value.partition("/")
+        out[host.strip()] = (float(rps), float(burst) if burst else RATE_LIMIT_BURST)
+    return out
+
+_HOST_LIMITS = _parse_limits(RATE_LIMITS)
+
+class UpstreamBusyError(httpx.TransportError):
+    """Raised instead of queueing past the lane's max wait; retry_after = expected wait in seconds."""
+
+    def __init__(self, host: str, retry_after: float, request: Optional[httpx.Request] = None):
+        super().__init__(f"rate limit for {host}: queue too long (~{retry_after:.1f}s)", request=request)
+        self.host = host
+        self.retry_after = retry_after
+
+# ============================================================
+# Who is calling
+#   UpstreamBudgetMiddleware puts request traffic in the interactive lane
+#   (budget counted under the route template); background(name) moves
+#   refreshes, pre-warm passes and ingestion to the background lane.
+#   Tasks copy the context when created, so a refresh spawned inside
+#   `with background(...)` stays there. Calls outside both (startup)
+#   are background, counted as "internal".
+# ============================================================
+_origin: ContextVar[Optional[Tuple[str, Any]]] = ContextVar("upstream_origin", default=None)
+
+@contextmanager
+def background(name: str):
+    token = _origin.set(("background", name))
+    try:
+        yield
+    finally:
+        _origin.reset(token)
+
+def _current_origin() -> Tuple[str, str]:
+    origin = _origin.get()
+    if origin is None:
+        return "background", "internal"
+    lane, who = origin
+    if lane == "interactive":
+        return lane, getattr(who.get("route"), "path", "<unmatched>")
+    return lane, who
+
+class UpstreamBudgetMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # the scope itself: the matched route is only known once routing ran
+        token = _origin.set(("interactive", scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _origin.reset(token)
+
+# ============================================================
+# Token bucket with priority lanes
+#   `rate` tokens/s up to `burst`. A call takes a token at once when one
+#   is free and nobody of its lane or a higher one is queued; otherwise it
+#   queues, and a timer hands out tokens as they refill, interactive
+#   waiters first. A call whose expected wait exceeds its lane's max wait
+#   fails fast with UpstreamBusyError. A 429 empties the bucket for the
+#   Retry-After period. Limits are per process: with several uvicorn
+#   workers, divide the upstream's allowance by the worker count.
+# ============================================================
+class TokenBucket:
+    def __init__(self, host: str, rate: float, burst: float):
+        self.host = host
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self._stamp = time.monotonic()
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def _ahead(self, lane: str) -> int:
+        n = 0
+        for name in LANES:
+            n += len(self._waiters[name])
+            if name == lane:
+                break
+        return n
+
+    async def acquire(self, lane: str, max_wait: float, request: Optional[httpx.Request] = None) -> float:
+        """Take one token; returns the seconds spent queued."""
+        self._refill(time.monotonic())
+        ahead = self._ahead(lane)
+        if ahead == 0 and self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        expected = (ahead + 1.0 - self.tokens) / self.rate
+        if expected > max_wait:
+            REJECTED.labels(self.host, lane).inc()
+            raise UpstreamBusyError(self.host, expected, request)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(fut)
+        self._schedule()
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(fut, max_wait)
+        except asyncio.TimeoutError:
+            # pushed back by higher-priority arrivals past its max wait
+            REJECTED.labels(self.host, lane).inc()
+            raise UpstreamBusyError(self.host, (self._ahead(lane) + 1.0 - self.tokens) / self.rate, request)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.tokens += 1.0     # granted but never used
+            raise
+        return time.monotonic() - t0
+
+    def _schedule(self):
+        if self._timer is None and any(self._waiters.values()):
+            delay = max(0.0, (1.0 - self.tokens) / self.rate)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._grant)
+
+    def _grant(self):
+        self._timer = None
+        self._refill(time.monotonic())
+        for lane in LANES:
+            q = self._waiters[lane]
+            while q and self.tokens >= 1.0:
+                fut = q.popleft()
+                if fut.done():          # timed out / cancelled while queued
+                    continue
+                self.tokens -= 1.0
+                fut.set_result(None)
+            while q and q[0].done():
+                q.popleft()
+        self._schedule()
+
+    def pause(self, seconds: float):
+        """Upstream said 429: no tokens for `seconds`."""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule()
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._refill(time.monotonic())
+        return {
+            "rps": self.rate,
+            "burst": self.burst,
+            "tokens": round(self.tokens, 2),
+            "queued": {lane: sum(1 for f in q if not f.done()) for lane, q in self._waiters.items()},
+        }
+
+_buckets: Dict[str, Optional[TokenBucket]] = {}
+
+def bucket_for(host: str) -> Optional[TokenBucket]:
+    if host not in _buckets:
+        rate, burst = _HOST_LIMITS.get(host, (RATE_LIMIT_RPS, RATE_LIMIT_BURST))
+        _buckets[host] = TokenBucket(host, rate, burst) if rate > 0 else None
+    return _buckets[host]
+
+def limits() -> Dict[str, Dict[str, Any]]:
+    return {host: b.snapshot() for host, b in _buckets.items() if b is not None}
+
+def _retry_after_s(resp: httpx.Response) -> float:
+    try:
+        return max(0.0, float(resp.headers.get("retry-after", "")))
+    except ValueError:
+        return RATE_LIMIT_429_PAUSE_S
+
+# ============================================================
+# Transport: one token per attempt (sits under ResilientTransport,
+# so retries pay for themselves too)
+# ============================================================
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncBaseTransport):
+        self._inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        bucket = bucket_for(host)
+        if bucket is None:
+            return await self._inner.handle_async_request(request)
+        lane, route = _current_origin()
+        max_wait = RATE_LIMIT_MAX_WAIT_S if lane == "interactive" else RATE_LIMIT_BG_MAX_WAIT_S
+        limit = budget()
+        by_deadline = limit is not None and limit < max_wait
+        if by_deadline:
+            # no point queueing for a token the request can no longer use
+            max_wait = max(0.0, limit)
+        try:
+            waited = await bucket.acquire(lane, max_wait, request)
+        except UpstreamBusyError:
+            if by_deadline:
+                raise DeadlineExceeded(f"request deadline exceeded queueing for {host}", request=request) from None
+            raise
+        BUDGET_TOKENS.labels(host, lane, route).inc()
+        QUEUE_WAIT.labels(host, lane).observe(waited)
+        if waited > 0:
+            record("ratelimit", waited)
+        resp = await self._inner.handle_async_request(request)
+        if resp.status_code == 429:
+            bucket.pause(_retry_after_s(resp))
+        return resp
+
+    async def aclose(self):
+        await self._inner.aclose()
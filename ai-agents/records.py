@@ -0,0 +1,125 @@
+# records.py
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+# ============================================================
+# Compact pool record
+#   The DeFiLlama fields read by scoring (_score_pool, _pool_style,
+#   _profitability_view), the response builders and every field of the
+#   frontend's AptosPool (/llama/pools). Repeated strings (chain, project,
+#   symbol, category, token addresses, ...) are interned so the universe
+#   shares one copy.
+# ============================================================
+STR_FIELDS = (
+    "pool", "chain", "project", "symbol", "category", "exposure", "ilRisk",
+    "poolMeta", "url", "predictedClass", "timestamp",
+)
+NUM_FIELDS = (
+    "tvlUsd", "apy", "apyBase", "apyReward", "apyMean30d", "apyPct1D", "apyPct7D", "apyPct30D",
+    "volumeUsd7d", "predictedProbability", "sigma",
+    "mu", "il7d", "apyBase7d", "volumeUsd1d", "apyBaseInception",
+)
+INT_FIELDS = ("count", "binnedConfidence")       # binnedConfidence sits under 'predictions' upstream
+BOOL_FIELDS = ("stablecoin", "outlier")          # missing = False
+LIST_FIELDS = ("underlyingTokens", "rewardTokens")
+LOCAL_FIELDS = ("sigmaApy",)                     # set from the pool history index, not upstream
+PREDICTION_FIELDS = ("predictedClass", "predictedProbability", "binnedConfidence")   # served nested, as upstream
+
+def _intern(x: Any) -> Optional[str]:
+    if x is None:
+        return None
+    return sys.intern(str(x))
+
+def _num(x: Any) -> Optional[float]:
+    if x is None or isinstance(x, bool):
+        return None
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return None
+
+def _int(x: Any) -> Optional[int]:
+    v = _num(x)
+    return None if v is None or v != v else int(v)
+
+def _tokens(x: Any) -> Optional[Tuple[str, ...]]:
+    if not isinstance(x, (list, tuple)):
+        return None
+    return tuple(sys.intern(str(t)) for t in x if t is not None)
+
+class PoolRecord:
+    __slots__ = STR_FIELDS + NUM_FIELDS + INT_FIELDS + LIST_FIELDS + LOCAL_FIELDS + BOOL_FIELDS
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "PoolRecord":
+        rec = cls.__new__(cls)
+        for f in STR_FIELDS:
+            setattr(rec, f, _intern(d.get(f)))
+        for f in NUM_FIELDS:
+            setattr(rec, f, _num(d.get(f)))
+        for f in INT_FIELDS:
+            setattr(rec, f, _int(d.get(f)))
+        for f in LIST_FIELDS:
+            setattr(rec, f, _tokens(d.get(f)))
+        for f in LOCAL_FIELDS:
+            setattr(rec, f, _num(d.get(f)))
+        preds = d.get("predictions") or {}
+        if isinstance(preds, dict):
+            if rec.predictedProbability is None:
+                rec.predictedProbability = _num(preds.get("predictedProbability"))
+            if rec.predictedClass is None:
+                rec.predictedClass = _intern(preds.get("predictedClass"))
+            if rec.binnedConfidence is None:
+                rec.binnedConfidence = _int(preds.get("binnedConfidence"))
+        if rec.timestamp is None:
+            rec.timestamp = _intern(d.get("updatedAt"))
+        for f in BOOL_FIELDS:
+            setattr(rec, f, bool(d.get(f)))
+        return rec
+
+    @classmethod
+    def from_state(cls, state: Tuple[Any, ...]) -> "PoolRecord":
+        """Inverse of __getstate__: values in __slots__ order."""
+        rec = cls.__new__(cls)
+        rec.__setstate__(state)
+        return rec
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Read access with the same keys (and None-for-missing) as the upstream dict."""
+        if key == "predictions":
+            return self._predictions()
+        val = getattr(self, key, None) if key in self.__slots__ else None
+        return default if val is None else val
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__ and key != "predictions":
+            raise KeyError(key)
+        return self.get(key)
+
+    def _predictions(self) -> Optional[Dict[str, Any]]:
+        if self.predictedProbability is None and self.predictedClass is None and self.binnedConfidence is None:
+            return None
+        return {"predictedClass": self.predictedClass, "predictedProbability": self.predictedProbability,
+                "binnedConfidence": self.binnedConfidence}
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for f in self.__slots__:
+            if f in PREDICTION_FIELDS:
+                continue
+            val = getattr(self, f)
+            out[f] = list(val) if isinstance(val, tuple) else val
+        out["predictions"] = self._predictions()
+        return out
+
+    def __getstate__(self):
+        return tuple(getattr(self, f) for f in self.__slots__)
+
+    def __setstate__(self, state):
+        for f, v in zip(self.__slots__, state):
+            setattr(self, f, v)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, PoolRecord) and self.__getstate__() == other.__getstate__()
+
+    __hash__ = None
@@ -0,0 +1,249 @@
+# resilience.py
+import os
+import time
+import random
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+import httpx
+
+from deadlines import DeadlineExceeded, budget, clamp_timeouts
+from metrics import Counter, Gauge
+from ratelimit import UpstreamBusyError
+
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "3"))              # total tries for idempotent requests
+RETRY_BASE_MS = float(os.getenv("RETRY_BASE_MS", "100"))
+RETRY_MAX_MS = float(os.getenv("RETRY_MAX_MS", "2000"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))          # consecutive failures that open a host's breaker
+BREAKER_COOLDOWN_S = float(os.getenv("BREAKER_COOLDOWN_S", "15"))   # open -> half-open (one probe request)
+
+IDEMPOTENT = {"GET", "HEAD", "OPTIONS"}
+# retried: the request never reached the server or the connection broke; read timeouts aren't
+# (another full LLAMA_TIMEOUT wait is exactly what the breaker is there to avoid)
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.ReadError, httpx.WriteError)
+
+UPSTREAM_RETRIES = Counter("upstream_retries", "Upstream attempts retried, by host", ("host",))
+UPSTREAM_SHORT_CIRCUITS = Counter("upstream_short_circuits", "Requests failed fast by an open breaker, by host", ("host",))
+BREAKER_STATE = Gauge("upstream_breaker_open", "1 while a host's circuit breaker is open or half-open", ("host",))
+STALE_SERVED = Counter("stale_fallbacks", "Responses served from last-good data after an upstream failure, by source",
+                       ("source",))
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of calling a host whose breaker is open; retry_after = seconds until the next probe."""
+
+    def __init__(self, host: str, retry_after: float, request: Optional[httpx.Request] = None):
+        super().__init__(f"circuit open for {host} (retry in {retry_after:.1f}s)", request=request)
+        self.host = host
+        self.retry_after = retry_after
+
+# ============================================================
+# Per-host circuit breaker
+#   closed: calls pass; BREAKER_FAILURES consecutive failures (transport
+#   errors, 429/5xx) open it. open: calls fail fast with CircuitOpenError
+#   for BREAKER_COOLDOWN_S. half-open: one probe goes through; success
+#   closes the breaker, failure re-opens it for another cooldown.
+# ============================================================
+class CircuitBreaker:
+    def __init__(self, host: str, failures: int = BREAKER_FAILURES, cooldown_s: float = BREAKER_COOLDOWN_S):
+        self.host = host
+        self.threshold = max(1, failures)
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._gauge = BREAKER_STATE.labels(host)
+        self._short = UPSTREAM_SHORT_CIRCUITS.labels(host)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown_s else "open"
+
+    def before(self, request: Optional[httpx.Request] = None) -> bool:
+        """Admit a call or raise CircuitOpenError; True if this call is the half-open probe."""
+        if self.opened_at is None:
+            return False
+        wait = self.cooldown_s - (time.monotonic() - self.opened_at)
+        if wait > 0 or self._probing:
+            self._short.inc()
+            raise CircuitOpenError(self.host, max(wait, 0.0), request)
+        self._probing = True
+        return True
+
+    def abandon(self, probe: bool):
+        # cancelled before an outcome: let the next call probe instead
+        if probe:
+            self._probing = False
+
+    def success(self, probe: bool):
+        if probe:
+            self._probing = False
+        if self.opened_at is not None:
+            print(f"[breaker] {self.host} closed")
+        self.failures = 0
+        self.opened_at = None
+        self._gauge.set(0)
+
+    def failure(self, probe: bool):
+        if probe:
+            self._probing = False
+        self.failures += 1
+        if probe or (self.opened_at is None and self.failures >= self.threshold):
+            if self.opened_at is None:
+                print(f"[breaker] {self.host} open after {self.failures} failures")
+            self.opened_at = time.monotonic()
+            self._gauge.set(1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutiveFailures": self.failures}
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def breaker_for(host: str) -> CircuitBreaker:
+    b = _breakers.get(host)
+    if b is None:
+        b = _breakers[host] = CircuitBreaker(host)
+    return b
+
+def breakers() -> Dict[str, Dict[str, Any]]:
+    return {host: b.snapshot() for host, b in _breakers.items()}
+
+def _backoff_s(attempt: int, retry_after: Optional[str]) -> float:
+    # full jitter: uniform(0, min(max, base * 2^attempt)); a short Retry-After from upstream wins
+    if retry_after:
+        try:
+            ra = float(retry_after)
+            if 0 <= ra * 1000.0 <= RETRY_MAX_MS:
+                return ra
+        except ValueError:
+            pass
+    return random.uniform(0.0, min(RETRY_MAX_MS, RETRY_BASE_MS * (2 ** attempt))) / 1000.0
+
+def _past_budget(delay: float) -> bool:
+    limit = budget()
+    return limit is not None and delay >= limit
+
+# ============================================================
+# Transport: breaker around every call, jittered retries for
+# idempotent ones. Sits under each shared httpx client.
+# ============================================================
+class ResilientTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncBaseTransport, attempts: int = RETRY_ATTEMPTS):
+        self._inner = inner
+        self.attempts = max(1, attempts)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        breaker = breaker_for(host)
+        tries = self.attempts if request.method in IDEMPOTENT else 1
+        timeouts = request.extensions.get("timeout")
+        for attempt in range(tries):
+            # each attempt gets at most what is left of the request's deadline
+            limit = budget()
+            if limit is not None and limit <= 0:
+                raise DeadlineExceeded(f"request deadline exceeded before calling {host}", request=request)
+            request.extensions["timeout"], clamped = clamp_timeouts(timeouts, limit)
+            probe = breaker.before(request)
+            last = attempt == tries - 1
+            try:
+                resp = await self._inner.handle_async_request(request)
+            except (UpstreamBusyError, DeadlineExceeded):
+                # our own limiter or deadline said no: the host did nothing wrong
+                breaker.abandon(probe)
+                raise
+            except httpx.TimeoutException as e:
+                if clamped:
+                    # cut short by our deadline, not the host's fault
+                    breaker.abandon(probe)
+                    raise DeadlineExceeded(f"request deadline exceeded waiting for {host}", request=request) from e
+                breaker.failure(probe)
+                if last or not isinstance(e, RETRY_ERRORS):
+                    raise
+                delay = _backoff_s(attempt, None)
+            except RETRY_ERRORS:
+                breaker.failure(probe)
+                if last:
+                    raise
+                delay = _backoff_s(attempt, None)
+            except httpx.TransportError:
+                breaker.failure(probe)
+                raise
+            except BaseException:
+                breaker.abandon(probe)
+                raise
+            else:
+                if resp.status_code not in RETRY_STATUSES:
+                    breaker.success(probe)
+                    return resp
+                breaker.failure(probe)
+                delay = _backoff_s(attempt, resp.headers.get("retry-after"))
+                if last or _past_budget(delay):
+                    return resp
+                await resp.aclose()
+            if _past_budget(delay):
+                raise DeadlineExceeded(f"request deadline leaves no time to retry {host}", request=request)
+            UPSTREAM_RETRIES.labels(host).inc()
+            await asyncio.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    async def aclose(self):
+        await self._inner.aclose()
+
+# ============================================================
+# Stale markers
+#   When a fallback serves last-good data, mark_stale(source, age) notes
+#   it on the current request; handlers add stale_sources() to their
+#   payload and StaleDataMiddleware sends an X-Stale-Data header.
+# ============================================================
+_stale: ContextVar[Optional[Dict[str, float]]] = ContextVar("stale_sources", default=None)
+
+def mark_stale(source: str, age_s: float):
+    STALE_SERVED.labels(source).inc()
+    marks = _stale.get()
+    if marks is not None:
+        marks[source] = max(marks.get(source, 0.0), age_s)
+
+def stale_sources() -> Dict[str, float]:
+    """source -> age in seconds of the oldest last-good data this request used."""
+    return {k: round(v, 1) for k, v in (_stale.get() or {}).items()}
+
+@contextmanager
+def collect_stale():
+    """Stale markers for work outside a request (async jobs): flag_stale() inside sees them."""
+    token = _stale.set({})
+    try:
+        yield
+    finally:
+        _stale.reset(token)
+
+def flag_stale(payload: Dict[str, Any]) -> Dict[str, Any]:
+    marks = stale_sources()
+    if marks:
+        payload["stale"] = marks
+    return payload
+
+class StaleDataMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        marks: Dict[str, float] = {}
+        token = _stale.set(marks)
+
+        async def _send(message):
+            if message["type"] == "http.response.start" and marks:
+                value = ", ".join(f"{k};age={v:.0f}" for k, v in marks.items())
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-stale-data", value.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _stale.reset(token)
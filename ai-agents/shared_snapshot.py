@@ -0,0 +1,265 @@
+# shared_snapshot.py
+import os
+import json
+import mmap
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from records import BOOL_FIELDS, INT_FIELDS, LIST_FIELDS, LOCAL_FIELDS, NUM_FIELDS, STR_FIELDS, PoolRecord
+
+try:
+    import fcntl
+except ImportError:     # non-POSIX: shared mode unavailable, single-process mode still works
+    fcntl = None
+
+SHARED_SNAPSHOT_DIR = os.getenv("SHARED_SNAPSHOT_DIR", "")
+SHARED_SNAPSHOT_KEEP = int(os.getenv("SHARED_SNAPSHOT_KEEP", "3"))
+SHARED_LOCK_TIMEOUT = float(os.getenv("SHARED_LOCK_TIMEOUT", "60"))
+SHARED_POLL_SECS = float(os.getenv("SHARED_POLL_SECS", "1.0"))
+
+MAGIC = b"POOLSNP2"      # bumped whenever the columns change; CURRENT pointers name the format too
+_ALIGN = 64
+
+# ============================================================
+# Cross-process lock (flock; released by the kernel if the holder dies)
+# ============================================================
+class FileLock:
+    def __init__(self, path: str):
+        if fcntl is None:
+            raise RuntimeError("file locks need a POSIX platform (fcntl)")
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+# ============================================================
+# Columnar file format
+#   MAGIC | u64 header length | JSON header | 64-byte aligned arrays.
+#   Strings live once in a table (utf-8 blob + offsets); string fields
+#   are int32 codes (-1 = None), numbers and ints float64 (NaN = None),
+#   flags uint8, token lists int32 codes + per-row lengths (-1 = None).
+# ============================================================
+def _encode(records: Sequence[PoolRecord]) -> Dict[str, np.ndarray]:
+    n = len(records)
+    strings: Dict[str, int] = {}
+
+    def code(s: Optional[str]) -> int:
+        return -1 if s is None else strings.setdefault(s, len(strings))
+
+    cols: Dict[str, np.ndarray] = {}
+    for f in STR_FIELDS:
+        cols[f] = np.fromiter((code(getattr(r, f)) for r in records), dtype=np.int32, count=n)
+    for f in NUM_FIELDS + INT_FIELDS + LOCAL_FIELDS:
+        vals = (getattr(r, f) for r in records)
+        cols[f] = np.fromiter((np.nan if v is None else v for v in vals), dtype=np.float64, count=n)
+    for f in BOOL_FIELDS:
+        cols[f] = np.fromiter((bool(getattr(r, f)) for r in records), dtype=np.uint8, count=n)
+    for f in LIST_FIELDS:
+        lists = [getattr(r, f) for r in records]
+        cols[f + ".len"] = np.fromiter((-1 if v is None else len(v) for v in lists), dtype=np.int32, count=n)
+        flat = [code(t) for v in lists if v for t in v]
+        cols[f + ".codes"] = np.asarray(flat, dtype=np.int32)
+
+    encoded = [s.encode("utf-8") for s in strings]
+    cols["strings.offs"] = np.concatenate([[0], np.cumsum([len(b) for b in encoded], dtype=np.int64)]).astype(np.int64)
+    cols["strings.blob"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return cols
+
+def write_snapshot_file(path: str, records: Sequence[PoolRecord], version: int, fetched_at: float):
+    cols = _encode(records)
+    layout: Dict[str, Dict[str, Any]] = {}
+    offset = 0
+    for name, arr in cols.items():
+        layout[name] = {"dtype": arr.dtype.str, "count": int(arr.size), "offset": offset}
+        offset += -(-arr.nbytes // _ALIGN) * _ALIGN
+    header = json.dumps({"version": version, "fetchedAt": fetched_at, "rows": len(records), "columns": layout}).encode()
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // _ALIGN) * _ALIGN
+
+    with open(path, "wb") as fh:
+        fh.write(MAGIC)
+        fh.write(len(header).to_bytes(8, "little"))
+        fh.write(header)
+        for name, arr in cols.items():
+            fh.seek(data_start + layout[name]["offset"])
+            fh.write(arr.tobytes())
+        fh.truncate(data_start + offset)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+class MappedUniverse:
+    """Read-only view of a snapshot file; records are materialized per access."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: not a pool snapshot file")
+        hlen = int.from_bytes(self._mm[len(MAGIC):len(MAGIC) + 8], "little")
+        header = json.loads(self._mm[len(MAGIC) + 8:len(MAGIC) + 8 + hlen])
+        data_start = -(-(len(MAGIC) + 8 + hlen) // _ALIGN) * _ALIGN
+
+        self.path = path
+        self.version: int = header["version"]
+        self.fetched_at: float = header["fetchedAt"]
+        self.rows: int = header["rows"]
+        self.cols: Dict[str, np.ndarray] = {
+            name: np.frombuffer(self._mm, dtype=np.dtype(c["dtype"]), count=c["count"], offset=data_start + c["offset"])
+            for name, c in header["columns"].items()
+        }
+        self._list_start = {
+            f: np.concatenate([[0], np.cumsum(np.maximum(self.cols[f + ".len"], 0), dtype=np.int64)])
+            for f in LIST_FIELDS
+        }
+        self._strings: List[Optional[str]] = [None] * (self.cols["strings.offs"].size - 1)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def string(self, code: int) -> Optional[str]:
+        if code < 0:
+            return None
+        s = self._strings[code]
+        if s is None:
+            offs = self.cols["strings.offs"]
+            s = self._strings[code] = bytes(self.cols["strings.blob"][offs[code]:offs[code + 1]]).decode("utf-8")
+        return s
+
+    def strings(self, field: str) -> List[Optional[str]]:
+        return [self.string(int(c)) for c in self.cols[field]]
+
+    def numbers(self, field: str) -> np.ndarray:
+        """Float column with None -> 0.0 (same convention as PoolColumns)."""
+        return np.nan_to_num(self.cols[field], nan=0.0)
+
+    def _value(self, field: str, i: int) -> Any:
+        if field in STR_FIELDS:
+            return self.string(int(self.cols[field][i]))
+        if field in LIST_FIELDS:
+            n = int(self.cols[field + ".len"][i])
+            if n < 0:
+                return None
+            a = int(self._list_start[field][i])
+            return tuple(self.string(int(c)) for c in self.cols[field + ".codes"][a:a + n])
+        if field in BOOL_FIELDS:
+            return bool(self.cols[field][i])
+        v = float(self.cols[field][i])
+        if v != v:
+            return None
+        return int(v) if field in INT_FIELDS else v
+
+    def record(self, i: int) -> PoolRecord:
+        return PoolRecord.from_state(tuple(self._value(f, i) for f in PoolRecord.__slots__))
+
+class MappedPools(Sequence):
+    """List-like access to the records of a MappedUniverse (what PoolColumns.pools expects)."""
+
+    def __init__(self, mapped: MappedUniverse):
+        self.mapped = mapped
+
+    def __len__(self) -> int:
+        return len(self.mapped)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.mapped.record(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.mapped.record(i)
+
+    def __iter__(self) -> Iterator[PoolRecord]:
+        for i in range(len(self)):
+            yield self.mapped.record(i)
+
+# ============================================================
+# Versioned snapshot directory
+#   universe-<version>.snap files + a CURRENT pointer, both swapped in
+#   with os.replace so readers never see a partial file. Old versions
+#   are unlinked; workers still mapping them keep the inode alive.
+# ============================================================
+class SharedSnapshotStore:
+    def __init__(self, directory: str, keep: int = SHARED_SNAPSHOT_KEEP):
+        os.makedirs(directory, exist_ok=True)
+        self.dir = directory
+        self.keep = max(1, keep)
+        self._pointer = os.path.join(directory, "CURRENT")
+        self._refresh_lock = FileLock(os.path.join(directory, "refresh.lock"))
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._pointer, "r") as fh:
+                pointer = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+        # a file from an older build (other columns): treat as missing, the next refresh replaces it
+        return pointer if pointer.get("format") == MAGIC.decode() else None
+
+    def publish(self, records: Sequence[PoolRecord], version: int, fetched_at: Optional[float] = None) -> Dict[str, Any]:
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        name = f"universe-{version:010d}.snap"
+        tmp = os.path.join(self.dir, f".{name}.{os.getpid()}.tmp")
+        write_snapshot_file(tmp, records, version, fetched_at)
+        os.replace(tmp, os.path.join(self.dir, name))
+
+        pointer = {"version": version, "file": name, "fetchedAt": fetched_at, "rows": len(records),
+                   "format": MAGIC.decode()}
+        tmp = f"{self._pointer}.{os.getpid()}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(pointer, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self._pointer)
+        self._prune()
+        return pointer
+
+    def open(self, pointer: Dict[str, Any]) -> MappedUniverse:
+        return MappedUniverse(os.path.join(self.dir, pointer["file"]))
+
+    def _prune(self):
+        snaps = sorted(f for f in os.listdir(self.dir) if f.startswith("universe-") and f.endswith(".snap"))
+        for f in snaps[:-self.keep]:
+            try:
+                os.unlink(os.path.join(self.dir, f))
+            except FileNotFoundError:
+                pass
+
+    @asynccontextmanager
+    async def leader(self, timeout: float = SHARED_LOCK_TIMEOUT):
+        """Hold the refresh lock: at most one worker fetches upstream at a time."""
+        deadline = time.monotonic() + timeout
+        while not self._refresh_lock.try_acquire():
+            if time.monotonic() >= deadline:
+                raise TimeoutError("timed out waiting for the shared snapshot refresh lock")
+            await asyncio.sleep(0.05)
+        try:
+            yield
+        finally:
+            self._refresh_lock.release()
+
+def open_shared_store() -> Optional[SharedSnapshotStore]:
+    return SharedSnapshotStore(SHARED_SNAPSHOT_DIR) if SHARED_SNAPSHOT_DIR else None
@@ -0,0 +1,240 @@
+# sweep.py
+from typing import Annotated, Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import APIRouter, Body, HTTPException
+from pydantic import BaseModel, Field
+
+from deadlines import check as check_deadline
+from defillama import (
+    CHAIN_DEFAULT,
+    HORIZON_MONTHS_MAX,
+    MCDA_WEIGHTS,
+    POOL_STYLES,
+    RISK_CATEGORY_BIAS,
+    RISK_PRESETS,
+    TVL_RELAX_LEVELS,
+    annotate_profit,
+    diversify,
+    load_candidates,
+    pool_inputs,
+    score_pool,
+    tvl_floor,
+)
+from resilience import flag_stale
+from tracing import span
+
+router = APIRouter(prefix="", tags=["defillama"])
+
+MAX_SWEEP_AMOUNTS = 10
+MAX_SWEEP_HORIZONS = 12
+TOPSIS_CRIT = [  # (column, MCDA_WEIGHTS key, benefit?)
+    ("periodReturnPct", "periodReturnPct", True),
+    ("tvlUsd", "tvlUsd", True),
+    ("throughput", "throughput", True),
+    ("conf", "conf", True),
+    ("downsidePeriod", "downsidePeriod", False),
+    ("ilPenaltyPctPts", "ilPenaltyPctPts", False),
+]
+
+# ============================================================
+# Pool features (horizon/risk independent parts of _score_pool)
+# ============================================================
+class PoolFeatures:
+    def __init__(self, pools: List[Dict[str, Any]]):
+        self.pools = pools
+        inputs = [pool_inputs(p) for p in pools]
+        col = lambda k: np.array([x[k] for x in inputs], dtype=float)  # noqa: E731
+        self.tvl = col("tvl")
+        vol7d = col("volume7d")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            thr = np.where((self.tvl > 0) & (vol7d > 0), vol7d / (self.tvl * 7.0), 0.0)
+        self.throughput = np.clip(thr, 0.0, 1.0)
+        self.conf = col("conf")
+
+        apy = col("apy")
+        apy30 = col("apyMean30d")
+        apy7 = col("apyPct7D")
+        reward = col("apyReward")
+        apy_fwd = 0.5 * apy + 0.3 * apy30 + 0.2 * (apy * (1.0 + apy7 / 100.0))
+        haircut = np.where(reward > 0, reward * (0.4 * self.throughput + 0.6 * self.conf), 0.0)
+        self.apy_now = apy
+        self.apy_adj = apy_fwd - reward + haircut
+
+        self.multi = np.array([x["exposure"] != "single" for x in inputs], dtype=bool)
+        self.has_il = np.array([x["exposure"] != "single" and x["ilRisk"] != "no" for x in inputs], dtype=bool)
+
+        sig = [x["annualVol"] for x in inputs]
+        self.has_sigma = np.array([x is not None for x in sig], dtype=bool)
+        self.sigma = np.array([x or 0.0 for x in sig], dtype=float)
+        self.sigma_monthly = col("monthlyVol")
+
+        self.tvl_score = np.clip(np.where(self.tvl > 0, np.log10(np.where(self.tvl > 0, self.tvl, 1.0)) / 10.0, 0.0), 0.0, 1.0)
+        self.style = np.array([POOL_STYLES.index(x["style"]) for x in inputs], dtype=np.int64)
+        self.project = [x["project"] for x in inputs]
+
+# ============================================================
+# Grid scoring + TOPSIS, broadcast over (risk, horizon, pool)
+# ============================================================
+def _sweep_rank(feat: PoolFeatures, horizons: List[int], risks: List[str], topN: int) -> List[List[Dict[str, Any]]]:
+    """
+    Returns picks[r][h] = {"rows": [pool index...], "topsis": [...], "tvlFloor": float},
+    matching _rank_chain_slice(...) for every (risk, horizon) of the grid.
+    """
+    n = feat.tvl.size
+    R = len(risks)
+    rp = [RISK_PRESETS[r] for r in risks]
+    h = np.asarray(horizons, dtype=float)[None, :, None]             # (1, H, 1)
+    hm = np.maximum(1.0, h)
+
+    il_mult = np.array([p["il_mult"] for p in rp])[:, None, None]      # (R, 1, 1)
+    vol_floor = np.array([p["vol_floor"] for p in rp])[:, None, None]
+    il_pen = np.where(feat.has_il, il_mult * 0.5 * feat.sigma_monthly ** 2 * h * 100.0, 0.0)   # (R, H, N)
+    apy_net = feat.apy_adj - il_pen
+    period_return = (1.0 + apy_net / 100.0 / 12.0) ** hm - 1.0
+
+    downside_annual = np.maximum(vol_floor, np.where(feat.has_sigma, feat.sigma, vol_floor))   # (R, 1, N)
+    downside_period = downside_annual * (hm / 12.0) ** 0.5                                     # (R, H, N)
+
+    exp_bias = np.array([{"conservative": -0.05, "aggressive": 0.02}.get(r, 0.0) for r in risks])[:, None, None]
+    style_bias = np.array([[RISK_CATEGORY_BIAS.get(r, {}).get(s, 0.0) for s in POOL_STYLES] for r in risks])
+    rar = period_return / np.maximum(1e-6, downside_period)
+    w = lambda k: np.array([p[k] for p in rp])[:, None, None]  # noqa: E731
+    with np.errstate(over="ignore"):
+        sig_ret = 1.0 / (1.0 + np.exp(np.minimum(-(period_return * 100.0) / 5.0, 700.0)))
+    score = 100.0 * (w("w_return") * sig_ret + w("w_throughput") * feat.throughput
+                     + w("w_tvl") * feat.tvl_score + w("w_conf") * feat.conf)
+    score = score + 100.0 * np.where(feat.multi, exp_bias, 0.0) + 100.0 * style_bias[:, feat.style][:, None, :]
+
+    # the same rounding _score_pool applies before TOPSIS sees the rows
+    cols = {
+        "periodReturnPct": np.round(period_return * 100.0, 4),
+        "tvlUsd": np.broadcast_to(feat.tvl, (1, 1, n)),
+        "throughput": np.broadcast_to(np.round(feat.throughput, 6), (1, 1, n)),
+        "conf": np.broadcast_to(np.round(feat.conf, 6), (1, 1, n)),
+        "downsidePeriod": np.round(downside_period, 6),
+        "ilPenaltyPctPts": np.round(il_pen, 3),
+    }
+    score = np.round(score, 2)
+    rar = np.round(rar, 4)
+
+    # candidate set per risk: first relax level with >= topN pools over the floor
+    floors = np.zeros(R)
+    for i, risk in enumerate(risks):
+        for relax in range(TVL_RELAX_LEVELS):
+            floors[i] = tvl_floor(risk, relax)
+            if int((feat.tvl >= floors[i]).sum()) >= topN:
+                break
+    mask = (feat.tvl[None, :] >= floors[:, None])[:, None, :]                                 # (R, 1, N)
+
+    shape = np.broadcast_shapes(period_return.shape, mask.shape)
+    d_plus = np.zeros(shape)
+    d_minus = np.zeros(shape)
+    for col, wkey, benefit in TOPSIS_CRIT:
+        weights = np.array([MCDA_WEIGHTS[r][wkey] / sum(MCDA_WEIGHTS[r].values()) for r in risks])[:, None, None]
+        v = np.broadcast_to(cols[col], shape)
+        norm = np.sqrt(np.where(mask, v ** 2, 0.0).sum(axis=-1, keepdims=True))
+        wn = v / np.where(norm > 0, norm, 1.0) * weights
+        hi = np.where(mask, wn, -np.inf).max(axis=-1, keepdims=True)
+        lo = np.where(mask, wn, np.inf).min(axis=-1, keepdims=True)
+        best, worst = (hi, lo) if benefit else (lo, hi)
+        d_plus += (wn - best) ** 2
+        d_minus += (wn - worst) ** 2
+    d_plus, d_minus = np.sqrt(d_plus), np.sqrt(d_minus)
+    denom = d_plus + d_minus
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cc = np.round(np.where(denom > 0, d_minus / denom, 0.5), 6)
+
+    # _topsis_rank order: -topsis, -Score, -RAR, -periodReturnPct (stable); non-candidates last
+    out_of_set = ~np.broadcast_to(mask, shape)
+    big = np.inf
+    keys = (
+        np.where(out_of_set, big, -np.broadcast_to(cols["periodReturnPct"], shape)),
+        np.where(out_of_set, big, -np.broadcast_to(rar, shape)),
+        np.where(out_of_set, big, -np.broadcast_to(score, shape)),
+        np.where(out_of_set, big, -cc),
+        out_of_set,
+    )
+    order = np.lexsort(keys, axis=-1)
+
+    picks: List[List[Dict[str, Any]]] = []
+    for ri in range(R):
+        n_cand = int(mask[ri, 0].sum())
+        per_h = []
+        for hi_ in range(len(horizons)):
+            ranked = order[ri, hi_, :n_cand]
+            rows = [{"_i": int(i), "project": feat.project[int(i)]} for i in ranked]
+            chosen = [r["_i"] for r in diversify(rows, topN)]
+            per_h.append({
+                "rows": chosen,
+                "topsis": [float(cc[ri, hi_, i]) for i in chosen],
+                "tvlFloor": float(floors[ri]),
+            })
+        picks.append(per_h)
+    return picks
+
+# ============================================================
+# Route
+# ============================================================
+class SweepRequest(BaseModel):
+    amountAvax: List[float] = Field(..., min_length=1, max_length=MAX_SWEEP_AMOUNTS)
+    horizonMonths: List[Annotated[int, Field(ge=1, le=HORIZON_MONTHS_MAX)]] = Field(..., min_length=1, max_length=MAX_SWEEP_HORIZONS)
+    riskTolerance: List[str] = Field(["conservative", "moderate", "aggressive"], min_length=1, max_length=3)
+    chain: str = CHAIN_DEFAULT
+    project: Optional[str] = None
+    limitFetch: int = Field(600, ge=50, le=2000)
+    topN: int = Field(2, ge=1, le=5)
+
+@router.post("/recommend/sweep", summary="Evaluate /recommend over an amount × horizon × risk grid in one pass")
+async def recommend_sweep(req: SweepRequest = Body(...)):
+    risks = [r.lower() for r in req.riskTolerance]
+    bad = [r for r in risks if r not in RISK_PRESETS]
+    if bad:
+        raise HTTPException(status_code=400, detail="riskTolerance must be conservative|moderate|aggressive")
+    if any(a <= 0 for a in req.amountAvax):
+        raise HTTPException(status_code=400, detail="amountAvax values must be > 0")
+    chain = req.chain.strip().lower()
+
+    pools_all, native_prices = await load_candidates(chain, req.project, req.limitFetch)
+    check_deadline("ranking")     # CPU work nobody will wait for is not started
+    with span("features"):
+        feat = PoolFeatures(pools_all)
+    with span("rank"):
+        picks = _sweep_rank(feat, req.horizonMonths, risks, req.topN) if pools_all else None
+
+    # ranking is amount-independent; only the chosen rows are materialised per amount
+    grid: List[Dict[str, Any]] = []
+    with span("score"):
+        for ri, risk in enumerate(risks):
+            for hi, horizon in enumerate(req.horizonMonths):
+                pick = picks[ri][hi] if picks else {"rows": [], "topsis": [], "tvlFloor": 0.0}
+                for amount in req.amountAvax:
+                    rows = []
+                    for i, cc in zip(pick["rows"], pick["topsis"]):
+                        row = score_pool(pools_all[i], amount, horizon, risk, chain)
+                        row["topsisScore"] = cc
+                        row["tvlFloorApplied"] = pick["tvlFloor"]
+                        rows.append(row)
+                    annotate_profit(rows, native_prices)
+                    grid.append({
+                        "amountAvax": amount,
+                        "horizonMonths": horizon,
+                        "riskTolerance": risk,
+                        "tvlFloorUsed": pick["tvlFloor"],
+                        "topN": rows,
+                    })
+
+    return flag_stale({
+        "inputs": {
+            "amountAvax": req.amountAvax,
+            "horizonMonths": req.horizonMonths,
+            "riskTolerance": risks,
+            "chain": chain,
+            "project": req.project,
+            "limitFetch": req.limitFetch,
+            "topN": req.topN,
+        },
+        "universeCount": len(pools_all),
+        "cells": len(grid),
+        "grid": grid,
+    })
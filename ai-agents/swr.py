@@ -0,0 +1,167 @@
+# swr.py
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from cache_backend import CacheBackend
+from deadlines import Flight, budget, detached
+from metrics import CACHE_REVALIDATIONS, CACHE_SWR
+from ratelimit import background
+from resilience import mark_stale
+
+PREWARM_INTERVAL = float(os.getenv("PREWARM_INTERVAL", "5"))      # seconds between pre-warm passes
+PREWARM_AHEAD = float(os.getenv("PREWARM_AHEAD", "0.75"))         # refresh hot keys at this fraction of their soft TTL
+PREWARM_MIN_HITS = int(os.getenv("PREWARM_MIN_HITS", "2"))        # reads since the last pass that make a key hot
+PREWARM_MAX_KEYS = int(os.getenv("PREWARM_MAX_KEYS", "512"))      # loaders remembered for pre-warming (LRU)
+
+Loader = Callable[[], Awaitable[Any]]
+
+# ============================================================
+# Stale-while-revalidate over a CacheBackend
+#   age < soft_ttl          -> cached value
+#   soft_ttl <= age < hard  -> cached value now, one background refresh
+#   missing / past hard     -> the caller awaits the (single-flight) load,
+#                              within its deadline budget
+#   Entries are written with the hard TTL as their expiry. A failed
+#   background refresh keeps serving the stale value until hard expiry.
+#   With a `last_good` backend every loaded value is also kept there
+#   without expiry; a failed load then falls back to it (marked stale on
+#   the request) instead of raising.
+# ============================================================
+class SWRCache:
+    def __init__(self, backend: CacheBackend, last_good: Optional[CacheBackend] = None):
+        self.backend = backend
+        self.last_good = last_good
+        self._inflight: Dict[str, Flight] = {}
+        # key -> [loader, soft_ttl, hard_ttl, reads since last pre-warm pass]
+        self._known: "OrderedDict[str, List[Any]]" = OrderedDict()
+        ns = backend.namespace
+        self._fresh = CACHE_SWR.labels(ns, "fresh")
+        self._stale = CACHE_SWR.labels(ns, "stale")
+        self._miss = CACHE_SWR.labels(ns, "miss")
+
+    def _remember(self, key: str, loader: Loader, soft_ttl: float, hard_ttl: float):
+        row = self._known.get(key)
+        if row is None:
+            row = self._known[key] = [loader, soft_ttl, hard_ttl, 0]
+            while len(self._known) > PREWARM_MAX_KEYS:
+                self._known.popitem(last=False)
+        else:
+            row[0] = loader
+        row[3] += 1
+        self._known.move_to_end(key)
+
+    async def _load(self, key: str, loader: Loader, hard_ttl: float) -> Any:
+        value = await loader()
+        self.backend.set(key, value, ttl=hard_ttl)
+        if self.last_good is not None:
+            self.last_good.set(key, value)
+        return value
+
+    def _start(self, key: str, loader: Loader, hard_ttl: float, trigger: Optional[str]) -> Flight:
+        flight = self._inflight.get(key)
+        if flight is None or not flight.joinable():
+            loop = asyncio.get_running_loop()
+            with detached():
+                if trigger is None:
+                    task = loop.create_task(self._load(key, loader, hard_ttl))
+                else:
+                    # nobody waits on a revalidation: it queues behind request traffic and runs to the end
+                    with background(f"swr:{self.backend.namespace}"):
+                        task = loop.create_task(self._load(key, loader, hard_ttl))
+            flight = self._inflight[key] = Flight(task, f"cache:{self.backend.namespace}", keep=trigger is not None)
+            task.add_done_callback(lambda t: self._finished(key, flight, trigger))
+        return flight
+
+    def _finished(self, key: str, flight: Flight, trigger: Optional[str]):
+        task = flight.task
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        err = task.exception()     # always retrieved, so background failures never go unobserved
+        if trigger is not None:
+            CACHE_REVALIDATIONS.labels(self.backend.namespace, trigger, "error" if err else "ok").inc()
+            if err is not None:
+                print(f"[swr] {trigger} refresh of {key} failed: {err!r}")
+
+    async def get(self, key: str, loader: Loader, soft_ttl: float, hard_ttl: float, source: Optional[str] = None) -> Any:
+        """`source` names the data in stale markers (default: the cache namespace)."""
+        self._remember(key, loader, soft_ttl, hard_ttl)
+        hit, value, age = self.backend.get_aged(key)
+        if hit and age < hard_ttl:
+            if age < soft_ttl:
+                self._fresh.inc()
+            else:
+                self._stale.inc()
+                self._start(key, loader, hard_ttl, "stale")
+            return value
+        self._miss.inc()
+        try:
+            return await self._start(key, loader, hard_ttl, None).join(budget())
+        except Exception:
+            if self.last_good is None:
+                raise
+            hit, value, age = self.last_good.get_aged(key)
+            if not hit:
+                raise
+            mark_stale(source or self.backend.namespace, age)
+            return value
+
+    def set(self, key: str, value: Any, hard_ttl: float):
+        self.backend.set(key, value, ttl=hard_ttl)
+
+    async def prewarm(self):
+        """Refresh keys read at least PREWARM_MIN_HITS times since the last pass that are near their soft TTL."""
+        due: List[Tuple[str, Loader, float]] = []
+        for key, row in list(self._known.items()):
+            loader, soft_ttl, hard_ttl, reads = row
+            row[3] = 0
+            if reads < PREWARM_MIN_HITS or key in self._inflight:
+                continue
+            hit, _, age = self.backend.get_aged(key)
+            if not hit or age >= soft_ttl * PREWARM_AHEAD:
+                due.append((key, loader, hard_ttl))
+        if due:
+            await asyncio.gather(*(self._start(k, ld, h, "prewarm").task for k, ld, h in due), return_exceptions=True)
+
+# ============================================================
+# Pre-warmer: runs registered jobs every PREWARM_INTERVAL seconds
+# ============================================================
+class Prewarmer:
+    def __init__(self, interval: float = PREWARM_INTERVAL):
+        self.interval = interval
+        self._jobs: List[Tuple[str, Loader]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, job: Loader):
+        self._jobs.append((name, job))
+
+    async def run_once(self):
+        for name, job in self._jobs:
+            try:
+                with background(f"prewarm:{name}"):
+                    await job()
+            except Exception as e:
+                print(f"[prewarm] {name} failed: {e!r}")
+
+    async def _loop(self):
+        while True:
+            t0 = time.monotonic()
+            await self.run_once()
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - t0)))
+
+    def start(self):
+        if self.interval > 0 and self._task is None and self._jobs:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,238 @@
+# tracing.py
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))             # 0 = profiler off
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_WINDOW_S = float(os.getenv("PROFILE_WINDOW_S", "60"))          # sample history kept; longer requests are truncated
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_COOLDOWN_S = float(os.getenv("PROFILE_COOLDOWN_S", "10"))      # min gap between two dumps
+
+# ============================================================
+# Spans
+#   with span("pools"): ...   records the stage duration on the current
+#   request (a ContextVar, so tasks spawned by the handler share it).
+#   Outside a request, or in rank worker processes, span() is a no-op.
+#   Repeated names are summed and counted.
+# ============================================================
+_timings: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("server_timing", default=None)
+
+class _Span:
+    __slots__ = ("_name", "_acc", "_t0")
+
+    def __init__(self, name: str, acc: Dict[str, List[float]]):
+        self._name = name
+        self._acc = acc
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        row = self._acc.get(self._name)
+        if row is None:
+            row = self._acc[self._name] = [0.0, 0]
+        row[0] += time.perf_counter() - self._t0
+        row[1] += 1
+        return False
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def span(name: str):
+    acc = _timings.get()
+    return _NO_SPAN if acc is None else _Span(name, acc)
+
+def record(name: str, seconds: float):
+    """Add a duration measured elsewhere (e.g. already timed for a metric)."""
+    acc = _timings.get()
+    if acc is not None:
+        row = acc.setdefault(name, [0.0, 0])
+        row[0] += seconds
+        row[1] += 1
+
+def _header_value(acc: Dict[str, List[float]], total_s: float) -> str:
+    parts = []
+    for name, (secs, n) in acc.items():
+        parts.append(f"{name};dur={secs * 1000.0:.1f}" + (f';desc="x{n}"' if n > 1 else ""))
+    parts.append(f"total;dur={total_s * 1000.0:.1f}")
+    return ", ".join(parts)
+
+# ============================================================
+# Slow-request profiler (opt-in: PROFILE_SLOW_MS > 0)
+#   A daemon thread samples the event-loop thread's Python stack every
+#   PROFILE_INTERVAL_MS while any request is in flight. When a request
+#   finishes over the threshold, the samples taken during it are folded
+#   (root;...;leaf count, the flamegraph/speedscope input format) and
+#   written to PROFILE_DIR with the request's Server-Timing breakdown.
+#   The loop is shared, so a profile also shows whatever concurrent
+#   requests ran meanwhile; time spent awaiting I/O shows up as the
+#   loop's selector wait.
+# ============================================================
+class SlowRequestProfiler:
+    def __init__(self, threshold_ms: float, interval_ms: float = PROFILE_INTERVAL_MS,
+                 out_dir: str = PROFILE_DIR, window_s: float = PROFILE_WINDOW_S):
+        self.threshold_s = threshold_ms / 1000.0
+        self.interval_s = max(0.001, interval_ms / 1000.0)
+        self.out_dir = out_dir
+        self._samples: Deque[Tuple[float, Tuple[str, ...]]] = deque(maxlen=max(1, int(window_s / self.interval_s)))
+        self._lock = threading.Lock()
+        self._labels: Dict[Any, str] = {}
+        self._active = 0
+        self._last_dump = 0.0
+        self._target: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        # called on the event-loop thread (startup hook): that's the thread we sample
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            if self._active <= 0:
+                continue
+            frame = sys._current_frames().get(self._target)
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            with self._lock:
+                self._samples.append((time.perf_counter(), tuple(stack)))
+
+    def begin(self):
+        self._active += 1
+
+    def end(self, t0: float, t1: float) -> Optional[Counter]:
+        """Folded samples for [t0, t1] if the request was slow and a dump is due, else None."""
+        self._active -= 1
+        if t1 - t0 < self.threshold_s or t1 - self._last_dump < PROFILE_COOLDOWN_S:
+            return None
+        self._last_dump = t1
+        with self._lock:
+            window = [stack for ts, stack in self._samples if t0 <= ts <= t1]
+        return Counter(";".join(s) for s in window)
+
+    def write(self, meta: Dict[str, Any], folded: Counter) -> str:
+        os.makedirs(self.out_dir, exist_ok=True)
+        ts = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-%f")
+        slug = "".join(c if c.isalnum() else "_" for c in meta["route"]).strip("_") or "root"
+        path = os.path.join(self.out_dir, f"{ts}-{slug}-{int(meta['durationMs'])}ms.json")
+        body = {
+            **meta,
+            "intervalMs": self.interval_s * 1000.0,
+            "samples": sum(folded.values()),
+            "folded": [f"{stack} {n}" for stack, n in folded.most_common()],
+        }
+        with open(path, "w") as fh:
+            json.dump(body, fh, indent=1)
+        self._prune()
+        return path
+
+    def _prune(self):
+        files = sorted(f for f in os.listdir(self.out_dir) if f.endswith(".json"))
+        for f in files[:max(0, len(files) - PROFILE_MAX_FILES)]:
+            try:
+                os.remove(os.path.join(self.out_dir, f))
+            except OSError:
+                pass
+
+profiler: Optional[SlowRequestProfiler] = SlowRequestProfiler(PROFILE_SLOW_MS) if PROFILE_SLOW_MS > 0 else None
+
+def start_profiler():
+    if profiler is not None:
+        profiler.start()
+        print(f"[startup] slow-request profiler on: >= {PROFILE_SLOW_MS:.0f} ms -> {PROFILE_DIR}/")
+
+def stop_profiler():
+    if profiler is not None:
+        profiler.stop()
+
+# ============================================================
+# ASGI middleware: Server-Timing header + profiler bookkeeping
+#   The header goes out with the response start, so it covers every
+#   stage of buffered responses and the stages before the first byte of
+#   streamed ones.
+# ============================================================
+class ServerTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (SERVER_TIMING_ENABLED or profiler is not None):
+            await self.app(scope, receive, send)
+            return
+        acc: Dict[str, List[float]] = {}
+        token = _timings.set(acc)
+        t0 = time.perf_counter()
+        status = [500]
+        if profiler is not None:
+            profiler.begin()
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _header_value(acc, time.perf_counter() - t0).encode("latin-1")))
+                    headers.append((b"timing-allow-origin", b"*"))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _timings.reset(token)
+            if profiler is not None:
+                t1 = time.perf_counter()
+                folded = profiler.end(t0, t1)
+                if folded is not None:
+                    route = scope.get("route")
+                    meta = {
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "query": scope.get("query_string", b"").decode("latin-1"),
+                        "route": getattr(route, "path", "<unmatched>"),
+                        "status": status[0],
+                        "durationMs": round((t1 - t0) * 1000.0, 1),
+                        "serverTiming": {k: {"ms": round(v[0] * 1000.0, 2), "count": v[1]} for k, v in acc.items()},
+                    }
+                    try:
+                        path = await asyncio.to_thread(profiler.write, meta, folded)
+                        print(f"[profile] {meta['method']} {meta['path']} {meta['durationMs']} ms -> {path}")
+                    except Exception as e:
+                        print(f"[profile] write failed: {e}")
@@ -0,0 +1,519 @@
+# universe.py
+import os
+import re
+import time
+import asyncio
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from deadlines import Flight, budget, detached
+from ratelimit import background
+from resilience import mark_stale
+from shared_snapshot import SHARED_POLL_SECS, MappedPools, MappedUniverse, SharedSnapshotStore
+
+UNIVERSE_TTL = int(os.getenv("UNIVERSE_TTL", "300"))
+UNIVERSE_STALE_TTL = int(os.getenv("UNIVERSE_STALE_TTL", "1800"))   # past TTL, serve the old snapshot while refreshing
+SEARCH_FUZZY_MIN_LEN = int(os.getenv("SEARCH_FUZZY_MIN_LEN", "4"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9.]+")
+
+def _f(x: Any) -> float:
+    try:
+        return float(x) if x is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+# public sort key -> PoolColumns attribute
+SORT_COLUMNS = {"tvlUsd": "tvl", "apy": "apy", "apyMean30d": "apy_mean30d"}
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    'WAVAX-USDC' / 'WAVAX/USDC' -> ['wavax', 'usdc'];  'trader-joe' -> ['trader', 'joe'].
+    """
+    if not text:
+        return []
+    return _TOKEN_RE.findall(str(text).lower())
+
+# ============================================================
+# Columnar store
+#   Row-aligned numpy arrays for the fields we filter/sort on,
+#   next to the original pool dicts (row i <-> pools[i]).
+# ============================================================
+class PoolColumns:
+    def __init__(self, pools: List[Dict[str, Any]]):
+        self.pools = pools
+        self.ids: List[Optional[str]] = [p.get("pool") for p in pools]
+        self.row_of: Dict[str, int] = {pid: i for i, pid in enumerate(self.ids) if pid}
+        self.chain = np.array([(p.get("chain") or "").lower() for p in pools], dtype=object)
+        self.project = np.array([(p.get("project") or "").lower() for p in pools], dtype=object)
+        self.tvl = np.array([_f(p.get("tvlUsd")) for p in pools], dtype=float)
+        self.apy = np.array([_f(p.get("apy")) for p in pools], dtype=float)
+        self.apy_mean30d = np.array([_f(p.get("apyMean30d")) for p in pools], dtype=float)
+        self._orders: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    def from_mapped(cls, mapped: MappedUniverse) -> "PoolColumns":
+        """Columns straight from a mapped snapshot file (no per-row records)."""
+        cols = cls.__new__(cls)
+        cols.pools = MappedPools(mapped)
+        cols.ids = mapped.strings("pool")
+        cols.row_of = {pid: i for i, pid in enumerate(cols.ids) if pid}
+        cols.chain = np.array([(c or "").lower() for c in mapped.strings("chain")], dtype=object)
+        cols.project = np.array([(p or "").lower() for p in mapped.strings("project")], dtype=object)
+        cols.tvl = mapped.numbers("tvlUsd")
+        cols.apy = mapped.numbers("apy")
+        cols.apy_mean30d = mapped.numbers("apyMean30d")
+        cols._orders = {}
+        return cols
+
+    def __len__(self) -> int:
+        return len(self.pools)
+
+    def mask(self, chain: Optional[str] = None, project: Optional[str] = None) -> np.ndarray:
+        m = np.ones(len(self.pools), dtype=bool)
+        if chain:
+            m &= self.chain == chain.lower()
+        if project:
+            m &= self.project == project.lower()
+        return m
+
+    def group_by_chain(self, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        """Split row ids by chain in one pass (row order preserved inside each group)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size == 0:
+            return {}
+        keys = self.chain[rows]
+        order = np.argsort(keys, kind="stable")
+        uniq, starts = np.unique(keys[order], return_index=True)
+        bounds = list(starts[1:]) + [rows.size]
+        return {str(c): rows[order[a:b]] for c, a, b in zip(uniq, starts, bounds)}
+
+    def by_tvl(self, rows: np.ndarray) -> np.ndarray:
+        """Row ids sorted by TVL descending (stable on ties)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return rows[np.argsort(-self.tvl[rows], kind="stable")]
+
+    def argmax_tvl(self, rows: np.ndarray) -> Optional[int]:
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size == 0:
+            return None
+        return int(rows[np.argmax(self.tvl[rows])])
+
+    def take(self, rows: Iterable[int]) -> List[Dict[str, Any]]:
+        return [self.pools[int(i)] for i in rows]
+
+    # ---------------- keyset pagination ----------------
+    def _order(self, field: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Whole-universe order for `field` (value desc, pool id asc), computed once per
+        snapshot: (rank of each row, sorted values, sorted ids, values column).
+        """
+        cached = self._orders.get(field)
+        if cached is None:
+            vals = getattr(self, SORT_COLUMNS[field])
+            ids = np.array([pid or "" for pid in self.ids], dtype=object)
+            order = np.lexsort((ids, -vals))
+            rank = np.empty(order.size, dtype=np.int64)
+            rank[order] = np.arange(order.size)
+            cached = self._orders[field] = (rank, vals[order], ids[order], vals)
+        return cached
+
+    def sort_key(self, field: str, row: int) -> Tuple[float, str]:
+        return float(getattr(self, SORT_COLUMNS[field])[row]), self.ids[row] or ""
+
+    def page(self, rows: np.ndarray, field: str, descending: bool = True,
+             after: Optional[Tuple[float, str]] = None, limit: int = 10) -> Tuple[np.ndarray, bool]:
+        """
+        Next `limit` of `rows` in (field, pool id) order strictly after the `after` key.
+        Only the page is sorted; the key need not exist in this snapshot.
+        """
+        rank, svals, sids, _ = self._order(field)
+        rows = np.asarray(rows, dtype=np.int64)
+        r = rank[rows]
+        if after is not None:
+            val, pid = after
+            neg = -svals
+            lo = int(np.searchsorted(neg, -val, side="left"))
+            hi = int(np.searchsorted(neg, -val, side="right"))
+            ties = sids[lo:hi]
+            if descending:
+                keep = r >= lo + int(np.searchsorted(ties, pid, side="right"))
+            else:
+                keep = r < lo + int(np.searchsorted(ties, pid, side="left"))
+            rows, r = rows[keep], r[keep]
+        more = rows.size > limit
+        if more:
+            part = np.argpartition(r if descending else -r, limit - 1)[:limit]
+            rows, r = rows[part], r[part]
+        return rows[np.argsort(r if descending else -r)], more
+
+# ============================================================
+# Inverted index (symbol parts, project, poolMeta)
+#   exact -> prefix -> fuzzy (edit distance 1), best non-empty tier per token;
+#   query tokens are AND-ed.
+# ============================================================
+def _deletes(token: str) -> Set[str]:
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+class PoolSearchIndex:
+    def __init__(self, pools: List[Dict[str, Any]]):
+        postings: Dict[str, Set[int]] = {}
+        for i, p in enumerate(pools):
+            toks = set(tokenize(p.get("symbol")))
+            toks.update(tokenize(p.get("poolMeta")))
+            proj = (p.get("project") or "").lower()
+            if proj:
+                toks.add(proj)
+                toks.update(tokenize(proj))
+            for t in toks:
+                postings.setdefault(t, set()).add(i)
+
+        self.postings: Dict[str, np.ndarray] = {
+            t: np.fromiter(sorted(rows), dtype=np.int64, count=len(rows)) for t, rows in postings.items()
+        }
+        self.vocab: List[str] = sorted(self.postings)
+
+        # symmetric-delete map for distance-1 fuzzy lookups
+        self._del: Dict[str, Set[str]] = {}
+        for t in self.vocab:
+            if len(t) < SEARCH_FUZZY_MIN_LEN:
+                continue
+            for d in _deletes(t):
+                self._del.setdefault(d, set()).add(t)
+
+    def _prefix_terms(self, tok: str) -> List[str]:
+        out = []
+        i = bisect_left(self.vocab, tok)
+        while i < len(self.vocab) and self.vocab[i].startswith(tok):
+            out.append(self.vocab[i])
+            i += 1
+        return out
+
+    def _fuzzy_terms(self, tok: str) -> Set[str]:
+        if len(tok) < SEARCH_FUZZY_MIN_LEN:
+            return set()
+        cands = set(self._del.get(tok, ()))
+        for d in _deletes(tok):
+            if d in self.postings:
+                cands.add(d)
+            cands.update(self._del.get(d, ()))
+        return {c for c in cands if _within_one_edit(tok, c)}
+
+    def _union(self, terms: Iterable[str]) -> np.ndarray:
+        arrs = [self.postings[t] for t in terms if t in self.postings]
+        if not arrs:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(arrs))
+
+    def lookup(self, tok: str) -> np.ndarray:
+        if tok in self.postings:
+            return self.postings[tok]
+        rows = self._union(self._prefix_terms(tok))
+        if rows.size:
+            return rows
+        return self._union(self._fuzzy_terms(tok))
+
+    def search(self, query: Optional[str]) -> np.ndarray:
+        toks = tokenize(query)
+        if not toks:
+            return np.empty(0, dtype=np.int64)
+        rows: Optional[np.ndarray] = None
+        for tok in toks:
+            hit = self.lookup(tok)
+            rows = hit if rows is None else np.intersect1d(rows, hit, assume_unique=True)
+            if rows.size == 0:
+                break
+        return rows
+
+def _within_one_edit(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        return len(diff) == 1 or (
+            len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+        )
+    if la > lb:
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+# ============================================================
+# Cached universe (single-flight refresh)
+# ============================================================
+def dedupe_pools(pools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """One row per pool id (highest TVL wins); rows without an id are kept as-is."""
+    by_id: Dict[str, Dict[str, Any]] = {}
+    rest: List[Dict[str, Any]] = []
+    for p in pools:
+        pid = p.get("pool")
+        if not pid:
+            rest.append(p)
+            continue
+        cur = by_id.get(pid)
+        if cur is None or _f(p.get("tvlUsd")) > _f(cur.get("tvlUsd")):
+            by_id[pid] = p
+    return list(by_id.values()) + rest
+
+class PoolSnapshot:
+    def __init__(self, pools: List[Dict[str, Any]], version: int, columns: Optional[PoolColumns] = None,
+                 fetched_at: Optional[float] = None):
+        self.version = version
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.columns = columns if columns is not None else PoolColumns(dedupe_pools(pools))
+        self.index = PoolSearchIndex(self.columns.pools)
+
+    @classmethod
+    def from_mapped(cls, mapped: MappedUniverse) -> "PoolSnapshot":
+        return cls([], mapped.version, columns=PoolColumns.from_mapped(mapped), fetched_at=mapped.fetched_at)
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def select(self, chain: Optional[str] = None, project: Optional[str] = None,
+               search: Optional[str] = None) -> np.ndarray:
+        """Row ids matching chain/project and (if given) the search text."""
+        m = self.columns.mask(chain, project)
+        return self._with_search(m, search)
+
+    def select_chains(self, chains: List[str], project: Optional[str] = None,
+                      search: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """Row ids per chain for several chains, from a single pass over the columns."""
+        m = np.isin(self.columns.chain, [c.lower() for c in chains]) & self.columns.mask(None, project)
+        return self.columns.group_by_chain(self._with_search(m, search))
+
+    def _with_search(self, m: np.ndarray, search: Optional[str]) -> np.ndarray:
+        if search:
+            hit = np.zeros(len(self.columns), dtype=bool)
+            hit[self.index.search(search)] = True
+            m &= hit
+        return np.flatnonzero(m)
+
+# ============================================================
+# Snapshot deltas (by pool id, on the fields subscribers care about)
+# ============================================================
+class SnapshotDelta:
+    def __init__(self, added: Set[str], removed: Set[str], changed: Dict[str, Set[str]], full: bool = False):
+        self.added = added
+        self.removed = removed
+        self.changed = changed     # pool id -> names of fields that differ
+        self.full = full           # no previous snapshot: everything is new
+
+    def __len__(self) -> int:
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+    def summary(self) -> Dict[str, int]:
+        return {"added": len(self.added), "removed": len(self.removed), "changed": len(self.changed)}
+
+def diff_snapshots(old: Optional[PoolSnapshot], new: PoolSnapshot, fields: Iterable[str]) -> SnapshotDelta:
+    new_cols = new.columns
+    if old is None:
+        return SnapshotDelta(set(new_cols.row_of), set(), {}, full=True)
+    fields = list(fields)
+    old_cols = old.columns
+    added = set(new_cols.row_of) - set(old_cols.row_of)
+    removed = set(old_cols.row_of) - set(new_cols.row_of)
+    changed: Dict[str, Set[str]] = {}
+    for pid, i in new_cols.row_of.items():
+        j = old_cols.row_of.get(pid)
+        if j is None:
+            continue
+        a, b = old_cols.pools[j], new_cols.pools[i]
+        diff = {f for f in fields if a.get(f) != b.get(f)}
+        if diff:
+            changed[pid] = diff
+    return SnapshotDelta(added, removed, changed)
+
+SnapshotListener = Callable[[PoolSnapshot, SnapshotDelta], None]
+
+class PoolUniverse:
+    def __init__(self, fetcher: Callable[[], Awaitable[List[Dict[str, Any]]]], ttl: int = UNIVERSE_TTL,
+                 diff_fields: Iterable[str] = (), shared: Optional[SharedSnapshotStore] = None,
+                 stale_ttl: int = UNIVERSE_STALE_TTL):
+        self._fetcher = fetcher
+        self.ttl = ttl
+        self.stale_ttl = max(ttl, stale_ttl)
+        self.diff_fields = list(diff_fields)
+        self.shared = shared
+        self._snapshot: Optional[PoolSnapshot] = None
+        self._inflight: Optional[Flight] = None
+        self._version = 0
+        self._listeners: List[SnapshotListener] = []
+        self._polled_at = 0.0
+        self.last_delta: Optional[Dict[str, int]] = None
+
+    @property
+    def snapshot(self) -> Optional[PoolSnapshot]:
+        return self._snapshot
+
+    def subscribe(self, listener: SnapshotListener):
+        """`listener(snapshot, delta)` runs on every refresh, before the snapshot is published."""
+        self._listeners.append(listener)
+
+    async def _build_local(self) -> PoolSnapshot:
+        pools = await self._fetcher()
+        self._version += 1
+        return PoolSnapshot(pools, self._version)
+
+    def _adopt(self, pointer: Dict[str, Any]) -> PoolSnapshot:
+        snap = self._snapshot
+        if snap is not None and snap.version == pointer["version"]:
+            return snap
+        self._version = max(self._version, pointer["version"])
+        return PoolSnapshot.from_mapped(self.shared.open(pointer))
+
+    def _fresh(self, pointer: Optional[Dict[str, Any]]) -> bool:
+        return pointer is not None and time.time() - pointer["fetchedAt"] < self.ttl
+
+    async def _build_shared(self, force: bool) -> PoolSnapshot:
+        """
+        Cross-process single-flight: whoever takes the refresh lock fetches and
+        publishes; everyone else (and anyone queued on the lock) maps that file.
+        """
+        seen = self.shared.current()
+        if self._fresh(seen) and not force:
+            return self._adopt(seen)
+        try:
+            async with self.shared.leader():
+                cur = self.shared.current()
+                if cur is not None and (seen is None or cur["version"] != seen["version"]):
+                    return self._adopt(cur)     # another worker refreshed while we waited
+                if self._fresh(cur) and not force:
+                    return self._adopt(cur)
+                pools = dedupe_pools(await self._fetcher())
+                version = max(self._version, (cur or {}).get("version", 0)) + 1
+                cur = await asyncio.to_thread(self.shared.publish, pools, version)
+                del pools
+        except TimeoutError:
+            cur = self.shared.current()
+            if cur is None:
+                raise
+        return self._adopt(cur)
+
+    def _rewrite_shared(self, pointer: Dict[str, Any], transform: Callable[[List[Any]], Any]) -> Dict[str, Any]:
+        records = list(MappedPools(self.shared.open(pointer)))
+        transform(records)
+        version = max(self._version, pointer["version"]) + 1
+        # same fetchedAt: the upstream data is no newer, so TTLs keep counting from the real fetch
+        return self.shared.publish(records, version, fetched_at=pointer["fetchedAt"])
+
+    async def republish(self, transform: Callable[[List[Any]], Any]) -> Optional[PoolSnapshot]:
+        """
+        Shared mode: publish the current shared file again with `transform(records)` applied
+        (local fields such as history sigmas), under the refresh lock and without refetching
+        upstream. A refresh already in flight is waited for, not joined, so its result
+        cannot stand in for the republish. None if there is nothing published yet.
+        """
+        flight = self._inflight
+        if flight is not None and flight.joinable():
+            await asyncio.wait([flight.task])
+        try:
+            async with self.shared.leader():
+                cur = self.shared.current()
+                if cur is None:
+                    return None
+                cur = await asyncio.to_thread(self._rewrite_shared, cur, transform)
+        except TimeoutError as e:
+            print(f"[universe] republish skipped: {e}")
+            return None
+        return self._install(self._adopt(cur))
+
+    async def _refresh(self, force: bool = False) -> PoolSnapshot:
+        snap = await (self._build_shared(force) if self.shared is not None else self._build_local())
+        return self._install(snap)
+
+    def _install(self, snap: PoolSnapshot) -> PoolSnapshot:
+        cur = self._snapshot
+        if snap is cur or (cur is not None and snap.version < cur.version):
+            return cur      # a newer version went in while this one was being built
+        if self._listeners:
+            delta = diff_snapshots(self._snapshot, snap, self.diff_fields)
+            self.last_delta = delta.summary()
+            for listener in self._listeners:
+                try:
+                    listener(snap, delta)
+                except Exception as e:
+                    print(f"[universe] snapshot listener failed: {e}")
+        self._snapshot = snap
+        return snap
+
+    def _shared_moved(self, snap: PoolSnapshot) -> bool:
+        # cheap pointer read (at most every SHARED_POLL_SECS) to pick up other workers' publishes early
+        now = time.time()
+        if self.shared is None or now - self._polled_at < SHARED_POLL_SECS:
+            return False
+        self._polled_at = now
+        cur = self.shared.current()
+        return cur is not None and cur["version"] != snap.version
+
+    def _start_refresh(self, force: bool = False, in_background: bool = False) -> Flight:
+        # a refresh requests are waiting on is cancelled once they all give up; a background one runs on
+        if self._inflight is None or not self._inflight.joinable():
+            with detached():
+                if in_background:
+                    with background("universe"):
+                        task = asyncio.ensure_future(self._refresh(force))
+                else:
+                    task = asyncio.ensure_future(self._refresh(force))
+            task.add_done_callback(self._refresh_done)
+            self._inflight = Flight(task, "universe", keep=in_background)
+        return self._inflight
+
+    @staticmethod
+    def _refresh_done(task: asyncio.Future):
+        # background refreshes have no awaiter: surface their failure here
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[universe] refresh failed: {task.exception()!r}")
+
+    async def refresh(self, force: bool = False) -> PoolSnapshot:
+        """Refresh now (single-flight); `force` refetches upstream even if the shared file is fresh."""
+        if force and self._inflight is not None and self._inflight.joinable():
+            await asyncio.wait([self._inflight.task])   # an unforced refresh must not stand in for this one
+        return await self._start_refresh(force).join()
+
+    async def get(self) -> PoolSnapshot:
+        """
+        Fresh snapshot as is; past the TTL (but within stale_ttl) the current snapshot is
+        returned immediately and a refresh runs in the background. Only a cold start or a
+        snapshot past stale_ttl makes the caller wait for upstream (within its deadline
+        budget); if that refresh fails or takes too long,
+        the last good snapshot (in memory, else the last published shared file) is served
+        and marked stale.
+        """
+        snap = self._snapshot
+        if snap is not None and not self._shared_moved(snap):
+            age = snap.age()
+            if age < self.ttl:
+                return snap
+            if age < self.stale_ttl:
+                self._start_refresh(in_background=True)
+                return snap
+        try:
+            return await self._start_refresh().join(budget())
+        except Exception:
+            fallback = self._snapshot or self._last_published()
+            if fallback is None:
+                raise
+            mark_stale("pools", fallback.age())
+            return fallback
+
+    def _last_published(self) -> Optional[PoolSnapshot]:
+        if self.shared is None:
+            return None
+        cur = self.shared.current()
+        if cur is None:
+            return None
+        self._snapshot = self._adopt(cur)
+        return self._snapshot
+
+    def due(self, ahead: float = 1.0) -> bool:
+        """True if there's no snapshot yet or it has used `ahead` of its TTL (pre-warming)."""
+        snap = self._snapshot
+        return snap is None or snap.age() >= self.ttl * ahead
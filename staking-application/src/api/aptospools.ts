@@ -31,11 +31,20 @@ export interface AptosPool {
   volumeUsd1d: number | null;
   volumeUsd7d: number | null;
   apyBaseInception: number | null;
+  // added by the backend: pool category/link, and the std of daily APY from its pool history
+  category?: string | null;
+  url?: string | null;
+  timestamp?: string | null;
+  sigmaApy?: number | null;
 }
 
 export interface AptosPoolsResponse {
   count: number;
   results: AptosPool[];
+  sort?: string;
+  order?: 'asc' | 'desc';
+  version?: number;
+  nextCursor?: string | null;
 }
 
 const API_BASE_URL = 'https://fastapi-on-render-0s0u.onrender.com';